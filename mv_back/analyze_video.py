@@ -5,7 +5,9 @@ import os
 import logging
 import json
 import time
+import shutil
 import subprocess
+from cache_manager import cache_manager
 
 # Налаштування порогів
 FRAME_DIFF_THRESHOLD = 70  # Поріг для визначення зміни кадрів
@@ -37,14 +39,21 @@ def clear_analysis_cache(video_path=None):
         video_path (str, optional): Шлях до конкретного відеофайлу. Якщо None, видаляє кеш для всіх файлів.
     """
     if video_path:
-        cache_file = f"{video_path}.analysis.json"
-        if os.path.exists(cache_file):
-            os.remove(cache_file)
-            logging.info(f"Cache cleared for file: {cache_file}")
-        else:
-            logging.warning(f"No cache found for file: {cache_file}")
+        cache_file = cache_manager.artifact_path("analysis", video_path)
+        # Файли старого формату лежать поруч із відео
+        legacy_file = f"{video_path}.analysis.json"
+        removed = False
+        for path in (cache_file, legacy_file):
+            if path and os.path.exists(path):
+                cache_manager.remove([path])
+                removed = True
+                logging.info(f"Cache cleared for file: {path}")
+        if not removed:
+            logging.warning(f"No cache found for file: {video_path}")
     else:
-        cache_dir = os.getcwd()  # Або вказати папку, де зберігається кеш
+        freed = cache_manager.clear("analysis")
+        logging.info(f"Analysis cache cleared, {freed} bytes freed")
+        cache_dir = os.getcwd()  # Файли старого формату в робочій папці
         for file in os.listdir(cache_dir):
             if file.endswith(".analysis.json"):
                 os.remove(os.path.join(cache_dir, file))
@@ -148,16 +157,20 @@ def analyze_video(video_path):
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"File not found: {video_path}")
 
-    cache_file = f"{video_path}.analysis.json"
-    if os.path.exists(cache_file):
-        cache_timestamp = os.path.getmtime(cache_file)
-        video_timestamp = os.path.getmtime(video_path)
-        if cache_timestamp >= video_timestamp:
-            logging.info("Loading analysis results from cache.")
-            with open(cache_file, 'r') as f:
-                return json.load(f)
-        else:
-            logging.info("Cache is outdated. Reanalyzing...")
+    # Ключ кешу містить час зміни відео, тож змінене відео отримує новий файл
+    cache_file = cache_manager.artifact_path("analysis", video_path)
+    legacy_file = f"{video_path}.analysis.json"
+    if cache_file and not os.path.exists(cache_file) and os.path.exists(legacy_file) \
+            and os.path.getmtime(legacy_file) >= os.path.getmtime(video_path):
+        # Актуальний результат старого формату переноситься з диска з медіа в кеш
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        shutil.move(legacy_file, cache_file)
+        cache_manager.record("analysis", video_path, [cache_file])
+    if cache_file and os.path.exists(cache_file):
+        logging.info("Loading analysis results from cache.")
+        cache_manager.touch(cache_file)
+        with open(cache_file, 'r') as f:
+            return json.load(f)
 
     recommend_to_skip = []
 
@@ -229,12 +242,17 @@ def analyze_video(video_path):
         for interval in recommend_to_skip
     ]
 
-    # Збереження в кеш
+    # Збереження в кеш (шляху немає, якщо відео стало недоступним під час аналізу)
+    if cache_file is None:
+        logging.warning(f"Analysis results not cached, video is unavailable: {video_path}")
+        return formatted_recommendations
     try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
         with open(cache_file, 'w') as f:
             json.dump(formatted_recommendations, f)
+        cache_manager.record("analysis", video_path, [cache_file])
         logging.info(f"Analysis results saved to cache: {cache_file}")
-    except IOError as e:
+    except OSError as e:
         logging.error(f"Failed to write cache: {e}")
 
     return formatted_recommendations
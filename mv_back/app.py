@@ -6,7 +6,7 @@ from routes import register_routes
 
 app = Flask(__name__)
 # CORS(app)
-CORS(app, origins=["http://localhost:3000","http://localhost:5000"])  # Замініть на ваш фронтенд-домен
+CORS(app, origins=["http://localhost:3000","http://localhost:5000"], expose_headers=["X-Metadata-Version", "Retry-After", "X-Thumbnail-Url"])  # Замініть на ваш фронтенд-домен
 
 # Підключення маршрутів
 register_routes(app)
@@ -0,0 +1,451 @@
+import os
+import re
+import json
+import time
+import threading
+from datetime import datetime
+from thumbnails import thumbnail_key
+from library_paths import source_state
+from config import (
+    THUMBNAILS_DIR, CACHE_DIR, CACHE_INDEX_FILE, CACHE_BUDGETS, CACHE_SWEEP_INTERVAL,
+    CACHE_PARTIAL_MAX_AGE
+)
+
+# Класи з файлами у CACHE_DIR/<клас>/<ключ[:2]>/<ключ><розширення>
+CACHE_FILE_CLASSES = {"analysis": ".json", "transcodes": ".mp4"}
+
+TRICKPLAY_FILE_PATTERN = re.compile(r"^([0-9a-f]{40})_trickplay\.(jpg|vtt)$")
+THUMBNAIL_FILE_PATTERN = re.compile(r"^([0-9a-f]{40})_\w+\.(jpg|webp)$")
+CACHE_FILE_PATTERN = re.compile(r"^([0-9a-f]{40})(\.\w+)$")
+PARTIAL_FILE_PATTERN = re.compile(r"\.partial(\.\w+)?$")
+
+INDEX_SAVE_INTERVAL = 60  # Як часто зберігати час доступу між прибираннями, секунди
+
+
+def classify_cache_file(directory, file_name):
+    """
+    Визначає клас і ключ файлу кешу за його розташуванням та іменем.
+
+    Parameters:
+        directory (str): Коренева директорія класу (THUMBNAILS_DIR або CACHE_DIR/<клас>).
+        file_name (str): Ім'я файлу.
+
+    Returns:
+        tuple: (клас, ключ) або None, якщо файл не належить жодному класу
+        (наприклад, мініатюра старого формату "<папка>.jpg").
+    """
+    if directory == THUMBNAILS_DIR:
+        match = TRICKPLAY_FILE_PATTERN.match(file_name)
+        if match:
+            return "trickplay", match.group(1)
+        match = THUMBNAIL_FILE_PATTERN.match(file_name)
+        if match:
+            return "thumbnails", match.group(1)
+        return None
+
+    for cache_class, extension in CACHE_FILE_CLASSES.items():
+        if directory == os.path.join(CACHE_DIR, cache_class):
+            match = CACHE_FILE_PATTERN.match(file_name)
+            if match and match.group(2) == extension:
+                return cache_class, match.group(1)
+    return None
+
+
+class CacheManager:
+    """
+    Облік і прибирання похідних файлів: мініатюр, аркушів прев'ю, результатів
+    аналізу і перекодованих відео.
+
+    Для кожного файлу в індексі (`index_file`) зберігаються клас, ключ кешу,
+    розмір, час останнього доступу і відео-джерело. Ключ - відбиток джерела
+    (шлях і час зміни, див. thumbnails.thumbnail_key), тож файли зміненого чи
+    видаленого відео розпізнаються як сироти.
+
+    Фоновий потік кожні `sweep_interval` секунд (і одразу, коли клас перевищує
+    бюджет) звіряє індекс з диском, видаляє сироти і покинуті недописані файли,
+    а потім для кожного класу видаляє групи файлів з найдавнішим доступом, поки
+    клас не вкладеться у свій бюджет. Групою є всі файли класу з одним ключем
+    (варіанти мініатюри разом з кадром, аркуш разом з індексом), тож частково
+    видалених наборів не буває. Файли, що не відповідають жодному формату кешу
+    (мініатюри старого формату тощо), не обліковуються і не видаляються.
+    """
+
+    def __init__(self, budgets, index_file, sweep_interval):
+        self.budgets = budgets
+        self.index_file = index_file
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._path_locks = {}
+        self._entries = self._load_index()
+        self._totals = {cache_class: 0 for cache_class in budgets}
+        for entry in self._entries.values():
+            self._totals[entry["class"]] = self._totals.get(entry["class"], 0) + entry["size"]
+        self._dirty = False
+        self.evicted = {cache_class: {"files": 0, "bytes": 0} for cache_class in budgets}
+        self.orphans = {"files": 0, "bytes": 0}
+        self.last_sweep = None
+        self.last_result = None
+        self.last_error = None
+
+    # --- Індекс ---
+
+    def _load_index(self):
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as file:
+                    entries = json.load(file).get("entries", {})
+                return {path: entry for path, entry in entries.items() if entry.get("class") in self.budgets}
+            except (json.JSONDecodeError, ValueError, OSError, AttributeError):
+                return {}
+        return {}
+
+    def save(self):
+        """
+        Зберігає індекс, якщо він змінився з останнього збереження.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"entries": dict(self._entries), "updated": datetime.now().isoformat()}
+            self._dirty = False
+        temp_path = f"{self.index_file}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(temp_path, self.index_file)
+
+    def _put(self, path, entry):
+        previous = self._entries.get(path)
+        if previous is not None:
+            self._totals[previous["class"]] -= previous["size"]
+        self._entries[path] = entry
+        self._totals[entry["class"]] = self._totals.get(entry["class"], 0) + entry["size"]
+        self._dirty = True
+
+    def _drop(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._totals[entry["class"]] -= entry["size"]
+            self._dirty = True
+        return entry
+
+    @staticmethod
+    def _path_key(path):
+        return os.path.normpath(path)
+
+    # --- Облік файлів ---
+
+    def artifact_path(self, cache_class, source):
+        """
+        Шлях файлу кешу класу з CACHE_FILE_CLASSES для відео.
+
+        Parameters:
+            cache_class (str): "analysis" або "transcodes".
+            source (str): Шлях до відеофайлу.
+
+        Returns:
+            str: Шлях у CACHE_DIR або None, якщо відео недоступне.
+        """
+        try:
+            key = thumbnail_key(source)
+        except OSError:
+            return None
+        file_name = f"{key}{CACHE_FILE_CLASSES[cache_class]}"
+        return os.path.join(CACHE_DIR, cache_class, key[:2], file_name)
+
+    def lock_for(self, path):
+        """
+        Блокування для створення конкретного файлу кешу (щоб паралельні запити
+        не запускали однакову роботу).
+        """
+        with self._lock:
+            return self._path_locks.setdefault(self._path_key(path), threading.Lock())
+
+    def record(self, cache_class, source, paths):
+        """
+        Реєструє щойно створені файли класу. Якщо клас перевищив бюджет,
+        будить фонове прибирання.
+
+        Parameters:
+            cache_class (str): Клас з CACHE_BUDGETS.
+            source (str): Відео, з якого створено файли.
+            paths (list): Шляхи до файлів.
+        """
+        now = time.time()
+        over_budget = False
+        with self._lock:
+            for path in paths:
+                classified = classify_cache_file(self._class_root(cache_class), os.path.basename(path))
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    continue
+                self._put(self._path_key(path), {
+                    "class": cache_class,
+                    "key": classified[1] if classified else None,
+                    "source": source,
+                    "size": size,
+                    "accessed": now,
+                })
+            over_budget = self._totals.get(cache_class, 0) > self.budgets.get(cache_class, float("inf"))
+        if over_budget and self._thread is not None:
+            self._wake.set()
+
+    def touch(self, path):
+        """
+        Оновлює час останнього доступу до файлу (лише в пам'яті, без звертань до диска).
+        """
+        with self._lock:
+            entry = self._entries.get(self._path_key(path))
+            if entry is not None:
+                entry["accessed"] = time.time()
+                self._dirty = True
+
+    def remove(self, paths):
+        """
+        Видаляє файли кешу з диска та індексу.
+
+        Returns:
+            int: Кількість звільнених байтів.
+        """
+        freed = 0
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # Файл може бути відкритий (наприклад, відео ще віддається)
+                print(f"Cache file could not be removed: {path}: {e}")
+                continue
+            with self._lock:
+                self._drop(self._path_key(path))
+        return freed
+
+    def clear(self, cache_class):
+        """
+        Видаляє всі файли класу.
+
+        Returns:
+            int: Кількість звільнених байтів.
+        """
+        with self._lock:
+            paths = [path for path, entry in self._entries.items() if entry["class"] == cache_class]
+        return self.remove(paths)
+
+    @staticmethod
+    def _class_root(cache_class):
+        if cache_class in CACHE_FILE_CLASSES:
+            return os.path.join(CACHE_DIR, cache_class)
+        return THUMBNAILS_DIR
+
+    # --- Прибирання ---
+
+    def _scan_disk(self):
+        """
+        Обходить директорії кешу.
+
+        Returns:
+            tuple: ({шлях: (клас, ключ, розмір, mtime)}, [покинуті недописані файли кешу]).
+        """
+        found = {}
+        junk = []
+        now = time.time()
+        roots = {THUMBNAILS_DIR} | {self._class_root(cache_class) for cache_class in CACHE_FILE_CLASSES}
+        for root in roots:
+            for directory, _, files in os.walk(root):
+                for file_name in files:
+                    path = os.path.join(directory, file_name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    if PARTIAL_FILE_PATTERN.search(file_name):
+                        # Недописаний файл кешу: або створюється зараз, або лишився після збою
+                        if classify_cache_file(root, PARTIAL_FILE_PATTERN.sub(r"\1", file_name)) is not None \
+                                and now - stat.st_mtime > CACHE_PARTIAL_MAX_AGE:
+                            junk.append(path)
+                        continue
+                    classified = classify_cache_file(root, file_name)
+                    if classified is None:
+                        # Чужі файли (зокрема мініатюри старого формату "<папка>.jpg") не чіпаємо
+                        continue
+                    found[self._path_key(path)] = (*classified, stat.st_size, stat.st_mtime)
+        return found, junk
+
+    def _reconcile(self, found):
+        """
+        Звіряє індекс з диском: прибирає записи зниклих файлів і додає файли,
+        яких немає в індексі (створені до появи обліку), з часом доступу = mtime.
+        """
+        with self._lock:
+            for path in [path for path in self._entries if path not in found]:
+                self._drop(path)
+            for path, (cache_class, key, size, mtime) in found.items():
+                entry = self._entries.get(path)
+                if entry is None:
+                    self._put(path, {"class": cache_class, "key": key, "source": None, "size": size, "accessed": mtime})
+                elif entry["size"] != size:
+                    self._put(path, {**entry, "size": size})
+
+    def _find_orphans(self):
+        """
+        Returns:
+            list: Шляхи файлів, відео яких видалено або змінено (ключ не збігається з поточним).
+        """
+        with self._lock:
+            by_source = {}
+            for path, entry in self._entries.items():
+                if entry["source"]:
+                    by_source.setdefault(entry["source"], []).append((path, entry["key"]))
+
+        orphans = []
+        for source, files in by_source.items():
+            state = source_state(source)
+            if state == "unavailable":
+                continue
+            current_key = None
+            if state == "present":
+                try:
+                    current_key = thumbnail_key(source)
+                except OSError:
+                    continue
+            orphans.extend(path for path, key in files if key != current_key)
+        return orphans
+
+    def _select_evictions(self):
+        """
+        Returns:
+            dict: Клас -> шляхи файлів, які треба видалити, щоб клас вклався в бюджет.
+        """
+        evictions = {}
+        with self._lock:
+            groups = {}
+            for path, entry in self._entries.items():
+                group = groups.setdefault((entry["class"], entry["key"] or path), {"paths": [], "size": 0, "accessed": 0})
+                group["paths"].append(path)
+                group["size"] += entry["size"]
+                group["accessed"] = max(group["accessed"], entry["accessed"])
+            totals = dict(self._totals)
+
+        for cache_class, budget in self.budgets.items():
+            excess = totals.get(cache_class, 0) - budget
+            if excess <= 0:
+                continue
+            candidates = sorted(
+                (group for (group_class, _), group in groups.items() if group_class == cache_class),
+                key=lambda group: group["accessed"]
+            )
+            for group in candidates:
+                if excess <= 0:
+                    break
+                evictions.setdefault(cache_class, []).extend(group["paths"])
+                excess -= group["size"]
+        return evictions
+
+    def sweep(self):
+        """
+        Виконує одне прибирання: звірка з диском, сироти, бюджети.
+
+        Returns:
+            dict: {"orphans", "junk", "evicted", "freed", "seconds"}.
+        """
+        started = time.perf_counter()
+        found, junk = self._scan_disk()
+        self._reconcile(found)
+
+        freed = 0
+        for path in junk:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+            except OSError:
+                pass
+
+        orphans = self._find_orphans()
+        orphan_bytes = self.remove(orphans)
+        freed += orphan_bytes
+
+        evicted_files = 0
+        for cache_class, paths in self._select_evictions().items():
+            evicted_bytes = self.remove(paths)
+            freed += evicted_bytes
+            evicted_files += len(paths)
+            with self._lock:
+                self.evicted[cache_class]["files"] += len(paths)
+                self.evicted[cache_class]["bytes"] += evicted_bytes
+
+        with self._lock:
+            self.orphans["files"] += len(orphans) + len(junk)
+            self.orphans["bytes"] += orphan_bytes
+            self.last_sweep = datetime.now().isoformat()
+            self.last_result = {
+                "orphans": len(orphans),
+                "junk": len(junk),
+                "evicted": evicted_files,
+                "freed": freed,
+                "seconds": round(time.perf_counter() - started, 3),
+            }
+        self.save()
+        return self.last_result
+
+    # --- Фоновий потік ---
+
+    def start(self):
+        """
+        Запускає фоновий потік прибирання (повторні виклики нічого не роблять).
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        next_sweep = 0
+        while True:
+            if self._wake.is_set() or time.monotonic() >= next_sweep:
+                self._wake.clear()
+                try:
+                    self.sweep()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    print(f"Cache sweep failed: {e}")
+                next_sweep = time.monotonic() + self.sweep_interval
+            else:
+                try:
+                    self.save()
+                except OSError as e:
+                    print(f"Cache index could not be saved: {e}")
+            self._wake.wait(INDEX_SAVE_INTERVAL)
+
+    def status(self):
+        with self._lock:
+            classes = {}
+            for cache_class, budget in self.budgets.items():
+                entries = [entry for entry in self._entries.values() if entry["class"] == cache_class]
+                used = self._totals.get(cache_class, 0)
+                classes[cache_class] = {
+                    "files": len(entries),
+                    "bytes": used,
+                    "budget": budget,
+                    "usage": round(used / budget, 3) if budget else None,
+                    "oldest_access": datetime.fromtimestamp(min(entry["accessed"] for entry in entries)).isoformat() if entries else None,
+                    "evicted": dict(self.evicted[cache_class]),
+                }
+            return {
+                "running": self._thread is not None,
+                "classes": classes,
+                "orphans_removed": dict(self.orphans),
+                "last_sweep": self.last_sweep,
+                "last_result": self.last_result,
+                "last_error": self.last_error,
+            }
+
+
+cache_manager = CacheManager(CACHE_BUDGETS, CACHE_INDEX_FILE, CACHE_SWEEP_INTERVAL)
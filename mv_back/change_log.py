@@ -0,0 +1,74 @@
+import threading
+from collections import deque
+
+
+class ChangeLog:
+    """
+    Обмежений журнал змін на рівні записів для інкрементальної синхронізації клієнтів.
+
+    Кожна зміна - (версія, операція "put"/"delete", категорія, id). `floor` - остання
+    версія, для якої історія вже недоступна: клієнт, що синхронізувався раніше,
+    має перезавантажити документ повністю.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self.entries = deque()
+        self.floor = 0
+
+    def reset(self, version):
+        """
+        Відкидає історію: зміни до `version` включно більше недоступні.
+        """
+        with self._lock:
+            self.entries.clear()
+            self.floor = version
+
+    def load(self, entries, version):
+        """
+        Відновлює журнал з записів (версія, операція, категорія, id), наприклад
+        програних із журналу сховища, для документа версії `version`.
+        """
+        with self._lock:
+            self.entries = deque(entries)
+            self.floor = self.entries[0][0] - 1 if self.entries else version
+            self._trim()
+
+    def record(self, version, changes, deleted):
+        """
+        Додає зміни одного збереження.
+
+        Parameters:
+            version (int): Версія документа після збереження.
+            changes (list): Пари (категорія, запис).
+            deleted (list): Id видалених записів.
+        """
+        with self._lock:
+            for category, item in changes:
+                self.entries.append((version, "put", category, item.get("id")))
+            for item_id in deleted:
+                self.entries.append((version, "delete", None, item_id))
+            self._trim()
+
+    def _trim(self):
+        while len(self.entries) > self.capacity:
+            # Версія частково відкинутого збереження теж стає недоступною
+            self.floor = max(self.floor, self.entries.popleft()[0])
+
+    def since(self, version):
+        """
+        Повертає останню операцію для кожного запису, зміненого після `version`.
+
+        Returns:
+            dict: id -> (операція, категорія) або None, якщо історії вже немає.
+        """
+        with self._lock:
+            if version < self.floor:
+                return None
+            latest = {}
+            for entry_version, op, category, item_id in self.entries:
+                if entry_version > version:
+                    latest.pop(item_id, None)
+                    latest[item_id] = (op, category)
+            return latest
@@ -0,0 +1,107 @@
+import zlib
+from config import COMPRESS_MIN_SIZE, COMPRESS_LEVEL
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "text/plain",
+    "text/html",
+    "text/css",
+    "text/vtt",
+}
+
+# Brotli з найвищою якістю надто повільний для динамічних відповідей
+BROTLI_QUALITY = 4
+
+
+def choose_encoding(accept_encodings):
+    """
+    Обирає кодування стиснення за заголовком Accept-Encoding клієнта.
+
+    Parameters:
+        accept_encodings: `request.accept_encodings` (werkzeug MIMEAccept).
+
+    Returns:
+        str: "br", "gzip" або None.
+    """
+    candidates = ["gzip"]
+    if brotli is not None:
+        candidates.insert(0, "br")
+    best = None
+    best_quality = 0
+    for encoding in candidates:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress_bytes(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)  # 31 = gzip-обгортка
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    """
+    Стискає потокову відповідь частинами, не збираючи її в пам'яті.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            output = compressor.process(chunk)
+            if output:
+                yield output
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            output = compressor.compress(chunk)
+            if output:
+                yield output
+        yield compressor.flush()
+
+
+def compress_response(response, accept_encodings):
+    """
+    Стискає текстові відповіді (gzip або brotli) відповідно до Accept-Encoding.
+
+    Файли (send_file), відео, часткові та вже стиснені відповіді не змінюються.
+    Відповіді до COMPRESS_MIN_SIZE байт віддаються як є.
+
+    Parameters:
+        response (Response): Відповідь Flask.
+        accept_encodings: `request.accept_encodings`.
+
+    Returns:
+        Response: Та сама відповідь, за потреби стиснена.
+    """
+    if (
+        response.status_code != 200 or
+        response.direct_passthrough or
+        "Content-Encoding" in response.headers or
+        response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(compress_bytes(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -3,4 +3,76 @@ SERIES_PATHS = ["E:\\Media\\Serials", "D:\\KiHoXa\\Serials", "F:\\Serials"]
 METADATA_FILE = "metadata.json"
 BASE_URL = "http://localhost:5000"
 THUMBNAILS_DIR = "thumbnails"
-DB_CONNECTION_STRING = 'DRIVER={ODBC Driver 17 for SQL Server};SERVER=localhost\\MSSQLSERVER06;DATABASE=MediaVault;Trusted_Connection=yes'
\ No newline at end of file
+THUMBNAIL_SIZES = {"grid": 320, "detail": 640, "retina": 1280}  # Назва розміру -> ширина, пікселі
+THUMBNAIL_DEFAULT_SIZE = "grid"
+THUMBNAIL_WEBP_QUALITY = 80
+# Етапи витягування кадру по черзі: "attached_pic" (вбудована обкладинка), "seek" (пошук
+# до частки тривалості), "scene" (зміна сцени від початку), "shell" (pywin32, лише Windows)
+THUMBNAIL_EXTRACTORS = ["attached_pic", "seek", "scene"]
+THUMBNAIL_SEEK_FRACTION = 0.2  # Частка тривалості, до якої переходить етап "seek"
+THUMBNAIL_EXTRACT_TIMEOUT = 20  # Максимальний час одного запуску ffmpeg/ffprobe, секунди
+THUMBNAIL_SCENE_MAX_SECONDS = 120  # Скільки секунд відео читає етап "scene"
+THUMBNAIL_WORKERS = 2  # Максимум одночасних процесів ffmpeg для мініатюр
+THUMBNAIL_WAIT_TIMEOUT = 2.0  # Скільки запит чекає на генерацію, перш ніж віддати заглушку (202), секунди
+THUMBNAIL_RETRY_AFTER = 2  # Значення Retry-After для заглушки, секунди
+THUMBNAIL_FAILURE_TTL = 300  # Скільки секунд не повторювати невдалу генерацію
+THUMBNAIL_MAX_AGE = 31536000  # max-age для адрес мініатюр за вмістом (рік), секунди
+THUMBNAIL_INDEX_TTL = 600  # Скільки секунд пам'ятати, яке відео і ключ кешу відповідають папці
+THUMBNAIL_PREWARM_ENABLED = False  # Створювати мініатюри нових записів у фоні після сканування
+THUMBNAIL_PREWARM_IDLE_GRACE = 30  # Скільки секунд після відтворення відео попереднє створення чекає
+# Прев'ю для шкали перемотування: аркуш кадрів (спрайт) і WebVTT-індекс на епізод (trickplay.py)
+TRICKPLAY_INTERVAL = 10  # Кадр кожні N секунд відео
+TRICKPLAY_WIDTH = 160  # Ширина одного кадру, пікселі
+TRICKPLAY_COLUMNS = 10  # Кадрів у рядку аркуша
+TRICKPLAY_MAX_FRAMES = 600  # Для довгих відео інтервал збільшується, щоб аркуш не перевищив цю кількість
+TRICKPLAY_WORKERS = 1  # Одночасних процесів ffmpeg для аркушів (кожен читає весь файл)
+TRICKPLAY_TIMEOUT = 600  # Максимальний час створення одного аркуша, секунди
+TRICKPLAY_RETRY_AFTER = 5  # Значення Retry-After, поки аркуш створюється, секунди
+
+# Кеш похідних файлів (cache_manager.py): мініатюри і аркуші лежать у THUMBNAILS_DIR,
+# результати аналізу і перекодовані відео - у CACHE_DIR (а не поруч із медіа)
+CACHE_DIR = "cache"
+CACHE_INDEX_FILE = "cache_index.json"  # Розмір, останній доступ і джерело кожного файлу кешу
+CACHE_BUDGETS = {  # Клас -> максимальний розмір, байти
+    "thumbnails": 1024 * 1024 * 1024,
+    "trickplay": 512 * 1024 * 1024,
+    "analysis": 64 * 1024 * 1024,
+    "transcodes": 50 * 1024 * 1024 * 1024,
+}
+CACHE_SWEEP_INTERVAL = 3600  # Як часто прибирати застарілі файли і перевіряти бюджети, секунди
+CACHE_PARTIAL_MAX_AGE = 3600  # Недописані (.partial) файли, старші за це, вважаються покинутими, секунди
+DB_CONNECTION_STRING = 'DRIVER={ODBC Driver 17 for SQL Server};SERVER=localhost\\MSSQLSERVER06;DATABASE=MediaVault;Trusted_Connection=yes'
+BULK_BATCH_SIZE = 5000  # Розмір пакета рядків для executemany у transfer_db.py
+
+# Режим збереження метаданих: "snapshot" (повний перезапис файлу), "journal"
+# (дописування змін у журнал із фоновим ущільненням у знімок) або "sqlite"
+# (вбудована база зі схемою transfer_db.py)
+METADATA_PERSISTENCE = "snapshot"
+METADATA_JOURNAL_FILE = "metadata.journal"
+METADATA_DB_FILE = "metadata.db"
+JOURNAL_COMPACT_THRESHOLD = 500  # Кількість записів у журналі до ущільнення
+METADATA_COMMIT_WINDOW = 0.005  # Вікно групування змін в одне збереження, секунди
+METADATA_COMMIT_MAX_BATCH = 100  # Максимум змін в одному збереженні
+BATCH_MAX_OPERATIONS = 1000  # Максимум операцій в одному запиті /api/metadata/batch
+CHANGE_LOG_SIZE = 5000  # Скільки змін записів пам'ятати для /api/metadata/changes
+
+# Стиснення відповідей (gzip, або brotli, якщо встановлений пакет brotli)
+COMPRESS_MIN_SIZE = 1024  # Менші відповіді не стискаються, байти
+COMPRESS_LEVEL = 5  # Рівень gzip (1-9)
+
+SCAN_INTERVAL = 600  # Інтервал фонового сканування файлової системи, секунди
+SCAN_STATE_FILE = "scan_state.json"  # Знімки mtime директорій для інкрементального сканування
+SCAN_MAX_WORKERS = 4  # Максимум дисків, що скануються одночасно
+
+# Спостереження за змінами у кореневих папках (нові епізоди з'являються без повного сканування)
+WATCHER_ENABLED = False
+WATCHER_BACKEND = "auto"  # "auto" (inotify на Linux, інакше опитування), "inotify" або "polling"
+WATCHER_DEBOUNCE = 3.0  # Скільки секунд запис має бути "тихим", перш ніж зміни застосуються
+WATCHER_POLL_INTERVAL = 10  # Інтервал опитування для запасного режиму, секунди
+
+# Безперервна реплікація змін метаданих у базу (db_replication.py)
+REPLICATION_ENABLED = False
+REPLICATION_TARGET = DB_CONNECTION_STRING  # Або "sqlite:<шлях>" для локальної бази
+REPLICATION_INTERVAL = 5  # Як часто перевіряти нові зміни, секунди
+REPLICATION_BATCH_SIZE = 200  # Максимум записів в одній транзакції
+REPLICATION_CHECKPOINT_FILE = "replication_state.json"  # Остання реплікована версія документа
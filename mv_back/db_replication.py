@@ -0,0 +1,187 @@
+import os
+import copy
+import json
+import time
+import threading
+from datetime import datetime
+from metadata_store import store
+from transfer_db import BulkLoader, resolve_target, TRANSFER_CATEGORIES
+from config import REPLICATION_TARGET, REPLICATION_INTERVAL, REPLICATION_BATCH_SIZE, REPLICATION_CHECKPOINT_FILE
+
+
+class DatabaseReplicator:
+    """
+    Безперервна реплікація змін метаданих у реляційну базу (схема transfer_db.py).
+
+    Фоновий потік кожні `interval` секунд бере з журналу змін сховища записи,
+    змінені після контрольної точки, і застосовує їх невеликими транзакціями
+    (по `batch_size` записів) через BulkLoader: змінені записи оновлюються
+    цілком, видалені - видаляються разом з дочірніми рядками. Після кожного
+    раунду версія документа зберігається в `checkpoint_file`, тож після
+    перезапуску реплікація продовжується з цього місця.
+
+    Повна синхронізація виконується лише тоді, коли контрольної точки немає або
+    журнал змін вже не містить історії з неї (наприклад, після ущільнення).
+    """
+
+    def __init__(self, target, interval, batch_size, checkpoint_file):
+        self.target = target
+        self.interval = interval
+        self.batch_size = batch_size
+        self.checkpoint_file = checkpoint_file
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.checkpoint = self._load_checkpoint()
+        self.last_run = None
+        self.last_error = None
+        self.last_result = None
+        self.replicated = 0
+        self.full_syncs = 0
+
+    def _load_checkpoint(self):
+        if os.path.exists(self.checkpoint_file):
+            try:
+                with open(self.checkpoint_file, 'r', encoding='utf-8') as file:
+                    return json.load(file).get("version")
+            except (json.JSONDecodeError, ValueError, OSError, AttributeError):
+                return None
+        return None
+
+    def _save_checkpoint(self, version):
+        temp_path = f"{self.checkpoint_file}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({"version": version, "updated": datetime.now().isoformat()}, file)
+        os.replace(temp_path, self.checkpoint_file)
+        self.checkpoint = version
+
+    def start(self):
+        """
+        Запускає фоновий потік реплікації (повторні виклики нічого не роблять).
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def trigger(self):
+        """
+        Запускає раунд реплікації, не чекаючи інтервалу.
+        """
+        self._wake.set()
+
+    def status(self):
+        return {
+            "running": self._thread is not None,
+            "checkpoint": self.checkpoint,
+            "version": store.version,
+            "replicated": self.replicated,
+            "full_syncs": self.full_syncs,
+            "last_run": self.last_run,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+        }
+
+    def _run(self):
+        while True:
+            try:
+                self.replicate_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Database replication failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _snapshot(self):
+        """
+        Знімає узгоджений стан для раунду: версію документа і копії записів,
+        які потрібно записати, під блокуванням сховища.
+
+        Returns:
+            tuple: (версія, повна синхронізація?, [(категорія, позиція, запис)], [id видалених]).
+        """
+        with store.lock:
+            metadata = store.get()
+            version = store.version
+            if self.checkpoint == version:
+                return version, False, [], []
+
+            changes = None
+            if self.checkpoint is not None and self.checkpoint < version:
+                changes = store.change_log.since(self.checkpoint)
+
+            if changes is None:
+                items = [
+                    (category, position, copy.deepcopy(item))
+                    for category in TRANSFER_CATEGORIES
+                    for position, item in enumerate(metadata.get(category, []))
+                ]
+                return version, True, items, []
+
+            positions = {}
+            for category in {category for op, category in changes.values() if op == "put"}:
+                if category in TRANSFER_CATEGORIES:
+                    positions.update({item.get("id"): position for position, item in enumerate(metadata.get(category, []))})
+
+            index = store.get_index()
+            items = []
+            deleted = []
+            for item_id, (op, category) in changes.items():
+                item, current_category = index.get_item(item_id)
+                if op == "delete" or item is None or current_category not in TRANSFER_CATEGORIES:
+                    deleted.append(item_id)
+                else:
+                    items.append((current_category, positions.get(item_id, 0), copy.deepcopy(item)))
+            return version, False, items, deleted
+
+    def replicate_once(self):
+        """
+        Виконує один раунд реплікації.
+
+        Returns:
+            dict: {"version", "full", "items", "deleted", "seconds"}.
+        """
+        started = time.perf_counter()
+        version, full, items, deleted = self._snapshot()
+        if not full and not items and not deleted:
+            if version != self.checkpoint:
+                # Нові версії не зачепили записи, що реплікуються
+                self._save_checkpoint(version)
+            return None
+
+        dialect, connection_target = resolve_target(self.target)
+        conn = dialect.connect(connection_target)
+        loader = BulkLoader(conn, dialect, self.batch_size)
+        try:
+            for item_id in deleted:
+                loader.stage_delete(item_id)
+            for category, position, item in items:
+                loader.stage(category, item, position)
+                if len(loader.media) >= self.batch_size:
+                    loader.flush()
+            if full:
+                for item_id in loader.stale_ids({item["id"] for _, _, item in items}):
+                    loader.stage_delete(item_id)
+            loader.flush()
+        finally:
+            loader.cursor.close()
+            conn.close()
+
+        self._save_checkpoint(version)
+        self.replicated += len(items) + len(deleted)
+        if full:
+            self.full_syncs += 1
+        self.last_run = datetime.now().isoformat()
+        self.last_result = {
+            "version": version,
+            "full": full,
+            "items": len(items),
+            "deleted": len(deleted),
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        return self.last_result
+
+
+replicator = DatabaseReplicator(REPLICATION_TARGET, REPLICATION_INTERVAL, REPLICATION_BATCH_SIZE, REPLICATION_CHECKPOINT_FILE)
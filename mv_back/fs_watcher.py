@@ -0,0 +1,348 @@
+import os
+import sys
+import time
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+from datetime import datetime
+from metadata import (
+    create_series_metadata, create_movie_metadata, refresh_item_copy,
+    mutate_metadata, directory_fingerprint, list_directory
+)
+from metadata_store import store
+from scan_service import scan_service
+from thumbnail_prewarm import thumbnail_prewarmer
+from thumbnail_service import thumbnail_index
+from config import MOVIES_PATHS, SERIES_PATHS, WATCHER_BACKEND, WATCHER_DEBOUNCE, WATCHER_POLL_INTERVAL
+
+# Події inotify (див. <sys/inotify.h>)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+    IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+# Глибина спостереження від кореня: 0 - корінь, 1 - директорія запису, 2 - сезон
+MAX_WATCH_DEPTH = 2
+
+CATEGORY_HANDLERS = {
+    "series": create_series_metadata,
+    "movies": create_movie_metadata,
+}
+
+
+def watched_roots():
+    """
+    Returns:
+        list: Пари (нормалізований корінь, категорія) для налаштованих шляхів.
+    """
+    return (
+        [(os.path.normpath(path), "series") for path in SERIES_PATHS] +
+        [(os.path.normpath(path), "movies") for path in MOVIES_PATHS]
+    )
+
+
+class InotifyBackend:
+    """
+    Джерело подій на основі inotify (Linux), підключеного через ctypes.
+
+    Спостерігає за коренями, директоріями записів і їхніми сезонами та повертає
+    шляхи записів верхнього рівня, яких стосуються події.
+    """
+
+    name = "inotify"
+
+    def __init__(self, roots):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.roots = roots
+        self.watches = {}  # wd -> (корінь, категорія, відносні частини шляху)
+        self.overflowed = False
+        for root, category in roots:
+            if os.path.isdir(root):
+                self._watch_tree(root, category, ())
+
+    def _watch_tree(self, root, category, parts):
+        path = os.path.join(root, *parts)
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            print(f"Failed to watch {path}: {os.strerror(ctypes.get_errno())}")
+            return
+        self.watches[wd] = (root, category, parts)
+        if len(parts) >= MAX_WATCH_DEPTH:
+            return
+        try:
+            dirs, _ = list_directory(path)
+        except OSError:
+            return
+        for entry in dirs:
+            self._watch_tree(root, category, parts + (entry.name,))
+
+    def wait(self, timeout):
+        """
+        Чекає на події не довше `timeout` секунд.
+
+        Returns:
+            list: Пари (шлях запису, категорія), яких стосуються отримані події.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        buffer = os.read(self.fd, 64 * 1024)
+        affected = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buffer):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            raw_name = buffer[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length]
+            offset += EVENT_HEADER.size + length
+            name = os.fsdecode(raw_name.rstrip(b"\0"))
+
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+                continue
+            watch = self.watches.get(wd)
+            if watch is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                continue
+            root, category, parts = watch
+            event_parts = parts + (name,) if name else parts
+            if not event_parts:
+                continue  # Подія над самим коренем
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and len(event_parts) <= MAX_WATCH_DEPTH:
+                self._watch_tree(root, category, event_parts)
+            affected.append((os.path.join(root, event_parts[0]), category))
+        return affected
+
+
+class PollingBackend:
+    """
+    Запасне джерело подій: періодично порівнює знімки mtime директорій записів
+    (той самий знімок, що й в інкрементальному скануванні).
+    """
+
+    name = "polling"
+
+    def __init__(self, roots, interval):
+        self.roots = roots
+        self.interval = interval
+        self.overflowed = False
+        self._snapshot = self._take_snapshot()
+        self._next_poll = time.monotonic() + interval
+
+    def _take_snapshot(self):
+        snapshot = {}
+        for root, category in self.roots:
+            if not os.path.isdir(root):
+                continue
+            try:
+                with os.scandir(root) as entries:
+                    entries = list(entries)
+            except OSError:
+                continue
+            for entry in entries:
+                path = os.path.join(root, entry.name)
+                try:
+                    if entry.is_dir():
+                        state = directory_fingerprint(path, entry)
+                    else:
+                        state = entry.stat().st_mtime_ns
+                except OSError:
+                    continue
+                snapshot[path] = (category, state)
+        return snapshot
+
+    def wait(self, timeout):
+        delay = self._next_poll - time.monotonic()
+        if timeout is not None and timeout < delay:
+            time.sleep(max(0, timeout))
+            return []
+        time.sleep(max(0, delay))
+        self._next_poll = time.monotonic() + self.interval
+
+        snapshot = self._take_snapshot()
+        affected = [
+            (path, category) for path, (category, state) in snapshot.items()
+            if self._snapshot.get(path) != (category, state)
+        ]
+        affected.extend(
+            (path, category) for path, (category, _) in self._snapshot.items()
+            if path not in snapshot
+        )
+        self._snapshot = snapshot
+        return affected
+
+
+def apply_change(path, category):
+    """
+    Застосовує зміну одного запису верхнього рівня до метаданих (через записувач).
+
+    Parameters:
+        path (str): Шлях директорії (чи файлу) запису в корені бібліотеки.
+        category (str): "series" або "movies".
+
+    Returns:
+        str: Виконана дія ("created", "updated", "deleted") або None.
+    """
+    exists = os.path.exists(path)
+    is_dir = exists and os.path.isdir(path)
+    new_item = None
+    if exists and (is_dir or category != "series"):
+        # Новий запис будуємо заздалегідь, щоб не тримати записувач на лістингу диска
+        index = store.get_index()
+        if index.get_item_by_path(path, categories=[category])[0] is None:
+            new_item = CATEGORY_HANDLERS[category](os.path.basename(path), path)
+            if new_item is None:
+                return None
+
+    def mutation(metadata, index):
+        item, _ = index.get_item_by_path(path, categories=[category])
+
+        if not exists:
+            # Як і clean_outdated_metadata, прибираємо лише автоматично додані записи
+            if item and item.get("auto_added", False):
+                metadata[category].remove(item)
+                return "deleted", [], [item["id"]]
+            return None, [], []
+
+        if item is None:
+            if new_item is None:
+                return None, [], []
+            metadata[category].append(new_item)
+            return "created", [new_item], []
+
+        if is_dir:
+            item, _ = refresh_item_copy(metadata, item, category)
+            return "updated", [item], []
+        return None, [], []
+
+    return mutate_metadata(mutation)
+
+
+class FileSystemWatcher:
+    """
+    Стежить за коренями бібліотеки і застосовує зміни до метаданих майже в реальному часі.
+
+    Події групуються по записах верхнього рівня і застосовуються, коли для запису
+    `debounce` секунд не було нових подій (наприклад, поки копіюється сезон).
+    """
+
+    def __init__(self, backend, debounce, poll_interval):
+        self.backend_name = backend
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.backend = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pending = {}  # шлях запису -> (категорія, час останньої події)
+        self.applied = {"created": 0, "updated": 0, "deleted": 0}
+        self.last_event = None
+        self.last_error = None
+
+    def _create_backend(self, roots):
+        if self.backend_name in ("auto", "inotify") and sys.platform.startswith("linux"):
+            try:
+                return InotifyBackend(roots)
+            except (OSError, AttributeError) as e:
+                if self.backend_name == "inotify":
+                    raise
+                print(f"inotify is unavailable, falling back to polling: {e}")
+        return PollingBackend(roots, self.poll_interval)
+
+    def start(self):
+        """
+        Запускає фоновий потік спостереження (повторні виклики нічого не роблять).
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def status(self):
+        return {
+            "backend": self.backend.name if self.backend else None,
+            "running": self._thread is not None,
+            "pending": len(self._pending),
+            "debounce": self.debounce,
+            "applied": dict(self.applied),
+            "last_event": self.last_event,
+            "last_error": self.last_error,
+        }
+
+    def _next_timeout(self):
+        if not self._pending:
+            return 1.0
+        oldest = min(last for _, last in self._pending.values())
+        return max(0.0, oldest + self.debounce - time.monotonic())
+
+    def _run(self):
+        try:
+            self.backend = self._create_backend(watched_roots())
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Failed to start file system watcher: {e}")
+            return
+
+        while True:
+            try:
+                events = self.backend.wait(self._next_timeout())
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"File system watcher error: {e}")
+                time.sleep(self.poll_interval)
+                continue
+
+            now = time.monotonic()
+            for path, category in events:
+                self._pending[path] = (category, now)
+            if events:
+                self.last_event = datetime.now().isoformat()
+
+            if self.backend.overflowed:
+                # Черга подій переповнилась - частину змін втрачено, потрібне повне сканування
+                self.backend.overflowed = False
+                scan_service.trigger()
+
+            self._flush(now)
+
+    def _flush(self, now):
+        ready = [
+            (path, category) for path, (category, last) in self._pending.items()
+            if now - last >= self.debounce
+        ]
+        for path, category in ready:
+            del self._pending[path]
+            try:
+                action = apply_change(path, category)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Watcher failed to apply change for {path}: {e}")
+                continue
+            if action:
+                self.applied[action] += 1
+                thumbnail_index.invalidate([path])
+            if action in ("created", "updated"):
+                thumbnail_prewarmer.enqueue([path])
+
+
+fs_watcher = FileSystemWatcher(WATCHER_BACKEND, WATCHER_DEBOUNCE, WATCHER_POLL_INTERVAL)
@@ -0,0 +1,110 @@
+import json
+import itertools
+from contextlib import nullcontext
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Скільки елементів списку кодується за один крок потокової відповіді
+STREAM_CHUNK_ITEMS = 200
+
+
+def dumps_bytes(obj, pretty=False, sort_keys=False, default=None):
+    """
+    Серіалізує об'єкт у UTF-8 JSON. Використовує orjson, якщо він встановлений,
+    інакше стандартний модуль json. Форматований JSON завжди пишеться стандартним
+    модулем з відступом 4, як і раніше (orjson підтримує лише відступ 2), щоб
+    знімок metadata.json не змінював формат залежно від встановлених пакетів.
+
+    Parameters:
+        obj: Об'єкт для серіалізації.
+        pretty (bool): Форматування з відступами (для знімка у режимі "snapshot").
+        sort_keys (bool): Сортувати ключі словників.
+        default (function, optional): Перетворення для нестандартних типів.
+
+    Returns:
+        bytes: Закодований JSON.
+    """
+    if orjson is not None and not pretty:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=default, option=option)
+    if pretty:
+        text = json.dumps(obj, ensure_ascii=False, indent=4, sort_keys=sort_keys, default=default)
+    else:
+        text = json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=sort_keys, default=default)
+    return text.encode("utf-8")
+
+
+def loads(data):
+    """
+    Розбирає JSON з рядка або байтів.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def iter_json_object(obj, lock=None, chunk_size=STREAM_CHUNK_ITEMS):
+    """
+    Потоково кодує словник: списки (та ітератори) верхнього рівня кодуються
+    порціями по `chunk_size` елементів, тож у пам'яті не збирається весь документ.
+
+    Parameters:
+        obj (dict): Словник для кодування.
+        lock (optional): Блокування, під яким кодується кожна порція (щоб запис
+            не змінювався посеред серіалізації).
+        chunk_size (int): Розмір порції.
+
+    Yields:
+        bytes: Частини JSON-документа.
+    """
+    yield b"{"
+    for position, (key, value) in enumerate(obj.items()):
+        prefix = (b"," if position else b"") + dumps_bytes(str(key)) + b":"
+        if isinstance(value, (list, tuple)) or hasattr(value, "__next__"):
+            yield prefix + b"["
+            items = iter(value)
+            first = True
+            while True:
+                with lock or nullcontext():
+                    chunk = [dumps_bytes(item) for item in itertools.islice(items, chunk_size)]
+                if not chunk:
+                    break
+                yield (b"" if first else b",") + b",".join(chunk)
+                first = False
+            yield b"]"
+        else:
+            yield prefix + dumps_bytes(value)
+    yield b"}\n"
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON-провайдер Flask, що використовує orjson (якщо доступний) для jsonify
+    та request.json. Поведінка (сортування ключів, типи за замовчуванням) та сама,
+    що й у стандартного провайдера.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj, sort_keys=self.sort_keys, default=self.default).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        # Як і стандартний провайдер: у debug-режимі відповіді з відступами
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        payload = dumps_bytes(obj, pretty=pretty, sort_keys=self.sort_keys, default=self.default)
+        return self._app.response_class(payload + b"\n", mimetype=self.mimetype)
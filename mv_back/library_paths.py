@@ -0,0 +1,30 @@
+import os
+from config import MOVIES_PATHS, SERIES_PATHS
+
+
+def _is_within(path, root):
+    path = os.path.normcase(os.path.normpath(os.path.abspath(path)))
+    root = os.path.normcase(os.path.normpath(os.path.abspath(root)))
+    return path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def source_state(source):
+    """
+    Стан файлу чи папки бібліотеки на диску.
+
+    Відсутній шлях вважається видаленим лише тоді, коли доступна коренева
+    папка бібліотеки (чи диск), де він лежав: інакше диск може бути просто
+    не підключений, і записи та кеш для нього не чіпаються.
+
+    Returns:
+        str: "present", "missing" або "unavailable".
+    """
+    if os.path.exists(source):
+        return "present"
+    roots = [root for root in MOVIES_PATHS + SERIES_PATHS if _is_within(source, root)]
+    if roots:
+        anchor = roots[0]
+    else:
+        drive = os.path.splitdrive(os.path.abspath(source))[0]
+        anchor = drive + os.sep if drive else os.sep
+    return "missing" if os.path.isdir(anchor) else "unavailable"
@@ -1,14 +1,136 @@
 import os
+import copy
 import uuid
 import json
+import time
 from datetime import datetime
-from config import MOVIES_PATHS, SERIES_PATHS, METADATA_FILE, BASE_URL, THUMBNAILS_DIR
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from config import MOVIES_PATHS, SERIES_PATHS, METADATA_FILE, BASE_URL, THUMBNAILS_DIR, SCAN_STATE_FILE, SCAN_MAX_WORKERS
+from metadata_store import store
+from metadata_writer import writer
+from library_paths import source_state
 # from flask import Flask, request, send_file
 
+def refresh_item_paths(item):
+    """
+    Перечитує з диска сезони/частини запису, зберігаючи метадані файлів
+    (теги, таймкоди, аудіодоріжки тощо). Запис змінюється на місці, без збереження.
+
+    Parameters:
+        item (dict): Запис серіалу чи колекції.
+
+    Returns:
+        str: Опис виконаного оновлення.
+    """
+    if item["type"] == "series":
+        print(f"Processing series: {item['title']}")
+        # Отримуємо список реальних папок сезонів
+        real_seasons = [d for d in os.listdir(item["path"]) 
+                      if os.path.isdir(os.path.join(item["path"], d))]
+        print(f"Found seasons directories: {real_seasons}")
+
+        # --- SPECIAL CASE: Було лише один сезон, і його просто перемістили у підпапку ---
+        if (
+            len(item["seasons"]) == 1 and
+            item["seasons"][0].get("title") == "Season 1" and
+            len(real_seasons) > 1
+        ):
+            # Просто оновлюємо title і path першого сезону, не чіпаючи files
+            item["seasons"][0]["title"] = real_seasons[0]
+            item["seasons"][0]["path"] = os.path.join(item["path"], real_seasons[0])
+            # Якщо з'явилися ще сезони — додаємо їх як нові
+            for season_name in real_seasons[1:]:
+                season_path = os.path.join(item["path"], season_name)
+                files = [{"name": f} for f in os.listdir(season_path) if os.path.isfile(os.path.join(season_path, f))]
+                item["seasons"].append({
+                    "title": season_name,
+                    "path": season_path,
+                    "files": files
+                })
+            item["last_modified"] = datetime.now().isoformat()
+            return "Season path updated without losing metadata"
+
+        # Словник існуючих сезонів для збереження метаданих
+        existing_seasons = {s["title"]: s for s in item["seasons"]}
+        item["seasons"] = []
+        
+        # Для кожної реальної папки сезону
+        for season_name in real_seasons:
+            season_path = os.path.join(item["path"], season_name)
+            # Беремо існуючий сезон або створюємо новий
+            season = existing_seasons.get(season_name, {"title": season_name})
+            season["path"] = season_path
+            
+            # Зберігаємо існуючі метадані файлів
+            existing_files = {f["name"]: f for f in season.get("files", [])}
+            season["files"] = []
+            
+            # Оновлюємо файли
+            for file in os.listdir(season_path):
+                if os.path.isfile(os.path.join(season_path, file)):
+                    # Зберігаємо існуючі метадані файлу або створюємо нові
+                    file_data = existing_files.get(file, {})
+                    file_data["name"] = file
+                    season["files"].append(file_data)
+            
+            item["seasons"].append(season)
+            print(f"Updated season {season_name} with {len(season['files'])} files")
+
+        # Додаємо "Season 1", якщо підпапок немає (усі файли у корені)
+        if not real_seasons:
+            season = existing_seasons.get("Season 1", {"title": "Season 1"})
+            season["path"] = item["path"]
+            existing_files = {f["name"]: f for f in season.get("files", [])}
+            season["files"] = []
+            for file in os.listdir(item["path"]):
+                if os.path.isfile(os.path.join(item["path"], file)):
+                    file_data = existing_files.get(file, {})
+                    file_data["name"] = file
+                    season["files"].append(file_data)
+            item["seasons"].append(season)
+            print(f"Added Season 1 with {len(season['files'])} files")
+
+    elif item["type"] == "collection":
+        # Оновлюємо шляхи для фільму/колекції
+        item["parts"] = [
+            {
+                "title": file,
+                "path": os.path.join(item["path"], file)
+            }
+            for file in os.listdir(item["path"])
+            if os.path.isfile(os.path.join(item["path"], file))
+        ]
+    
+    item["last_modified"] = datetime.now().isoformat()
+    return "Paths updated successfully"
+
+def refresh_item_copy(metadata, item, category):
+    """
+    Перечитує шляхи запису (див. refresh_item_paths) на його копії і лише після
+    успіху підставляє копію в документ замість оригіналу: якщо читання диска
+    впаде посередині, спільний документ сховища лишиться незмінним.
+
+    Parameters:
+        metadata (dict): Документ метаданих.
+        item (dict): Запис із документа.
+        category (str): Категорія запису.
+
+    Returns:
+        tuple: (оновлений запис, опис виконаного оновлення).
+    """
+    updated = copy.deepcopy(item)
+    message = refresh_item_paths(updated)
+    items = metadata[category]
+    position = next(i for i, existing in enumerate(items) if existing is item)
+    items[position] = updated
+    return updated, message
+
 def update_paths_only(metadata, item_id):
     """
     Оновлює тільки шляхи до файлів для вказаного елемента метаданих.
     Зберігає всі інші метадані (теги, налаштування тощо).
+    Зміна виконується через записувач над документом сховища.
 
     Parameters:
         metadata (dict): Поточні метадані
@@ -17,123 +139,137 @@ def update_paths_only(metadata, item_id):
     Returns:
         tuple: (bool, str) - (успіх оновлення, повідомлення)
     """
-    item, category = find_metadata_item(metadata, item_id=item_id)
-    
-    if not item or not os.path.exists(item["path"]):
-        return False, "Item not found or path doesn't exist"
-    try:
-        if item["type"] == "series":
-            print(f"Processing series: {item['title']}")
-            # Отримуємо список реальних папок сезонів
-            real_seasons = [d for d in os.listdir(item["path"]) 
-                          if os.path.isdir(os.path.join(item["path"], d))]
-            print(f"Found seasons directories: {real_seasons}")
-
-            # --- SPECIAL CASE: Було лише один сезон, і його просто перемістили у підпапку ---
-            if (
-                len(item["seasons"]) == 1 and
-                item["seasons"][0].get("title") == "Season 1" and
-                len(real_seasons) > 1
-            ):
-                # Просто оновлюємо title і path першого сезону, не чіпаючи files
-                item["seasons"][0]["title"] = real_seasons[0]
-                item["seasons"][0]["path"] = os.path.join(item["path"], real_seasons[0])
-                # Якщо з'явилися ще сезони — додаємо їх як нові
-                for season_name in real_seasons[1:]:
-                    season_path = os.path.join(item["path"], season_name)
-                    files = [{"name": f} for f in os.listdir(season_path) if os.path.isfile(os.path.join(season_path, f))]
-                    item["seasons"].append({
-                        "title": season_name,
-                        "path": season_path,
-                        "files": files
-                    })
-                item["last_modified"] = datetime.now().isoformat()
-                save_metadata(metadata)
-                return True, "Season path updated without losing metadata"
-
-            # Словник існуючих сезонів для збереження метаданих
-            existing_seasons = {s["title"]: s for s in item["seasons"]}
-            item["seasons"] = []
-            
-            # Для кожної реальної папки сезону
-            for season_name in real_seasons:
-                season_path = os.path.join(item["path"], season_name)
-                # Беремо існуючий сезон або створюємо новий
-                season = existing_seasons.get(season_name, {"title": season_name})
-                season["path"] = season_path
-                
-                # Зберігаємо існуючі метадані файлів
-                existing_files = {f["name"]: f for f in season.get("files", [])}
-                season["files"] = []
-                
-                # Оновлюємо файли
-                for file in os.listdir(season_path):
-                    if os.path.isfile(os.path.join(season_path, file)):
-                        # Зберігаємо існуючі метадані файлу або створюємо нові
-                        file_data = existing_files.get(file, {})
-                        file_data["name"] = file
-                        season["files"].append(file_data)
-                
-                item["seasons"].append(season)
-                print(f"Updated season {season_name} with {len(season['files'])} files")
-
-            # Додаємо "Season 1", якщо підпапок немає (усі файли у корені)
-            if not real_seasons:
-                season = existing_seasons.get("Season 1", {"title": "Season 1"})
-                season["path"] = item["path"]
-                existing_files = {f["name"]: f for f in season.get("files", [])}
-                season["files"] = []
-                for file in os.listdir(item["path"]):
-                    if os.path.isfile(os.path.join(item["path"], file)):
-                        file_data = existing_files.get(file, {})
-                        file_data["name"] = file
-                        season["files"].append(file_data)
-                item["seasons"].append(season)
-                print(f"Added Season 1 with {len(season['files'])} files")
-    
-        elif item["type"] == "collection":
-            # Оновлюємо шляхи для фільму/колекції
-            item["parts"] = [
-                {
-                    "title": file,
-                    "path": os.path.join(item["path"], file)
-                }
-                for file in os.listdir(item["path"])
-                if os.path.isfile(os.path.join(item["path"], file))
-            ]
-        
-        item["last_modified"] = datetime.now().isoformat()
-        save_metadata(metadata)
-        return True, "Paths updated successfully"
-        
-    except Exception as e:
-        return False, f"Error updating paths: {str(e)}"
+    def mutation(current, index):
+        item, category = find_metadata_item(current, item_id=item_id)
+        if not item or not os.path.exists(item["path"]):
+            return (False, "Item not found or path doesn't exist"), [], []
+        try:
+            item, message = refresh_item_copy(current, item, category)
+        except Exception as e:
+            return (False, f"Error updating paths: {str(e)}"), [], []
+        return (True, message), [item], []
+
+    return mutate_metadata(mutation)
 
 def find_metadata_item(metadata, item_id=None, path=None):
     # Пошук запису за id або шляхом у метаданих.
+    index = store.index
+    if index is not None and index.metadata is metadata:
+        # Документ зі сховища - шукаємо через хеш-індекс
+        if item_id:
+            item, category = index.get_item(item_id, categories=["series", "movies"])
+            if item:
+                return item, category
+        if path:
+            return index.get_item_by_path(path, categories=["series", "movies"])
+        return None, None
+
     for category in ["series", "movies"]:
         for item in metadata[category]:
             if (item_id and item["id"] == item_id) or (path and os.path.normpath(item["path"]) == os.path.normpath(path)):
                 return item, category
     return None, None
 
-def create_series_metadata(directory, path):
+def retag_items(index, source_tags, target_tag=None):
+    """
+    Замінює теги `source_tags` на `target_tag` в усіх записах бібліотеки
+    (перейменування, злиття) або видаляє їх, якщо `target_tag` не задано.
+
+    Parameters:
+        index (MetadataIndex): Індекс поточного документа.
+        source_tags (list): Теги, які потрібно замінити.
+        target_tag (str, optional): Новий тег.
+
+    Returns:
+        list: Змінені записи.
+    """
+    affected_ids = {}
+    for tag in source_tags:
+        for item_id in index.items_with_tag(tag):
+            affected_ids[item_id] = None
+
+    changed = []
+    for item_id in affected_ids:
+        item, _ = index.get_item(item_id)
+        tags = []
+        for tag in item.get("tags", []):
+            new_tag = target_tag if tag in source_tags else tag
+            if new_tag and new_tag not in tags:
+                tags.append(new_tag)
+        item["tags"] = tags
+        item["last_modified"] = datetime.now().isoformat()
+        item["auto_added"] = False
+        changed.append(item)
+    return changed
+
+CATALOG_DEFAULT_FIELDS = ["id", "title", "type", "tags", "thumbnail"]
+
+def catalog_entry(item, category, fields):
+    """
+    Повертає проєкцію запису для каталогу лише з вказаними полями.
+
+    Крім полів самого запису, підтримуються обчислювані поля:
+        thumbnail - URL мініатюри (або image_url для онлайн-серіалів);
+        category - розділ бібліотеки;
+        partsCount - кількість сезонів або частин.
+    """
+    entry = {}
+    for field in fields:
+        if field == "thumbnail":
+            if item.get("type") == "online_series":
+                entry["thumbnail"] = item.get("image_url")
+            else:
+                entry["thumbnail"] = f"{BASE_URL}/api/thumbnail?folder_name={quote(item.get('path') or '')}"
+        elif field == "category":
+            entry["category"] = category
+        elif field == "partsCount":
+            entry["partsCount"] = len(item.get("seasons") or item.get("parts") or [])
+        elif field in item:
+            entry[field] = item[field]
+    return entry
+
+def list_directory(path):
+    """
+    Повертає вміст директорії одним проходом os.scandir, використовуючи
+    закешовані в DirEntry дані про тип замість окремих викликів stat.
+
+    Returns:
+        tuple: (список DirEntry піддиректорій, список імен файлів).
+    """
+    dirs = []
+    files = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                dirs.append(entry)
+            elif entry.is_file():
+                files.append(entry.name)
+    return dirs, files
+
+def list_seasons(path):
+    """
+    Будує список сезонів серіалу: кожна підпапка - сезон, або "Season 1" з файлами
+    з кореня, якщо підпапок немає.
+    """
+    dirs, root_files = list_directory(path)
     seasons = []
-    subitems = os.listdir(path)
-    for subdir in subitems:
-        subpath = os.path.join(path, subdir)
-        if os.path.isdir(subpath):
-            seasons.append({
-                "title": subdir,
-                "path": subpath,
-                "files": [{"name": file} for file in os.listdir(subpath) if os.path.isfile(os.path.join(subpath, file))]
-            })
+    for entry in dirs:
+        _, files = list_directory(entry.path)
+        seasons.append({
+            "title": entry.name,
+            "path": os.path.join(path, entry.name),
+            "files": [{"name": file} for file in files]
+        })
     if not seasons:  # Якщо немає підпапок, створити "Season 1"
         seasons.append({
             "title": "Season 1",
             "path": path,
-            "files": [{"name": file} for file in os.listdir(path) if os.path.isfile(os.path.join(path, file))]
+            "files": [{"name": file} for file in root_files]
         })
+    return seasons
+
+def create_series_metadata(directory, path):
+    seasons = list_seasons(path)
     return {
         "id": str(uuid.uuid4()),
         "title": directory,
@@ -162,15 +298,8 @@ def create_movie_metadata(directory, path):
                 }
             ]
         }
-    parts = []
-    subitems = os.listdir(path)
-    for subdir in subitems:
-        subpath = os.path.join(path, subdir)
-        if os.path.isfile(subpath):
-            parts.append({
-                "title": subdir,
-                "path": subpath
-            })
+    _, files = list_directory(path)
+    parts = [{"title": file, "path": os.path.join(path, file)} for file in files]
     if not parts:  # Якщо немає файлів, пропускаємо
         return None
     return {
@@ -185,175 +314,307 @@ def create_movie_metadata(directory, path):
     }
 
 def clean_outdated_metadata(metadata):
+    # Записи з непідключених дисків чи недоступних коренів лишаються (див. library_paths.source_state)
     # Очищення серіалів
     metadata["series"] = [
         item for item in metadata["series"]
-        if not item.get("auto_added", False) or os.path.exists(item["path"])
+        if not item.get("auto_added", False) or source_state(item["path"]) != "missing"
     ]
 
     # Очищення фільмів
     metadata["movies"] = [
         item for item in metadata["movies"]
-        if not item.get("auto_added", False) or os.path.exists(item["path"])
+        if not item.get("auto_added", False) or source_state(item["path"]) != "missing"
     ]
     return metadata
 
 def load_metadata():
-    if os.path.exists(METADATA_FILE):
-        try:
-            with open(METADATA_FILE, 'r', encoding='utf-8') as file:
-                return json.load(file)
-        except (json.JSONDecodeError, ValueError):
-            return {"series": [], "movies": []}
-    return {"series": [], "movies": []}
+    """
+    Повертає спільний закешований документ метаданих (див. metadata_store).
+    """
+    return store.get()
+
+def mutate_metadata(mutation, timeout=None):
+    """
+    Виконує зміну метаданих через єдиний записувач (див. metadata_writer):
+    зміни застосовуються по черзі, а збереження групуються.
 
-def save_metadata(metadata):
-    with open(METADATA_FILE, 'w', encoding='utf-8') as file:
-        json.dump(metadata, file, ensure_ascii=False, indent=4)
+    Parameters:
+        mutation (function): `mutation(metadata, index)` -> (результат, змінені записи, id видалених).
+        timeout (float, optional): Максимальний час очікування в секундах.
 
-def auto_add_metadata(metadata, force_update=False):
+    Returns:
+        Результат функції зміни.
     """
-    Оновлює метадані для серіалів і фільмів.
+    return writer.submit(mutation, timeout)
+
+def load_metadata_validators():
     """
-    metadata = clean_outdated_metadata(metadata)
+    Повертає (ETag, Last-Modified, номер версії) поточної версії метаданих.
+    """
+    return store.validators()
 
-    # Обробка серіалів
-    metadata["series"] = process_metadata(
-        SERIES_PATHS,
-        metadata["series"],
-        create_series_metadata,
-        update_series_metadata,
-        force_update
-    )
-
-    # Обробка фільмів
-    metadata["movies"] = process_metadata(
-        MOVIES_PATHS,
-        metadata["movies"],
-        create_movie_metadata,
-        update_movie_metadata,
-        force_update
-    )
+def load_metadata_index():
+    """
+    Повертає хеш-індекс закешованого документа (сам документ - `index.metadata`).
+    """
+    return store.get_index()
 
-    return metadata
+def load_search_index():
+    """
+    Повертає пошуковий індекс закешованого документа (див. search_index).
+    """
+    return store.get_search_index()
 
-def update_metadata_item(existing_item, directory, path, subitem_key, subitem_creator_fn):
+def save_metadata(metadata, changed=None, deleted=None):
     """
-    Оновлює запис метаданих для серіалу чи фільму.
+    Зберігає метадані. Якщо відомо, які записи змінились (`changed`) чи були
+    видалені (`deleted`, список id), сховище може записати лише їх.
+    """
+    store.save(metadata, changed=changed, deleted=deleted)
 
-    Parameters:
-        existing_item (dict): Існуючий запис метаданих.
-        directory (str): Назва директорії.
-        path (str): Шлях до елемента.
-        subitem_key (str): Ключ для піделементів ("seasons" чи "parts").
-        subitem_creator_fn (function): Функція для створення піделементів.
+def auto_add_metadata(metadata, force_update=False, scan_state=None, timings=None):
+    """
+    Оновлює метадані для серіалів і фільмів.
 
-    Returns:
-        dict: Оновлений запис метаданих.
+    Parameters:
+        metadata (dict): Документ метаданих.
+        force_update (bool): Примусово оновити всі записи.
+        scan_state (dict, optional): Знімки директорій. Якщо передано, словник
+            оновлюється на місці і зберігати його має викликач; інакше знімки
+            читаються з SCAN_STATE_FILE і записуються туди ж.
+        timings (list, optional): Сюди додається час сканування кожного кореня.
     """
-    existing_item["last_modified"] = datetime.now().isoformat()
-    existing_item[subitem_key] = []
-
-    # Створення піделементів (сезонів або частин)
-    for subdir in os.listdir(path):
-        subpath = os.path.join(path, subdir)
-        if subitem_creator_fn(subpath):
-            existing_item[subitem_key].append({
-                "title": subdir,
-                "path": subpath,
-                "files": [{"name": file} for file in os.listdir(subpath) if os.path.isfile(os.path.join(subpath, file))]
-            })
-
-    # Додати "Season 1" або залишити порожнім, якщо немає піделементів
-    if not existing_item[subitem_key] and subitem_key == "seasons":
-        existing_item[subitem_key].append({
-            "title": "Season 1",
-            "path": path,
-            "files": [{"name": file} for file in os.listdir(path) if os.path.isfile(os.path.join(path, file))]
-        })
+    persist_state = scan_state is None
+    previous_state = load_scan_state() if persist_state else dict(scan_state)
+    new_state = {}
 
-    return existing_item
+    metadata = clean_outdated_metadata(metadata)
+
+    # Обробка серіалів і фільмів: кожен фізичний диск - окремий потік
+    roots = [("series", path) for path in SERIES_PATHS] + [("movies", path) for path in MOVIES_PATHS]
+    scanned = scan_roots_parallel(roots, metadata, force_update, previous_state, new_state, timings)
+    metadata["series"] = scanned["series"]
+    metadata["movies"] = scanned["movies"]
+
+    if persist_state:
+        save_scan_state(new_state)
+    else:
+        scan_state.clear()
+        scan_state.update(new_state)
+
+    return metadata
 
 def update_movie_metadata(existing_item, directory, path):
     existing_item["last_modified"] = datetime.now().isoformat()
-    existing_item["parts"] = []
 
     # Додаємо частини
-    for subdir in os.listdir(path):
-        subpath = os.path.join(path, subdir)
-        if os.path.isfile(subpath):
-            existing_item["parts"].append({
-                "title": subdir,
-                "path": subpath
-            })
+    _, files = list_directory(path)
+    existing_item["parts"] = [{"title": file, "path": os.path.join(path, file)} for file in files]
 
     return existing_item
 
 def update_series_metadata(existing_item, directory, path):
     existing_item["last_modified"] = datetime.now().isoformat()
-    existing_item["seasons"] = []
-
-    # Додаємо сезони
-    for subdir in os.listdir(path):
-        subpath = os.path.join(path, subdir)
-        if os.path.isdir(subpath):
-            existing_item["seasons"].append({
-                "title": subdir,
-                "path": subpath,
-                "files": [{"name": file} for file in os.listdir(subpath) if os.path.isfile(os.path.join(subpath, file))]
-            })
-
-    # Якщо немає сезонів, додаємо "Season 1"
-    if not existing_item["seasons"]:
-        existing_item["seasons"].append({
-            "title": "Season 1",
-            "path": path,
-            "files": [{"name": file} for file in os.listdir(path) if os.path.isfile(os.path.join(path, file))]
-        })
+
+    # Додаємо сезони (або "Season 1", якщо підпапок немає)
+    existing_item["seasons"] = list_seasons(path)
 
     return existing_item
 
-def process_metadata(root_paths, existing_metadata, create_metadata_fn, update_metadata_fn, force_update):
+# Категорія -> (створення запису, оновлення запису) для сканування
+SCAN_HANDLERS = {
+    "series": (create_series_metadata, update_series_metadata),
+    "movies": (create_movie_metadata, update_movie_metadata),
+}
+
+def directory_fingerprint(path, entry=None):
+    """
+    Знімок часу модифікації директорії запису та її безпосередніх підпапок (сезонів).
+    Додавання чи видалення сезону змінює mtime самої директорії, а зміна файлів
+    сезону - mtime підпапки.
     """
-    Загальна функція для обробки серіалів і фільмів.
+    stat = entry.stat() if entry is not None else os.stat(path)
+    dirs, _ = list_directory(path)
+    return {
+        "mtime": stat.st_mtime_ns,
+        "children": {child.name: child.stat().st_mtime_ns for child in dirs}
+    }
 
-    Parameters:
-        root_paths (list): Шляхи до кореневих папок.
-        existing_metadata (list): Поточний список метаданих.
-        create_metadata_fn (function): Функція для створення нового запису.
-        update_metadata_fn (function): Функція для оновлення існуючого запису.
-        force_update (bool): Прапорець для примусового оновлення метаданих.
+def is_directory_unchanged(path, entry, recorded):
     """
-    updated_metadata = []
+    Перевіряє, чи директорія не змінилась з моменту збереженого знімка, без її лістингу.
+    """
+    if not recorded or entry.stat().st_mtime_ns != recorded.get("mtime"):
+        return False
+    for name, mtime in recorded.get("children", {}).items():
+        try:
+            if os.stat(os.path.join(path, name)).st_mtime_ns != mtime:
+                return False
+        except OSError:
+            return False
+    return True
+
+def load_scan_state():
+    """
+    Завантажує збережені знімки mtime директорій з попереднього сканування.
+    """
+    if os.path.exists(SCAN_STATE_FILE):
+        try:
+            with open(SCAN_STATE_FILE, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (json.JSONDecodeError, ValueError, OSError):
+            return {}
+    return {}
+
+def save_scan_state(scan_state):
+    with open(SCAN_STATE_FILE, 'w', encoding='utf-8') as file:
+        json.dump(scan_state, file, ensure_ascii=False)
+
+def paths_lookup(existing_metadata):
+    # Словник шлях -> запис замість лінійного пошуку для кожної директорії
+    items_by_path = {}
+    for item in existing_metadata:
+        items_by_path.setdefault(os.path.normpath(item["path"]), item)
+    return items_by_path
+
+def scan_root(root_path, items_by_path, create_metadata_fn, update_metadata_fn, force_update, scan_state, new_scan_state):
+    """
+    Сканує один кореневий каталог.
 
-    for root_path in root_paths:
-        if os.path.exists(root_path):
-            for root, dirs, files in os.walk(root_path):
-                for directory in dirs:
-                    path = os.path.join(root, directory)
-
-                    # Перевіряємо, чи запис уже існує
-                    existing_item = next(
-                        (item for item in existing_metadata if os.path.normpath(item["path"]) == os.path.normpath(path)),
-                        None
-                    )
-
-                    if existing_item:
-                        if force_update or existing_item["auto_added"]:
-                            # Оновлення існуючого запису
-                            updated_metadata.append(update_metadata_fn(existing_item, directory, path))
-                        else:
-                            updated_metadata.append(existing_item)
-                    else:
-                        # Додавання нового запису
-                        updated_metadata.append(create_metadata_fn(directory, path))
-
-                # Якщо є файли (для фільмів)
-                for file in files:
-                    path = os.path.join(root, file)
-                    if os.path.isfile(path) and not any(os.path.normpath(item["path"]) == os.path.normpath(path) for item in existing_metadata):
-                        updated_metadata.append(create_metadata_fn(file, path))
-
-                break  # Розглядаємо тільки верхній рівень директорій
+    Директорії записів, які не змінились з попереднього сканування (за знімком
+    mtime у `scan_state`), пропускаються без лістингу.
+
+    Returns:
+        list: Записи, знайдені в корені, у порядку обходу.
+    """
+    updated_metadata = []
+    if not os.path.exists(root_path):
+        return updated_metadata
+    with os.scandir(root_path) as entries:
+        entries = list(entries)
+
+    for entry in entries:
+        path = os.path.join(root_path, entry.name)
+        key = os.path.normpath(path)
+        existing_item = items_by_path.get(key)
+
+        if entry.is_dir():
+            if existing_item:
+                if force_update or existing_item["auto_added"]:
+                    recorded = scan_state.get(key)
+                    if not force_update and is_directory_unchanged(path, entry, recorded):
+                        # Директорія не змінилась - запис актуальний
+                        new_scan_state[key] = recorded
+                        updated_metadata.append(existing_item)
+                        continue
+                    # Оновлення існуючого запису
+                    updated_metadata.append(update_metadata_fn(existing_item, entry.name, path))
+                else:
+                    updated_metadata.append(existing_item)
+                    continue
+            else:
+                # Додавання нового запису
+                new_item = create_metadata_fn(entry.name, path)
+                if new_item is None:
+                    continue
+                updated_metadata.append(new_item)
+            new_scan_state[key] = directory_fingerprint(path, entry)
+
+        # Якщо є файли (для фільмів)
+        elif entry.is_file():
+            if existing_item:
+                # Наявний запис окремого файлу лишається як є
+                updated_metadata.append(existing_item)
+            else:
+                new_item = create_metadata_fn(entry.name, path)
+                if new_item is not None:
+                    updated_metadata.append(new_item)
 
     return updated_metadata
+
+def group_roots_by_device(roots):
+    """
+    Групує корені за пристроєм (st_dev), на якому вони розташовані.
+    Недоступні корені пропускаються.
+
+    Parameters:
+        roots (list): Пари (категорія, шлях кореня).
+
+    Returns:
+        list: Списки пар для кожного пристрою, у порядку першої появи.
+    """
+    groups = {}
+    for category, root_path in roots:
+        try:
+            device = os.stat(root_path).st_dev
+        except OSError:
+            continue
+        groups.setdefault(device, []).append((category, root_path))
+    return list(groups.values())
+
+def scan_roots_parallel(roots, metadata, force_update, scan_state, new_scan_state, timings=None):
+    """
+    Сканує корені різних пристроїв паралельно, а корені одного пристрою - послідовно
+    (щоб не змушувати один диск обслуговувати кілька обходів одночасно).
+
+    Parameters:
+        roots (list): Пари (категорія, шлях кореня) у порядку з конфігурації.
+        metadata (dict): Документ метаданих (записи оновлюються на місці).
+        force_update (bool): Примусово оновити всі записи.
+        scan_state (dict): Знімки директорій з попереднього сканування.
+        new_scan_state (dict): Сюди записуються знімки поточного сканування.
+        timings (list, optional): Сюди додається час сканування кожного кореня.
+
+    Returns:
+        dict: категорія -> список записів, зібраний у порядку коренів з `roots`.
+    """
+    lookups = {category: paths_lookup(metadata.get(category, [])) for category in SCAN_HANDLERS}
+
+    def scan_device(group):
+        results = []
+        for category, root_path in group:
+            create_fn, update_fn = SCAN_HANDLERS[category]
+            root_state = {}
+            started = time.monotonic()
+            items = scan_root(
+                root_path, lookups[category], create_fn, update_fn,
+                force_update, scan_state, root_state
+            )
+            results.append(((category, root_path), items, root_state, {
+                "category": category,
+                "root": root_path,
+                "items": len(items),
+                "seconds": round(time.monotonic() - started, 3),
+            }))
+        return results
+
+    groups = group_roots_by_device(roots)
+    by_root = {}
+    if groups:
+        with ThreadPoolExecutor(max_workers=min(len(groups), SCAN_MAX_WORKERS)) as executor:
+            for results in executor.map(scan_device, groups):
+                for root_key, items, root_state, timing in results:
+                    by_root[root_key] = (items, root_state, timing)
+
+    # Детерміноване злиття: у порядку коренів з конфігурації, незалежно від того,
+    # який диск відповів першим
+    merged = {category: [] for category in SCAN_HANDLERS}
+    for root_key in roots:
+        if root_key not in by_root:
+            continue
+        items, root_state, timing = by_root[root_key]
+        merged[root_key[0]].extend(items)
+        new_scan_state.update(root_state)
+        if timings is not None:
+            timings.append(timing)
+
+    # Недоступні корені не скануються, тож їхні записи переносяться без змін,
+    # а не зникають до наступного підключення диска
+    for category, items in merged.items():
+        kept = {id(item) for item in items}
+        items.extend(
+            item for item in metadata.get(category, [])
+            if id(item) not in kept and source_state(item["path"]) == "unavailable"
+        )
+    return merged
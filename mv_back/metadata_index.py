@@ -0,0 +1,196 @@
+import os
+import bisect
+
+INDEXED_CATEGORIES = ["series", "movies", "online_series"]
+
+# Ключі сортування каталогу: назва поля -> функція ключа
+SORT_KEYS = {
+    "title": lambda item: (item.get("title") or "").lower(),
+    "last_modified": lambda item: item.get("last_modified") or "",
+}
+
+
+def normalize_path(path):
+    return os.path.normpath(path) if path else None
+
+
+class MetadataIndex:
+    """
+    Хеш-індекси над документом метаданих.
+
+    Відображає id і нормалізовані шляхи безпосередньо на записи, сезони та файли,
+    а теги - на множини id записів (інвертований індекс), тож пошук не потребує
+    обходу всієї бібліотеки. Для кожного запису пам'ятаються ключі, які він додав,
+    щоб при зміні чи видаленні переіндексувати лише його.
+
+    Порядки сортування каталогу обчислюються один раз і скидаються лише тоді,
+    коли змінюється ключ сортування чи склад категорії.
+    """
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.items_by_id = {}
+        self.items_by_path = {}
+        self.seasons_by_path = {}
+        self.files_by_key = {}
+        self.files_by_path = {}
+        self.tags = {}  # тег -> {id запису: None} (впорядкована множина)
+        self._keys_by_id = {}
+        self._tags_by_id = {}
+        self._sort_keys_by_id = {}
+        self._sort_orders = {}
+        self.rebuild()
+
+    def rebuild(self):
+        self.items_by_id.clear()
+        self.items_by_path.clear()
+        self.seasons_by_path.clear()
+        self.files_by_key.clear()
+        self.files_by_path.clear()
+        self.tags.clear()
+        self._keys_by_id.clear()
+        self._tags_by_id.clear()
+        self._sort_keys_by_id.clear()
+        self._sort_orders.clear()
+        for category in INDEXED_CATEGORIES:
+            for item in self.metadata.get(category, []):
+                self._add_item(item, category)
+
+    def _put(self, table, key, value, keys):
+        # Як і лінійний пошук, віддаємо перевагу першому збігу
+        if key is not None and key not in table:
+            table[key] = value
+            keys.append((table, key))
+
+    def _add_item(self, item, category):
+        keys = []
+        self._put(self.items_by_id, item.get("id"), (item, category), keys)
+        self._put(self.items_by_path, normalize_path(item.get("path")), (item, category), keys)
+        for season in item.get("seasons", []) if category == "series" else []:
+            season_path = normalize_path(season.get("path"))
+            if not season_path:
+                continue
+            self._put(self.seasons_by_path, season_path, (item, season), keys)
+            for file in season.get("files", []):
+                record = (item, season, file)
+                self._put(self.files_by_key, (season_path, file.get("name")), record, keys)
+                self._put(self.files_by_path, normalize_path(os.path.join(season["path"], file["name"])), record, keys)
+        self._keys_by_id[item.get("id")] = keys
+
+        item_tags = list(dict.fromkeys(item.get("tags") or []))
+        for tag in item_tags:
+            self.tags.setdefault(tag, {})[item.get("id")] = None
+        self._tags_by_id[item.get("id")] = item_tags
+        self._sort_keys_by_id[item.get("id")] = self._sort_signature(item, category)
+
+    def _sort_signature(self, item, category):
+        return (category,) + tuple(key_fn(item) for key_fn in SORT_KEYS.values())
+
+    def _drop_keys(self, item_id):
+        for table, key in self._keys_by_id.pop(item_id, []):
+            table.pop(key, None)
+        for tag in self._tags_by_id.pop(item_id, []):
+            tagged = self.tags.get(tag)
+            if tagged is not None:
+                tagged.pop(item_id, None)
+                if not tagged:
+                    del self.tags[tag]
+
+    def reindex_item(self, item, category):
+        """
+        Оновлює індекси після зміни (або додавання) одного запису.
+        """
+        previous = self._sort_keys_by_id.get(item.get("id"))
+        self._drop_keys(item.get("id"))
+        self._add_item(item, category)
+        if previous != self._sort_keys_by_id[item.get("id")]:
+            self._sort_orders.clear()
+
+    def remove_item(self, item_id):
+        self._drop_keys(item_id)
+        if self._sort_keys_by_id.pop(item_id, None) is not None:
+            self._sort_orders.clear()
+
+    def sort_order(self, categories, sort_field):
+        """
+        Повертає відсортований за зростанням список [(ключ, id)] записів вказаних категорій.
+        Список кешується до наступної зміни, що впливає на порядок.
+        """
+        cache_key = (tuple(categories), sort_field)
+        order = self._sort_orders.get(cache_key)
+        if order is None:
+            key_fn = SORT_KEYS[sort_field]
+            order = sorted(
+                (key_fn(item), item.get("id"))
+                for category in categories
+                for item in self.metadata.get(category, [])
+            )
+            self._sort_orders[cache_key] = order
+        return order
+
+    def page(self, categories, sort_field, descending=False, after=None, limit=50):
+        """
+        Повертає сторінку каталогу для курсорної пагінації.
+
+        Parameters:
+            categories (list): Категорії, що входять у каталог.
+            sort_field (str): Ключ сортування (див. SORT_KEYS).
+            descending (bool): Зворотний порядок.
+            after (tuple, optional): (ключ, id) останнього запису попередньої сторінки.
+            limit (int): Розмір сторінки.
+
+        Returns:
+            tuple: (список (item, category), позиція для наступного курсора або None, загальна кількість).
+        """
+        order = self.sort_order(categories, sort_field)
+        if descending:
+            end = bisect.bisect_left(order, tuple(after)) if after else len(order)
+            window = order[max(0, end - limit):end][::-1]
+            has_more = end - limit > 0
+        else:
+            start = bisect.bisect_right(order, tuple(after)) if after else 0
+            window = order[start:start + limit]
+            has_more = start + limit < len(order)
+
+        entries = [self.items_by_id[item_id] for _, item_id in window if item_id in self.items_by_id]
+        next_after = window[-1] if window and has_more else None
+        return entries, next_after, len(order)
+
+    def get_item(self, item_id, categories=None):
+        item, category = self.items_by_id.get(item_id, (None, None))
+        if item is None or (categories and category not in categories):
+            return None, None
+        return item, category
+
+    def get_item_by_path(self, path, categories=None):
+        item, category = self.items_by_path.get(normalize_path(path), (None, None))
+        if item is None or (categories and category not in categories):
+            return None, None
+        return item, category
+
+    def get_season(self, season_path):
+        """
+        Returns:
+            tuple: (series, season) або (None, None).
+        """
+        return self.seasons_by_path.get(normalize_path(season_path), (None, None))
+
+    def get_file(self, season_path, name):
+        """
+        Returns:
+            tuple: (series, season, file) або (None, None, None).
+        """
+        return self.files_by_key.get((normalize_path(season_path), name), (None, None, None))
+
+    def list_tags(self):
+        return list(self.tags)
+
+    def items_with_tag(self, tag):
+        """
+        Returns:
+            list: Id записів із вказаним тегом.
+        """
+        return list(self.tags.get(tag, {}))
+
+    def get_file_by_path(self, video_path):
+        return self.files_by_path.get(normalize_path(video_path), (None, None, None))
@@ -0,0 +1,188 @@
+from datetime import datetime
+
+
+class OperationError(Exception):
+    """
+    Помилка перевірки чи застосування однієї операції пакета.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _require(op, field, types, allow_empty=False):
+    value = op.get(field)
+    if value is None or (not allow_empty and value in ("", [])):
+        raise OperationError(f"Field `{field}` is required")
+    if not isinstance(value, types):
+        raise OperationError(f"Field `{field}` has an invalid type")
+    return value
+
+
+def _validate_tag(op):
+    ids = _require(op, "ids", list)
+    if not all(isinstance(item_id, str) for item_id in ids):
+        raise OperationError("Field `ids` must be a list of strings")
+    _require(op, "tag", str)
+
+
+def _validate_time_to_skip(op):
+    _require(op, "path", str)
+    _require(op, "name", str)
+    _require(op, "timeToSkip", list)
+
+
+def _validate_audio_track(op):
+    _require(op, "path", str)
+    _require(op, "name", str)
+    _require(op, "trackIndex", int)
+
+
+def _resolve_items(op, index):
+    items = []
+    for item_id in dict.fromkeys(op["ids"]):
+        item, _ = index.get_item(item_id, categories=["series", "movies"])
+        if item is None:
+            raise OperationError(f"Item {item_id} not found", 404)
+        items.append(item)
+    return items
+
+
+def _resolve_file(op, index):
+    series, _, file = index.get_file(op["path"], op["name"])
+    if file is None:
+        raise OperationError("File not found in metadata", 404)
+    return series, file
+
+
+def _prepare_add_tag(op, index):
+    items = _resolve_items(op, index)
+
+    def apply():
+        updated = []
+        for item in items:
+            tags = item.setdefault("tags", [])
+            if op["tag"] not in tags:
+                tags.append(op["tag"])
+                item["last_modified"] = datetime.now().isoformat()
+                item["auto_added"] = False
+                updated.append(item)
+        return {"updated": len(updated)}, updated
+    return apply
+
+
+def _prepare_remove_tag(op, index):
+    items = _resolve_items(op, index)
+
+    def apply():
+        updated = []
+        for item in items:
+            if op["tag"] in item.get("tags", []):
+                item["tags"] = [tag for tag in item["tags"] if tag != op["tag"]]
+                item["last_modified"] = datetime.now().isoformat()
+                updated.append(item)
+        return {"updated": len(updated)}, updated
+    return apply
+
+
+def _prepare_time_to_skip(op, index):
+    series, file = _resolve_file(op, index)
+
+    def apply():
+        file["timeToSkip"] = op["timeToSkip"]
+        series["auto_added"] = False  # Позначення серіалу як вручну зміненого
+        return {"updated": 1}, [series]
+    return apply
+
+
+def _prepare_bulk_time_to_skip(op, index):
+    series, season = index.get_season(op["path"])
+    files = season.get("files", []) if season else []
+    names = [file.get("name") for file in files]
+    if op["name"] not in names:
+        raise OperationError("File not found in metadata", 404)
+    # Оновлюються всі епізоди сезону, починаючи з вказаного (включно)
+    targets = files[names.index(op["name"]):]
+
+    def apply():
+        for file in targets:
+            file["timeToSkip"] = op["timeToSkip"]
+        series["auto_added"] = False
+        return {"updated": len(targets)}, [series]
+    return apply
+
+
+def _prepare_audio_track(op, index):
+    series, file = _resolve_file(op, index)
+
+    def apply():
+        file["preferredAudioTrack"] = op["trackIndex"]
+        series["auto_added"] = False
+        return {"updated": 1}, [series]
+    return apply
+
+
+# Тип операції -> (структурна перевірка, пошук цілей з поверненням функції застосування)
+OPERATIONS = {
+    "add_tag": (_validate_tag, _prepare_add_tag),
+    "remove_tag": (_validate_tag, _prepare_remove_tag),
+    "set_time_to_skip": (_validate_time_to_skip, _prepare_time_to_skip),
+    "bulk_time_to_skip": (_validate_time_to_skip, _prepare_bulk_time_to_skip),
+    "set_audio_track": (_validate_audio_track, _prepare_audio_track),
+}
+
+
+def validate_operations(operations):
+    """
+    Структурна перевірка пакета без доступу до метаданих.
+
+    Returns:
+        list: Помилки у форматі {"index", "type", "message", "status"}; порожній, якщо все гаразд.
+    """
+    errors = []
+    for position, op in enumerate(operations):
+        op_type = op.get("type") if isinstance(op, dict) else None
+        try:
+            if op_type not in OPERATIONS:
+                raise OperationError(f"Unknown operation type: {op_type}")
+            OPERATIONS[op_type][0](op)
+        except OperationError as e:
+            errors.append({"index": position, "type": op_type, "message": str(e), "status": e.status})
+    return errors
+
+
+def batch_mutation(operations):
+    """
+    Будує зміну для записувача, яка застосовує пакет атомарно: спершу для всіх
+    операцій знаходяться цілі в індексі, і лише якщо жодна не завершилась
+    помилкою, операції застосовуються по черзі.
+
+    Parameters:
+        operations (list): Структурно перевірені операції.
+
+    Returns:
+        function: `mutation(metadata, index)` для `mutate_metadata`; її результат -
+        (True, результати операцій) або (False, помилки).
+    """
+    def mutation(metadata, index):
+        plans = []
+        errors = []
+        for position, op in enumerate(operations):
+            try:
+                plans.append(OPERATIONS[op["type"]][1](op, index))
+            except OperationError as e:
+                errors.append({"index": position, "type": op["type"], "message": str(e), "status": e.status})
+        if errors:
+            return (False, errors), [], []
+
+        results = []
+        changed = {}
+        for position, (op, apply) in enumerate(zip(operations, plans)):
+            result, items = apply()
+            results.append({"index": position, "type": op["type"], "status": "success", **result})
+            for item in items:
+                changed[item.get("id")] = item
+        return (True, results), list(changed.values()), []
+
+    return mutation
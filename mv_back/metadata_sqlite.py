@@ -0,0 +1,397 @@
+import sys
+import json
+import sqlite3
+import threading
+
+# Та сама модель, що й у transfer_db.py (Media → MediaUnit → Episode → TimeToSkip, Tag → MediaTag),
+# доповнена службовими колонками для повного відтворення JSON-документа:
+#   category  - розділ документа (series / movies / online_series)
+#   position  - порядок у списку
+#   extra     - JSON з полями, які не мають окремої колонки, і порядком ключів
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Media (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    path TEXT,
+    auto_added INTEGER NOT NULL DEFAULT 0,
+    last_modified TEXT,
+    type TEXT,
+    category TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS IX_Media_category ON Media(category, position);
+-- Пошук за шляхом обслуговує індекс у пам'яті; індекси шляхів старих баз не потрібні
+DROP INDEX IF EXISTS IX_Media_path_key;
+DROP INDEX IF EXISTS IX_MediaUnit_path_key;
+
+CREATE TABLE IF NOT EXISTS MediaUnit (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    media_id TEXT NOT NULL REFERENCES Media(id) ON DELETE CASCADE,
+    title TEXT,
+    path TEXT,
+    has_episodes INTEGER NOT NULL DEFAULT 0,
+    unit_type TEXT,
+    position INTEGER NOT NULL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS IX_MediaUnit_media ON MediaUnit(media_id, position);
+
+CREATE TABLE IF NOT EXISTS Episode (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    media_unit_id INTEGER NOT NULL REFERENCES MediaUnit(id) ON DELETE CASCADE,
+    name TEXT,
+    position INTEGER NOT NULL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS IX_Episode_unit ON Episode(media_unit_id, name);
+
+CREATE TABLE IF NOT EXISTS TimeToSkip (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    episode_id INTEGER NOT NULL REFERENCES Episode(id) ON DELETE CASCADE,
+    start_time,  -- без типу: значення зберігаються як є (у JSON трапляються і числа, і рядки)
+    end_time,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_TimeToSkip_episode ON TimeToSkip(episode_id, position);
+
+CREATE TABLE IF NOT EXISTS Tag (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS MediaTag (
+    media_id TEXT NOT NULL REFERENCES Media(id) ON DELETE CASCADE,
+    tag_id INTEGER NOT NULL REFERENCES Tag(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (media_id, tag_id)
+);
+CREATE INDEX IF NOT EXISTS IX_MediaTag_tag ON MediaTag(tag_id);
+"""
+
+MEDIA_COLUMNS = ("id", "title", "path", "auto_added", "last_modified", "type")
+UNIT_CHILDREN = {"season": "files", "online_season": "episodes", "part": None}
+EPISODE_NAME_KEY = {"season": "name", "online_season": "title"}
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _split_extra(record, modelled):
+    """
+    Повертає JSON з полями запису, які не мають власної колонки, і порядком ключів.
+    """
+    return _dumps({
+        "keys": list(record.keys()),
+        "fields": {key: value for key, value in record.items() if key not in modelled}
+    })
+
+
+def _assemble(extra, modelled_values):
+    """
+    Відновлює словник запису з колонок і `extra` у початковому порядку ключів.
+    """
+    extra = json.loads(extra) if extra else {"keys": list(modelled_values.keys()), "fields": {}}
+    values = dict(modelled_values)
+    values.update(extra["fields"])
+    return {key: values.get(key) for key in extra["keys"]}
+
+
+def _unit_type(item):
+    if item.get("type") == "online_series":
+        return "online_season"
+    if "seasons" in item:
+        return "season"
+    return "part"
+
+
+class SqliteMetadataBackend:
+    """
+    Вбудоване SQLite-сховище метаданих зі схемою transfer_db.py.
+
+    Це лише формат зберігання для MetadataStore: документ вантажиться цілком
+    при старті, а пошук записів, теги і діапазони пропуску обслуговує хеш-індекс
+    у пам'яті (MetadataIndex), як і в інших режимах, - окремих SQL-запитів для
+    пошуку немає, бо зміни редагують саме записи документа в пам'яті. Точкові
+    зміни порівнюються з наявними рядками, тож редагування одного діапазону
+    пропуску торкається лише рядків цього епізоду.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def is_empty(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM Media").fetchone()[0] == 0
+
+    # --- Читання ---
+
+    def _load_items(self, where="", params=()):
+        cursor = self.conn.cursor()
+        media_rows = cursor.execute(f"""
+            SELECT id, title, path, auto_added, last_modified, type, category, extra
+            FROM Media {where}
+            ORDER BY category, position
+        """, params).fetchall()
+        if not media_rows:
+            return []
+
+        # Дочірні рядки вибираються підзапитом, щоб не впиратися в ліміт параметрів SQLite
+        media_filter = f"SELECT id FROM Media {where}"
+
+        tags = {}
+        for media_id, name in cursor.execute(f"""
+            SELECT mt.media_id, t.name FROM MediaTag mt JOIN Tag t ON t.id = mt.tag_id
+            WHERE mt.media_id IN ({media_filter}) ORDER BY mt.media_id, mt.position
+        """, params):
+            tags.setdefault(media_id, []).append(name)
+
+        units = {}
+        for unit_id, media_id, title, path, unit_type, extra in cursor.execute(f"""
+            SELECT id, media_id, title, path, unit_type, extra FROM MediaUnit
+            WHERE media_id IN ({media_filter}) ORDER BY media_id, position
+        """, params):
+            units.setdefault(media_id, []).append((unit_id, title, path, unit_type, extra))
+
+        unit_filter = f"SELECT id FROM MediaUnit WHERE media_id IN ({media_filter})"
+        episodes = {}
+        for episode_id, unit_id, name, extra in cursor.execute(f"""
+            SELECT id, media_unit_id, name, extra FROM Episode
+            WHERE media_unit_id IN ({unit_filter}) ORDER BY media_unit_id, position
+        """, params):
+            episodes.setdefault(unit_id, []).append((episode_id, name, extra))
+
+        skips = {}
+        for episode_id, start, end in cursor.execute(f"""
+            SELECT episode_id, start_time, end_time FROM TimeToSkip
+            WHERE episode_id IN (SELECT id FROM Episode WHERE media_unit_id IN ({unit_filter}))
+            ORDER BY episode_id, position
+        """, params):
+            skips.setdefault(episode_id, []).append({"start": start, "end": end})
+
+        items = []
+        for media_id, title, path, auto_added, last_modified, media_type, category, extra in media_rows:
+            children = []
+            for unit_id, unit_title, unit_path, unit_type, unit_extra in units.get(media_id, []):
+                child_key = UNIT_CHILDREN.get(unit_type)
+                unit_values = {"title": unit_title, "path": unit_path}
+                if child_key:
+                    name_key = EPISODE_NAME_KEY[unit_type]
+                    unit_values[child_key] = [
+                        _assemble(episode_extra, {
+                            name_key: name,
+                            "timeToSkip": skips.get(episode_id, [])
+                        })
+                        for episode_id, name, episode_extra in episodes.get(unit_id, [])
+                    ]
+                children.append(_assemble(unit_extra, unit_values))
+
+            item_values = {
+                "id": media_id,
+                "title": title,
+                "path": path,
+                "tags": tags.get(media_id, []),
+                "auto_added": bool(auto_added),
+                "last_modified": last_modified,
+                "type": media_type,
+                "seasons": children,
+                "parts": children,
+            }
+            items.append((category, _assemble(extra, item_values)))
+        return items
+
+    def load_document(self):
+        """
+        Повертає весь документ метаданих у форматі metadata.json.
+        """
+        with self._lock:
+            metadata = {"series": [], "movies": []}
+            for category, item in self._load_items():
+                metadata.setdefault(category, []).append(item)
+            return metadata
+
+    # --- Запис ---
+
+    def _write_skips(self, cursor, episode_id, time_to_skip):
+        cursor.execute("DELETE FROM TimeToSkip WHERE episode_id = ?", (episode_id,))
+        cursor.executemany("""
+            INSERT INTO TimeToSkip (episode_id, start_time, end_time, position) VALUES (?, ?, ?, ?)
+        """, [(episode_id, skip.get("start"), skip.get("end"), index) for index, skip in enumerate(time_to_skip)])
+
+    def _tag_ids(self, cursor, names):
+        cursor.executemany("INSERT OR IGNORE INTO Tag (name) VALUES (?)", [(name,) for name in names])
+        placeholders = ",".join("?" * len(names))
+        return dict(cursor.execute(f"SELECT name, id FROM Tag WHERE name IN ({placeholders})", list(names)))
+
+    def _put_item(self, cursor, category, item, position):
+        """
+        Записує один елемент, змінюючи лише ті рядки, які відрізняються від збережених.
+        """
+        media_id = item["id"]
+        cursor.execute("""
+            INSERT INTO Media (id, title, path, auto_added, last_modified, type, category, position, extra)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                title = excluded.title, path = excluded.path,
+                auto_added = excluded.auto_added, last_modified = excluded.last_modified,
+                type = excluded.type, category = excluded.category, position = excluded.position,
+                extra = excluded.extra
+        """, (
+            media_id, item.get("title"), item.get("path"),
+            int(bool(item.get("auto_added", False))), item.get("last_modified"), item.get("type"),
+            category, position,
+            _split_extra(item, MEDIA_COLUMNS + ("tags", "seasons", "parts"))
+        ))
+
+        # Теги
+        tags = list(dict.fromkeys(item.get("tags") or []))
+        existing_tags = [row[0] for row in cursor.execute("""
+            SELECT t.name FROM MediaTag mt JOIN Tag t ON t.id = mt.tag_id
+            WHERE mt.media_id = ? ORDER BY mt.position
+        """, (media_id,))]
+        if existing_tags != tags:
+            cursor.execute("DELETE FROM MediaTag WHERE media_id = ?", (media_id,))
+            if tags:
+                tag_ids = self._tag_ids(cursor, tags)
+                cursor.executemany("INSERT INTO MediaTag (media_id, tag_id, position) VALUES (?, ?, ?)",
+                                   [(media_id, tag_ids[tag], index) for index, tag in enumerate(tags)])
+
+        # Сезони / частини
+        unit_type = _unit_type(item)
+        child_key = UNIT_CHILDREN[unit_type]
+        units = (item.get("seasons") if "seasons" in item else item.get("parts")) or []
+        existing_units = cursor.execute("""
+            SELECT id, title, path, unit_type, extra FROM MediaUnit WHERE media_id = ? ORDER BY position
+        """, (media_id,)).fetchall()
+
+        for index, unit in enumerate(units):
+            row = (
+                unit.get("title"), unit.get("path"), unit_type,
+                _split_extra(unit, ("title", "path", child_key))
+            )
+            if index < len(existing_units):
+                unit_id = existing_units[index][0]
+                if tuple(existing_units[index][1:]) != row:
+                    cursor.execute("""
+                        UPDATE MediaUnit SET title = ?, path = ?, unit_type = ?, has_episodes = ?,
+                            extra = ?, position = ? WHERE id = ?
+                    """, (row[0], row[1], unit_type, int(child_key is not None), row[3], index, unit_id))
+            else:
+                cursor.execute("""
+                    INSERT INTO MediaUnit (media_id, title, path, has_episodes, unit_type, position, extra)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (media_id, row[0], row[1], int(child_key is not None), unit_type, index, row[3]))
+                unit_id = cursor.lastrowid
+
+            if child_key:
+                self._put_episodes(cursor, unit_id, unit.get(child_key) or [], EPISODE_NAME_KEY[unit_type])
+
+        stale_units = [row[0] for row in existing_units[len(units):]]
+        if stale_units:
+            cursor.executemany("DELETE FROM MediaUnit WHERE id = ?", [(unit_id,) for unit_id in stale_units])
+
+    def _put_episodes(self, cursor, unit_id, episodes, name_key):
+        existing = cursor.execute("""
+            SELECT id, name, extra FROM Episode WHERE media_unit_id = ? ORDER BY position
+        """, (unit_id,)).fetchall()
+        existing_ids = [row[0] for row in existing]
+        skips = {}
+        for episode_id, start, end in cursor.execute("""
+            SELECT episode_id, start_time, end_time FROM TimeToSkip
+            WHERE episode_id IN (SELECT id FROM Episode WHERE media_unit_id = ?) ORDER BY episode_id, position
+        """, (unit_id,)):
+            skips.setdefault(episode_id, []).append((start, end))
+
+        for index, episode in enumerate(episodes):
+            row = (episode.get(name_key), _split_extra(episode, (name_key, "timeToSkip")))
+            new_skips = [(skip.get("start"), skip.get("end")) for skip in episode.get("timeToSkip") or []]
+            if index < len(existing):
+                episode_id = existing[index][0]
+                if tuple(existing[index][1:]) != row:
+                    cursor.execute("UPDATE Episode SET name = ?, extra = ?, position = ? WHERE id = ?",
+                                   (row[0], row[1], index, episode_id))
+                if skips.get(episode_id, []) != new_skips:
+                    self._write_skips(cursor, episode_id, episode.get("timeToSkip") or [])
+            else:
+                cursor.execute("INSERT INTO Episode (media_unit_id, name, position, extra) VALUES (?, ?, ?, ?)",
+                               (unit_id, row[0], index, row[1]))
+                if new_skips:
+                    self._write_skips(cursor, cursor.lastrowid, episode.get("timeToSkip"))
+
+        stale = existing_ids[len(episodes):]
+        if stale:
+            cursor.executemany("DELETE FROM Episode WHERE id = ?", [(episode_id,) for episode_id in stale])
+
+    def put_items(self, changed):
+        """
+        Зберігає змінені записи однією транзакцією.
+
+        Parameters:
+            changed (list): Список пар (category, item).
+        """
+        with self._lock, self.conn:
+            cursor = self.conn.cursor()
+            for category, item in changed:
+                row = cursor.execute("SELECT category, position FROM Media WHERE id = ?", (item["id"],)).fetchone()
+                if row and row[0] == category:
+                    position = row[1]
+                else:
+                    position = cursor.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM Media WHERE category = ?",
+                                              (category,)).fetchone()[0]
+                self._put_item(cursor, category, item, position)
+
+    def delete_items(self, item_ids):
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM Media WHERE id = ?", [(item_id,) for item_id in item_ids])
+
+    def save_document(self, metadata):
+        """
+        Синхронізує базу з усім документом: змінені рядки оновлюються, зниклі записи видаляються.
+        """
+        with self._lock, self.conn:
+            cursor = self.conn.cursor()
+            seen = set()
+            for category, items in metadata.items():
+                if not isinstance(items, list):
+                    continue
+                for position, item in enumerate(items):
+                    self._put_item(cursor, category, item, position)
+                    seen.add(item["id"])
+            stale = [row[0] for row in cursor.execute("SELECT id FROM Media") if row[0] not in seen]
+            cursor.executemany("DELETE FROM Media WHERE id = ?", [(item_id,) for item_id in stale])
+
+    # --- Імпорт / експорт ---
+
+    def import_json(self, json_path):
+        with open(json_path, 'r', encoding='utf-8') as file:
+            self.save_document(json.load(file))
+
+    def export_json(self, json_path):
+        with open(json_path, 'w', encoding='utf-8') as file:
+            json.dump(self.load_document(), file, ensure_ascii=False, indent=4)
+
+
+if __name__ == '__main__':
+    # python metadata_sqlite.py import|export <metadata.json> [<metadata.db>]
+    from config import METADATA_DB_FILE
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ("import", "export"):
+        print("Usage: python metadata_sqlite.py import|export <metadata.json> [<metadata.db>]")
+        sys.exit(1)
+
+    backend = SqliteMetadataBackend(sys.argv[3] if len(sys.argv) > 3 else METADATA_DB_FILE)
+    if sys.argv[1] == "import":
+        backend.import_json(sys.argv[2])
+    else:
+        backend.export_json(sys.argv[2])
+    backend.close()
@@ -0,0 +1,591 @@
+import os
+import threading
+import json_codec
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from metadata_index import MetadataIndex
+from search_index import SearchIndex
+from change_log import ChangeLog
+from config import METADATA_FILE, METADATA_PERSISTENCE, METADATA_JOURNAL_FILE, METADATA_DB_FILE, JOURNAL_COMPACT_THRESHOLD, CHANGE_LOG_SIZE
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+CATEGORIES = ["series", "movies", "online_series"]
+
+
+def empty_metadata():
+    return {"series": [], "movies": []}
+
+
+def find_item_category(metadata, item):
+    """
+    Повертає категорію, у якій лежить саме цей об'єкт запису (порівняння за ідентичністю).
+    """
+    for category in CATEGORIES:
+        if any(existing is item for existing in metadata.get(category, [])):
+            return category
+    return None
+
+
+def item_positions(metadata):
+    """
+    Будує словник {(category, id): index} для всіх записів документа.
+    """
+    positions = {}
+    for category in CATEGORIES:
+        for index, item in enumerate(metadata.get(category, [])):
+            positions[(category, item.get("id"))] = index
+    return positions
+
+
+def apply_journal_record(metadata, record, positions=None):
+    """
+    Застосовує один запис журналу до документа метаданих.
+
+    Parameters:
+        metadata (dict): Документ метаданих.
+        record (dict): Запис журналу ({"op": "put"|"delete", ...}).
+        positions (dict, optional): Кеш {(category, id): index} для пришвидшення повторних застосувань.
+    """
+    if positions is None:
+        positions = item_positions(metadata)
+
+    if record["op"] == "put":
+        category = record["category"]
+        item = record["item"]
+        items = metadata.setdefault(category, [])
+        key = (category, item.get("id"))
+        # Запис міг переїхати з іншої категорії (наприклад, через PUT /item)
+        for other in CATEGORIES:
+            if other != category and (other, item.get("id")) in positions:
+                _remove_item(metadata, other, item.get("id"), positions)
+        if key in positions:
+            items[positions[key]] = item
+        else:
+            positions[key] = len(items)
+            items.append(item)
+    elif record["op"] == "delete":
+        for category in CATEGORIES:
+            if (category, record["id"]) in positions:
+                _remove_item(metadata, category, record["id"], positions)
+
+
+def _remove_item(metadata, category, item_id, positions):
+    items = metadata[category]
+    index = positions.pop((category, item_id))
+    del items[index]
+    for later in range(index, len(items)):
+        positions[(category, items[later].get("id"))] = later
+
+
+def _fsync_directory(path):
+    if os.name != "posix":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_atomic(path, payload):
+    """
+    Записує текст (або UTF-8 байти) у тимчасовий файл, синхронізує його з диском
+    і атомарно підміняє ним цільовий файл, тож обірваний запис не залишає
+    обрізаного файлу.
+    """
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(payload)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    _fsync_directory(path)
+
+
+class ProcessFileLock:
+    """
+    Ексклюзивне блокування через lock-файл (flock на POSIX, msvcrt.locking на Windows),
+    спільне для всіх процесів, що працюють з одним файлом метаданих.
+
+    Усередині процесу додатково серіалізує потоки звичайним Lock, тож його можна
+    відпустити з іншого потоку, ніж той, що захопив.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a+b')
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            elif msvcrt is not None:
+                self._file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue  # LK_LOCK здається після ~10 секунд очікування
+        except Exception:
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class MetadataStore:
+    """
+    Спільне для всього процесу in-memory сховище метаданих.
+
+    Файл метаданих парситься один раз і перечитується лише тоді, коли змінюється
+    його mtime, розмір або штамп версії (файл `<metadata>.version`, який
+    інкрементується при кожному збереженні). Маршрути отримують закешований
+    документ напряму, без повторного парсингу.
+
+    У режимі "journal" точкові зміни дописуються компактними рядками в журнал
+    (з fsync), а фоновий потік періодично ущільнює їх у знімок з атомарним
+    перейменуванням. При завантаженні журнал програється поверх знімка.
+
+    У режимі "sqlite" документ зберігається у вбудованій базі (metadata_sqlite);
+    JSON-файл при першому запуску імпортується в порожню базу.
+
+    Номер версії монотонно зростає з кожним збереженням; `change_log` пам'ятає,
+    які записи змінились у кожній версії (у режимі "journal" - відновлюється з
+    журналу після перечитування, тож бачить і зміни інших воркерів).
+
+    Усі записи виконуються під `write_lock()`: блокуванням процесу плюс
+    міжпроцесним lock-файлом `<metadata>.lock`. Інші воркери бачать новий штамп
+    версії і перечитують документ при наступному `get()`.
+    """
+
+    def __init__(self, path, journal_path, persistence="snapshot", compact_threshold=500, db_path=None):
+        self.path = path
+        self.version_path = f"{path}.version"
+        self.journal_path = journal_path
+        self.rotated_journal_path = f"{journal_path}.old"
+        self.persistence = persistence
+        self.backend = None
+        if persistence == "sqlite":
+            from metadata_sqlite import SqliteMetadataBackend
+            self.backend = SqliteMetadataBackend(db_path)
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        # Публічне блокування для складених операцій читання-зміни-запису
+        self.lock = self._lock
+        self._data = None
+        self.index = None
+        self.search_index = None
+        self._stamp = None
+        self._journal_records = 0
+        self._compacting = False
+        # Захищає запис знімка від гонки між повним збереженням і фоновим ущільненням
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_generation = 0
+        self.version = 0
+        self.change_log = ChangeLog(CHANGE_LOG_SIZE)
+        self._replayed_changes = []
+        self.process_lock = ProcessFileLock(f"{path}.lock")
+        self._write_depth = 0
+
+    @contextmanager
+    def write_lock(self):
+        """
+        Блокування для запису: RLock процесу + міжпроцесний lock-файл.
+        Повторний вхід з того самого потоку не захоплює lock-файл вдруге.
+        """
+        with self._lock:
+            if self._write_depth == 0:
+                self.process_lock.acquire()
+            self._write_depth += 1
+            try:
+                yield
+            finally:
+                self._write_depth -= 1
+                if self._write_depth == 0:
+                    self.process_lock.release()
+
+    def _read_version(self):
+        try:
+            with open(self.version_path, 'r', encoding='utf-8') as file:
+                return int(file.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_version(self, version):
+        with open(self.version_path, 'w', encoding='utf-8') as file:
+            file.write(str(version))
+
+    def _next_version(self):
+        return max(self.version, self._read_version()) + 1
+
+    def _read_stamp(self):
+        """
+        Повертає штамп стану файлу: (mtime, розмір, версія).
+        """
+        if self.backend:
+            # Зміни бази видно лише через штамп версії (WAL не оновлює mtime файлу бази)
+            return (None, None, self._read_version())
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return (None, None, self._read_version())
+        return (stat.st_mtime_ns, stat.st_size, self._read_version())
+
+    def _replay_journal(self, metadata, journal_path, changes=None):
+        """
+        Програє записи журналу поверх документа. Якщо передано `changes`, туди
+        додаються (версія, операція, категорія, id) записів з номером версії.
+
+        Запис вважається збереженим, лише якщо його рядок цілий і завершується
+        переведенням рядка. Пошкоджений останній рядок (обрив під час запису)
+        ігнорується і відрізається від файлу, щоб наступні записи не дописались
+        у його продовження. Пошкоджений рядок посередині журналу - помилка.
+
+        Returns:
+            int: Кількість застосованих записів.
+        """
+        if not os.path.exists(journal_path):
+            return 0
+        applied = 0
+        positions = None
+        good_offset = 0
+        with open(journal_path, 'rb') as file:
+            for line in file:
+                if not line.strip():
+                    good_offset += len(line)
+                    continue
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("record is not terminated")
+                    record = json_codec.loads(line)
+                except ValueError as e:
+                    if file.read().strip():
+                        raise ValueError(f"Journal {journal_path} is corrupted at byte {good_offset}: {e}")
+                    print(f"Ignoring truncated journal record in {journal_path}")
+                    self._truncate_journal(journal_path, good_offset, file.tell())
+                    break
+                if positions is None:
+                    positions = item_positions(metadata)
+                apply_journal_record(metadata, record, positions)
+                applied += 1
+                good_offset += len(line)
+                if changes is not None and "v" in record:
+                    item_id = record["item"].get("id") if record["op"] == "put" else record["id"]
+                    changes.append((record["v"], record["op"], record.get("category"), item_id))
+        return applied
+
+    def _truncate_journal(self, journal_path, good_offset, seen_size):
+        """
+        Відрізає від журналу пошкоджений хвіст, починаючи з `good_offset`.
+
+        Рядок міг бути не обірваним, а ще дописуватись іншим процесом, тож
+        обрізання виконується під lock-файлом і лише якщо розмір файлу не
+        змінився з моменту читання.
+        """
+        owns_lock = self._write_depth == 0
+        if owns_lock:
+            self.process_lock.acquire()
+        try:
+            if os.path.getsize(journal_path) != seen_size:
+                return
+            with open(journal_path, 'r+b') as file:
+                file.truncate(good_offset)
+                file.flush()
+                os.fsync(file.fileno())
+        finally:
+            if owns_lock:
+                self.process_lock.release()
+
+    def _parse(self):
+        self._replayed_changes = []
+        if self.backend:
+            if self.backend.is_empty() and os.path.exists(self.path):
+                self.backend.import_json(self.path)
+            return self.backend.load_document()
+
+        metadata = empty_metadata()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'rb') as file:
+                    metadata = json_codec.loads(file.read())
+            except ValueError as e:
+                # Не підміняємо пошкоджений файл порожньою бібліотекою: наступне
+                # збереження інакше затерло б усі дані.
+                raise ValueError(f"Metadata file {self.path} is corrupted: {e}")
+
+        self._journal_records = self._replay_journal(metadata, self.rotated_journal_path, self._replayed_changes)
+        self._journal_records += self._replay_journal(metadata, self.journal_path, self._replayed_changes)
+        return metadata
+
+    def get(self):
+        """
+        Повертає поточний документ метаданих, перечитуючи файл лише за потреби.
+
+        Returns:
+            dict: Закешований документ метаданих.
+        """
+        stamp = self._read_stamp()
+        with self._lock:
+            if self._data is None or stamp != self._stamp:
+                self._data = self._parse()
+                self.index = MetadataIndex(self._data)
+                self._stamp = stamp
+                self.version = stamp[2]
+                self.change_log.load(self._replayed_changes, self.version)
+                self._replayed_changes = []
+            return self._data
+
+    def validators(self):
+        """
+        Повертає валідатори поточної версії документа для умовних HTTP-запитів.
+
+        Returns:
+            tuple: (ETag-рядок з номера версії і mtime файлу, час останньої зміни в UTC, версія).
+        """
+        with self._lock:
+            self.get()
+            mtime_ns, _, version = self._stamp
+        modified = [mtime_ns or 0]
+        try:
+            modified.append(os.stat(self.version_path).st_mtime_ns)
+        except OSError:
+            pass
+        etag = f"{version}-{mtime_ns or 0:x}"
+        return etag, datetime.fromtimestamp(max(modified) // 1_000_000_000, tz=timezone.utc), version
+
+    def get_index(self):
+        """
+        Повертає хеш-індекс поточного документа (сам документ доступний як `index.metadata`).
+        """
+        with self._lock:
+            self.get()
+            return self.index
+
+    def get_search_index(self):
+        """
+        Повертає пошуковий індекс поточного документа; будується при першому запиті
+        і далі оновлюється інкрементно при збереженнях.
+        """
+        with self._lock:
+            self.get()
+            if self.search_index is None or self.search_index.metadata is not self._data:
+                self.search_index = SearchIndex(self._data)
+            return self.search_index
+
+    def _categorize(self, metadata, changed):
+        """
+        Визначає категорії змінених записів: спершу через індекс, для нових записів - обходом.
+        """
+        changes = []
+        for item in changed:
+            indexed, category = self.index.get_item(item.get("id")) if self.index else (None, None)
+            if indexed is not item:
+                category = find_item_category(metadata, item)
+            if category:
+                changes.append((category, item))
+        return changes
+
+    def reindex(self, metadata, changed=None, deleted=None):
+        """
+        Оновлює індекси для змінених і видалених записів документа сховища
+        (без запису на диск).
+        """
+        with self._lock:
+            if metadata is not self._data:
+                return
+            changes = self._categorize(metadata, changed or [])
+            for index in (self.index, self.search_index):
+                if index is None:
+                    continue
+                for category, item in changes:
+                    index.reindex_item(item, category)
+                for item_id in deleted or []:
+                    index.remove_item(item_id)
+
+    def save(self, metadata, changed=None, deleted=None):
+        """
+        Зберігає метадані і одразу оновлює закешовану копію.
+
+        Якщо передано `changed`/`deleted` і сховище працює в режимі "journal" чи
+        "sqlite", на диск записуються лише ці записи; інакше документ зберігається цілком.
+
+        Parameters:
+            metadata (dict): Документ метаданих для збереження.
+            changed (list, optional): Змінені або додані записи (об'єкти з `metadata`).
+            deleted (list, optional): Ідентифікатори видалених записів.
+        """
+        with self.write_lock():
+            incremental = metadata is self._data and bool(changed or deleted)
+            changes = self._categorize(metadata, changed or []) if incremental else []
+            version = self._next_version()
+
+            if self.backend:
+                if incremental:
+                    self.backend.put_items(changes)
+                    self.backend.delete_items(deleted or [])
+                else:
+                    self.backend.save_document(metadata)
+            elif self.persistence == "journal" and incremental:
+                self._append_journal(changes, deleted or [], version)
+            else:
+                self._write_snapshot(metadata)
+            self._write_version(version)
+            self.version = version
+
+            if incremental:
+                for index in (self.index, self.search_index):
+                    if index is None:
+                        continue
+                    for category, item in changes:
+                        index.reindex_item(item, category)
+                    for item_id in deleted or []:
+                        index.remove_item(item_id)
+                self.change_log.record(version, changes, deleted or [])
+            else:
+                self._data = metadata
+                self.index = MetadataIndex(metadata)
+                self.search_index = None
+                # Після повного збереження поелементна історія невідома
+                self.change_log.reset(version)
+            self._stamp = self._read_stamp()
+
+    def _append_journal(self, changes, deleted, version):
+        timestamp = datetime.now().isoformat()
+        records = []
+        for category, item in changes:
+            records.append({"op": "put", "category": category, "item": item, "ts": timestamp, "v": version})
+        for item_id in deleted:
+            records.append({"op": "delete", "id": item_id, "ts": timestamp, "v": version})
+
+        payload = b"".join(json_codec.dumps_bytes(record) + b"\n" for record in records)
+        with open(self.journal_path, 'ab') as file:
+            file.write(payload)
+            file.flush()
+            os.fsync(file.fileno())
+
+        self._journal_records += len(records)
+        if self._journal_records >= self.compact_threshold and not self._compacting:
+            self._compacting = True
+            threading.Thread(target=self._compact, daemon=True).start()
+
+    def _write_snapshot(self, metadata):
+        # У режимі "snapshot" файл лишається читабельним (з відступами)
+        payload = json_codec.dumps_bytes(metadata, pretty=self.persistence != "journal")
+        with self._snapshot_lock:
+            write_atomic(self.path, payload)
+            self._snapshot_generation += 1
+        # Знімок уже містить усі зміни з журналу
+        for journal in (self.rotated_journal_path, self.journal_path):
+            if os.path.exists(journal):
+                os.remove(journal)
+        self._journal_records = 0
+
+    def _compact(self):
+        """
+        Фонове ущільнення журналу у знімок.
+
+        Під блокуванням документ серіалізується, а поточний журнал ротується;
+        запис знімка і fsync відбуваються вже без блокування процесу (лише під
+        lock-файлом), тож поки немає записів, читання не чекають на запис знімка.
+        Запис у цей час чекає на lock-файл, уже тримаючи блокування процесу
+        (див. write_lock), тож читання після нього теж чекають до кінця
+        ущільнення. Якщо процес впаде посередині, при старті знімок + ротований +
+        поточний журнали дадуть той самий стан, бо записи "put"/"delete" ідемпотентні.
+        """
+        try:
+            with self._lock:
+                self.process_lock.acquire()
+                try:
+                    if self._read_stamp() != self._stamp:
+                        # Інший процес записав зміни після нашого останнього читання:
+                        # ущільнення зробить наступний запис
+                        self.process_lock.release()
+                        return
+                    payload = json_codec.dumps_bytes(self._data)
+                    if os.path.exists(self.journal_path):
+                        if os.path.exists(self.rotated_journal_path):
+                            with open(self.journal_path, 'rb') as src, \
+                                    open(self.rotated_journal_path, 'ab') as dst:
+                                dst.write(src.read())
+                            os.remove(self.journal_path)
+                        else:
+                            os.replace(self.journal_path, self.rotated_journal_path)
+                except Exception:
+                    self.process_lock.release()
+                    raise
+                self._journal_records = 0
+                generation = self._snapshot_generation
+                stamp = self._stamp
+
+            # Lock-файл тримається до кінця: інший процес не повинен ротувати
+            # журнал, поки ротований ще не увійшов у знімок
+            try:
+                with self._snapshot_lock:
+                    # Повне збереження встигло записати новіший знімок
+                    if generation != self._snapshot_generation:
+                        return
+                    write_atomic(self.path, payload)
+                    self._snapshot_generation += 1
+                if os.path.exists(self.rotated_journal_path):
+                    os.remove(self.rotated_journal_path)
+                new_stamp = self._read_stamp()
+            finally:
+                self.process_lock.release()
+
+            with self._lock:
+                if self._stamp == stamp:
+                    self._stamp = new_stamp
+        except Exception as e:
+            print(f"Journal compaction failed: {e}")
+        finally:
+            self._compacting = False
+
+    def invalidate(self):
+        """
+        Скидає кеш: наступний виклик `get()` перечитає файл.
+        """
+        with self._lock:
+            self._data = None
+            self.index = None
+            self.search_index = None
+            self._stamp = None
+
+
+store = MetadataStore(
+    METADATA_FILE,
+    METADATA_JOURNAL_FILE,
+    persistence=METADATA_PERSISTENCE,
+    compact_threshold=JOURNAL_COMPACT_THRESHOLD,
+    db_path=METADATA_DB_FILE
+)
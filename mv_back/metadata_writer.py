@@ -0,0 +1,168 @@
+import time
+import queue
+import threading
+from metadata_store import store
+from config import METADATA_COMMIT_WINDOW, METADATA_COMMIT_MAX_BATCH
+
+
+class PendingMutation:
+    """
+    Зміна в черзі записувача та її результат.
+    """
+
+    __slots__ = ("mutation", "done", "result", "error")
+
+    def __init__(self, mutation):
+        self.mutation = mutation
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MetadataWriter:
+    """
+    Єдиний записувач метаданих.
+
+    Усі зміни проходять через одну чергу і застосовуються по черзі до документа
+    сховища в окремому потоці, тож паралельні редагування не затирають одне одного.
+    Зміни, що надійшли протягом `window` секунд (або поки йшов попередній запис),
+    фіксуються одним збереженням (group commit) під міжпроцесним блокуванням
+    сховища.
+
+    Зміна - це функція `mutation(metadata, index)`, яка повертає
+    `(результат, змінені записи, id видалених записів)`. Вона не повинна сама
+    викликати `save_metadata` чи `submit`.
+    """
+
+    def __init__(self, window, max_batch):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.commits = 0
+        self.mutations = 0
+        self.last_batch = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def submit(self, mutation, timeout=None):
+        """
+        Ставить зміну в чергу і чекає, поки її буде збережено.
+
+        Parameters:
+            mutation (function): Функція зміни (див. опис класу).
+            timeout (float, optional): Максимальний час очікування в секундах.
+
+        Returns:
+            Результат, який повернула функція зміни.
+
+        Raises:
+            Exception: Помилка з функції зміни або зі збереження.
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("Metadata mutations cannot be submitted from inside another mutation")
+        self.start()
+        pending = PendingMutation(mutation)
+        self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError("Metadata write did not finish in time")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def status(self):
+        return {
+            "queued": self._queue.qsize(),
+            "commits": self.commits,
+            "mutations": self.mutations,
+            "last_batch": self.last_batch,
+            "version": store.version,
+        }
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    # Спершу забираємо все, що накопичилось, потім чекаємо до кінця вікна
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    pass
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _apply(self, batch):
+        """
+        Застосовує зміни пакета до документа сховища по черзі.
+
+        Returns:
+            tuple: (документ, {id: змінений запис}, {id видаленого: None}, зміна, що впала,
+                або None). Після невдалої зміни решта пакета не застосовується.
+        """
+        changed = {}
+        deleted = {}
+        metadata = store.get()
+        index = store.get_index()
+        for pending in batch:
+            try:
+                pending.result, op_changed, op_deleted = pending.mutation(metadata, index)
+            except Exception as e:
+                pending.error = e
+                return metadata, changed, deleted, pending
+            for item_id in op_deleted or []:
+                changed.pop(item_id, None)
+                deleted[item_id] = None
+            for item in op_changed or []:
+                deleted.pop(item.get("id"), None)
+                changed[item.get("id")] = item
+            # Наступні зміни в пакеті мають бачити цю через індекс
+            store.reindex(metadata, op_changed, op_deleted)
+        return metadata, changed, deleted, None
+
+    def _commit(self, batch):
+        try:
+            with store.write_lock():
+                # Під lock-файлом: підхоплюємо зміни інших воркерів перед застосуванням
+                applied = list(batch)
+                while True:
+                    metadata, changed, deleted, failed = self._apply(applied)
+                    if failed is None:
+                        break
+                    # Зміна могла частково змінити спільний документ до винятку:
+                    # відкидаємо документ у пам'яті і застосовуємо решту пакета
+                    # заново до перечитаного з диска
+                    store.invalidate()
+                    applied.remove(failed)
+
+                if changed or deleted:
+                    store.save(metadata, changed=list(changed.values()), deleted=list(deleted))
+                    self.commits += 1
+        except Exception as e:
+            print(f"Metadata commit failed: {e}")
+            # Документ у пам'яті вже містить незбережені зміни - перечитуємо з диска
+            store.invalidate()
+            for pending in batch:
+                if pending.error is None:
+                    pending.error = e
+        finally:
+            self.mutations += len(batch)
+            self.last_batch = len(batch)
+            for pending in batch:
+                pending.done.set()
+
+
+writer = MetadataWriter(METADATA_COMMIT_WINDOW, METADATA_COMMIT_MAX_BATCH)
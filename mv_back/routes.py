@@ -1,11 +1,25 @@
 import json
 import uuid
-from flask import jsonify, request, send_file, Response
+import base64
+from flask import jsonify, request, send_file, Response, make_response
+from werkzeug.http import is_resource_modified
+from json_codec import FastJSONProvider, iter_json_object
+from compression import compress_response
+from metadata_store import store
+from metadata_ops import validate_operations, batch_mutation
 import os
-from metadata import load_metadata, save_metadata, auto_add_metadata, find_metadata_item, update_paths_only
+from metadata import load_metadata, load_metadata_index, load_metadata_validators, load_search_index, mutate_metadata, find_metadata_item, update_paths_only, retag_items, catalog_entry, CATALOG_DEFAULT_FIELDS
+from metadata_index import SORT_KEYS
+from scan_service import scan_service
+from fs_watcher import fs_watcher
+from db_replication import replicator
 from analyze_video import analyze_video, clear_analysis_cache
-from thumbnails import find_first_video_in_directory, get_or_create_thumbnail
-from config import THUMBNAILS_DIR, MOVIES_PATHS, SERIES_PATHS
+from thumbnails import variant_target, variant_path, parse_variant_file_name, THUMBNAIL_FORMATS
+from thumbnail_service import thumbnail_service, thumbnail_index, PLACEHOLDER_SVG
+from thumbnail_prewarm import thumbnail_prewarmer
+from trickplay import trickplay_service, trickplay_target, parse_sprite_file_name
+from cache_manager import cache_manager
+from config import THUMBNAILS_DIR, THUMBNAIL_SIZES, THUMBNAIL_DEFAULT_SIZE, THUMBNAIL_WAIT_TIMEOUT, THUMBNAIL_RETRY_AFTER, THUMBNAIL_MAX_AGE, TRICKPLAY_RETRY_AFTER, MOVIES_PATHS, SERIES_PATHS, WATCHER_ENABLED, REPLICATION_ENABLED, BATCH_MAX_OPERATIONS
 from datetime import datetime
 import mimetypes
 import subprocess
@@ -34,7 +48,86 @@ if not os.path.exists(THUMBNAILS_DIR):
 def error_response(message, status=400):
     return jsonify({"status": "error", "message": message}), status
 
+def conditional_response(build_response):
+    """
+    Відповідь з ETag і Last-Modified за версією метаданих. Якщо клієнт уже має
+    цю версію (If-None-Match / If-Modified-Since), повертається 304 без тіла і
+    без побудови відповіді.
+
+    Parameters:
+        build_response (function): Будує повну відповідь (як звичайний обробник).
+
+    Returns:
+        Response: 304 або повна відповідь із валідаторами.
+    """
+    # Валідатори знімаються до побудови відповіді: якщо між ними встигне пройти
+    # запис, клієнт отримає новіші дані зі старшим ETag і просто перезапитає їх
+    etag, last_modified, version = load_metadata_validators()
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = Response(status=304)
+    else:
+        response = make_response(build_response())
+        if response.status_code != 200:
+            return response
+    # Слабкий ETag: тіло може віддаватись стиснутим
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    response.headers["Cache-Control"] = "no-cache"
+    # Версія, від якої клієнт може синхронізуватись через /api/metadata/changes
+    response.headers["X-Metadata-Version"] = str(version)
+    return response
+
+def choose_thumbnail_variant():
+    """
+    Обирає розмір і формат мініатюри.
+
+    Розмір: `size` (назва з THUMBNAIL_SIZES) або `width` (найменший розмір,
+    не вужчий за вказану ширину). Формат: `format`, інакше WebP, якщо клієнт
+    явно вказав image/webp в Accept, і JPEG в іншому разі.
+
+    Returns:
+        tuple: (розмір або None, формат або None, чи формат обрано за Accept).
+    """
+    size = request.args.get('size')
+    width = request.args.get('width', type=int)
+    if size is None and width:
+        fitting = [name for name, value in sorted(THUMBNAIL_SIZES.items(), key=lambda entry: entry[1]) if value >= width]
+        size = fitting[0] if fitting else max(THUMBNAIL_SIZES, key=THUMBNAIL_SIZES.get)
+    size = size or THUMBNAIL_DEFAULT_SIZE
+    if size not in THUMBNAIL_SIZES:
+        size = None
+
+    image_format = request.args.get('format')
+    if image_format:
+        return size, image_format if image_format in THUMBNAIL_FORMATS else None, False
+    # */* не рахується: старі клієнти його теж надсилають
+    accepts_webp = any(value == "image/webp" and quality > 0 for value, quality in request.accept_mimetypes)
+    return size, "webp" if accepts_webp else "jpeg", True
+
+def thumbnail_validators(response, target, negotiated, immutable):
+    """
+    Додає до відповіді з мініатюрою валідатори кешу.
+
+    Адреса за вмістом (/api/thumbnail/<ім'я>) кешується на рік як незмінна.
+    Адреса за папкою щоразу перевіряється (папка може почати вказувати на інше
+    відео), але відповідь на перевірку - 304 з індексу в пам'яті.
+    """
+    response.set_etag(target["name"])
+    response.headers["X-Thumbnail-Url"] = f"/api/thumbnail/{target['name']}"
+    if immutable:
+        response.headers["Cache-Control"] = f"public, max-age={THUMBNAIL_MAX_AGE}, immutable"
+    else:
+        response.headers["Cache-Control"] = "no-cache"
+        if negotiated:
+            response.vary.add("Accept")
+    return response
+
 def register_routes(app):
+    app.json = FastJSONProvider(app)
+
+    @app.after_request
+    def compress(response):
+        return compress_response(response, request.accept_encodings)
     
     @app.route('/api/metadata/tags', methods=['GET'])
     def get_all_tags():
@@ -44,18 +137,114 @@ def register_routes(app):
         Returns:
             Response: Список унікальних тегів.
         """
+        def build():
+            try:
+                index = load_metadata_index()
+            except Exception as e:
+                return error_response(f"Failed to load metadata: {str(e)}", 500)
+
+            return jsonify({"status": "success", "tags": index.list_tags()}), 200
+
+        return conditional_response(build)
+
+    @app.route('/api/metadata/tags/items', methods=['GET'])
+    def get_tag_items():
+        """
+        Повертає ідентифікатори всіх записів із вказаним тегом.
+
+        Query Parameters:
+            tag (str): Тег.
+
+        Returns:
+            Response: Список ідентифікаторів.
+        """
+        tag = request.args.get('tag')
+        if not tag:
+            return error_response("Field `tag` is required", 400)
+
         try:
-            metadata = load_metadata()
+            index = load_metadata_index()
         except Exception as e:
             return error_response(f"Failed to load metadata: {str(e)}", 500)
 
-        tags = set()
-        for category in ["series", "movies", "online_series"]:
-            for item in metadata.get(category, []):
-                item_tags = item.get("tags", [])
-                tags.update(item_tags)
+        return jsonify({"status": "success", "tag": tag, "ids": index.items_with_tag(tag)}), 200
+
+    def apply_retag(source_tags, target_tag=None):
+        """
+        Замінює або видаляє теги в усій бібліотеці одним записом.
+        """
+        def mutation(metadata, index):
+            changed = retag_items(index, source_tags, target_tag)
+            return len(changed), changed, []
+
+        try:
+            updated = mutate_metadata(mutation)
+        except Exception as e:
+            return error_response(f"Failed to save metadata: {str(e)}", 500)
+
+        if not updated:
+            return error_response("No items have the given tags", 404)
+
+        return jsonify({"status": "success", "updated": updated}), 200
+
+    @app.route('/api/metadata/tags/rename', methods=['POST'])
+    def rename_tag():
+        """
+        Перейменовує тег у всіх записах.
+
+        Body Parameters:
+            tag (str): Поточна назва тегу.
+            new_tag (str): Нова назва тегу.
+
+        Returns:
+            Response: Кількість змінених записів.
+        """
+        data = request.json
+        tag = data.get('tag')
+        new_tag = data.get('new_tag')
+
+        if not tag or not new_tag:
+            return error_response("Fields `tag` and `new_tag` are required", 400)
+
+        return apply_retag([tag], new_tag)
+
+    @app.route('/api/metadata/tags/merge', methods=['POST'])
+    def merge_tags():
+        """
+        Зливає кілька тегів в один.
+
+        Body Parameters:
+            tags (list): Теги, які потрібно злити.
+            target (str): Результуючий тег.
+
+        Returns:
+            Response: Кількість змінених записів.
+        """
+        data = request.json
+        tags = data.get('tags')
+        target = data.get('target')
+
+        if not tags or not target:
+            return error_response("Fields `tags` and `target` are required", 400)
+
+        return apply_retag(tags, target)
 
-        return jsonify({"status": "success", "tags": list(tags)}), 200
+    @app.route('/api/metadata/tags/remove', methods=['POST'])
+    def remove_tag():
+        """
+        Видаляє тег з усіх записів.
+
+        Body Parameters:
+            tag (str): Тег для видалення.
+
+        Returns:
+            Response: Кількість змінених записів.
+        """
+        tag = request.json.get('tag')
+        if not tag:
+            return error_response("Field `tag` is required", 400)
+
+        return apply_retag([tag])
     
     @app.route('/api/metadata/add_tag', methods=['POST'])
     def add_tag():
@@ -76,35 +265,71 @@ def register_routes(app):
         if not ids or not new_tag:
             return error_response("Fields `ids` and `tag` are required", 400)
 
-        # Завантаження метаданих
+        def mutation(metadata, index):
+            updated_items = []
+            for item_id in dict.fromkeys(ids):
+                item, _ = index.get_item(item_id, categories=["series", "movies"])
+                if not item:
+                    continue
+                if "tags" not in item:
+                    item["tags"] = []
+                if new_tag not in item["tags"]:
+                    item["tags"].append(new_tag)
+                    item["last_modified"] = datetime.now().isoformat()
+                    item["auto_added"] = False
+                    updated_items.append(item)
+            return len(updated_items), updated_items, []
+
+        # Зміна і збереження метаданих
         try:
-            metadata = load_metadata()
+            updated = mutate_metadata(mutation)
         except Exception as e:
-            return error_response(f"Failed to load metadata: {str(e)}", 500)
-
-        updated = False
-        for category in ["series", "movies"]:
-            for item in metadata.get(category, []):
-                if item.get("id") in ids:
-                    if "tags" not in item:
-                        item["tags"] = []
-                    if new_tag not in item["tags"]:
-                        item["tags"].append(new_tag)
-                        item["last_modified"] = datetime.now().isoformat()
-                        item["auto_added"] = False
-                        updated = True
+            return error_response(f"Failed to save metadata: {str(e)}", 500)
 
         if not updated:
             return error_response("No items were updated", 404)
 
-        # Збереження метаданих
-        try:
-            save_metadata(metadata)
-        except Exception as e:
-            return error_response(f"Failed to save metadata: {str(e)}", 500)
-
         return jsonify({"status": "success", "message": "Tag added successfully"}), 200
     
+    @app.route('/api/metadata/batch', methods=['POST'])
+    def apply_batch():
+        """
+        Застосовує пакет змін одним запитом і одним збереженням.
+
+        Пакет атомарний: якщо хоча б одна операція некоректна або її ціль не знайдено,
+        не застосовується жодна.
+
+        Body Parameters:
+            operations (list): Операції з полем `type`:
+                add_tag / remove_tag: ids (list), tag (str);
+                set_time_to_skip / bulk_time_to_skip: path (str), name (str), timeToSkip (list);
+                set_audio_track: path (str), name (str), trackIndex (int).
+
+        Returns:
+            Response: Результати операцій у тому ж порядку або список помилок.
+        """
+        operations = (request.json or {}).get('operations')
+        if not isinstance(operations, list) or not operations:
+            return error_response("Field `operations` must be a non-empty list", 400)
+        if len(operations) > BATCH_MAX_OPERATIONS:
+            return error_response(f"Too many operations (max {BATCH_MAX_OPERATIONS})", 400)
+
+        errors = validate_operations(operations)
+        if not errors:
+            try:
+                applied, outcome = mutate_metadata(batch_mutation(operations))
+            except Exception as e:
+                return error_response(f"Failed to save metadata: {str(e)}", 500)
+            if applied:
+                return jsonify({"status": "success", "results": outcome, "version": store.version}), 200
+            errors = outcome
+
+        return jsonify({
+            "status": "error",
+            "message": "Batch rejected, no changes were applied",
+            "errors": errors
+        }), errors[0]["status"]
+
     @app.route('/api/metadata/online_series', methods=['POST'])
     def add_online_series():
         """
@@ -126,12 +351,6 @@ def register_routes(app):
         if not title or not seasons:
             return error_response("Fields `title` and `seasons` are required", 400)
 
-        # Завантаження метаданих
-        try:
-            metadata = load_metadata()
-        except Exception as e:
-            return error_response(f"Failed to load metadata: {str(e)}", 500)
-
         new_series = {
             "id": str(uuid.uuid4()),
             "title": title,
@@ -141,11 +360,14 @@ def register_routes(app):
             "type": "online_series",
             "seasons": seasons
         }
-        metadata.setdefault("online_series", []).append(new_series)
+
+        def mutation(metadata, index):
+            metadata.setdefault("online_series", []).append(new_series)
+            return None, [new_series], []
 
         # Збереження метаданих
         try:
-            save_metadata(metadata)
+            mutate_metadata(mutation)
         except Exception as e:
             return error_response(f"Failed to save metadata: {str(e)}", 500)
 
@@ -208,18 +430,15 @@ def register_routes(app):
 
         # Завантаження метаданих
         try:
-            metadata = load_metadata()
+            index = load_metadata_index()
         except Exception as e:
             return error_response(f"Failed to load metadata: {str(e)}", 500)
 
         # Пошук сезону і файлу
-        for series in metadata.get("series", []):
-            for season in series.get("seasons", []):
-                if os.path.normpath(season.get("path")) == os.path.normpath(season_path):
-                    for file in season.get("files", []):
-                        if file.get("name") == file_name:
-                            time_to_skip = file.get("timeToSkip", [])
-                            return jsonify({"status": "success", "timeToSkip": time_to_skip}), 200
+        _, _, file = index.get_file(season_path, file_name)
+        if file is not None:
+            time_to_skip = file.get("timeToSkip", [])
+            return jsonify({"status": "success", "timeToSkip": time_to_skip}), 200
 
         return error_response("File not found in metadata", 404)
 
@@ -244,33 +463,24 @@ def register_routes(app):
         if not season_path or not file_name or not time_to_skip:
             return error_response("Fields `path`, `name`, and `timeToSkip` are required", 400)
 
-        # Завантаження метаданих
-        try:
-            metadata = load_metadata()
-        except Exception as e:
-            return error_response(f"Failed to load metadata: {str(e)}", 500)
-
         # Оновлення метаданих
-        updated = False
-        for series in metadata.get("series", []):
-            for season in series.get("seasons", []):
-                if os.path.normpath(season.get("path")) == os.path.normpath(season_path):
-                    for file in season.get("files", []):
-                        if file.get("name") == file_name:
-                            file["timeToSkip"] = time_to_skip
-                            series["auto_added"] = False  # Позначення серіалу як вручну зміненого
-                            updated = True
-                            break
-
-        if not updated:
-            return error_response("File not found in metadata", 404)
+        def mutation(metadata, index):
+            series, _, file = index.get_file(season_path, file_name)
+            if file is None:
+                return False, [], []
+            file["timeToSkip"] = time_to_skip
+            series["auto_added"] = False  # Позначення серіалу як вручну зміненого
+            return True, [series], []
 
         # Збереження метаданих
         try:
-            save_metadata(metadata)
+            found = mutate_metadata(mutation)
         except Exception as e:
             return error_response(f"Failed to update metadata: {str(e)}", 500)
 
+        if not found:
+            return error_response("File not found in metadata", 404)
+
         return jsonify({"status": "success", "message": "Metadata updated successfully"}), 200
     
     @app.route('/api/metadata/time_to_skip/bulk', methods=['POST'])
@@ -294,39 +504,32 @@ def register_routes(app):
         if not season_path or not start_file_name or not time_to_skip:
             return error_response("Fields `path`, `name`, and `timeToSkip` are required", 400)
 
-        # Завантаження метаданих
-        try:
-            metadata = load_metadata()
-        except Exception as e:
-            return error_response(f"Failed to load metadata: {str(e)}", 500)
-
         # Оновлення timeToSkip для файлів
-        updated = False
-        for series in metadata.get("series", []):
-            for season in series.get("seasons", []):
-                if os.path.normpath(season.get("path")) == os.path.normpath(season_path):
-                    start_updating = False
-                    for file in season.get("files", []):
-                        if file.get("name") == start_file_name:
-                            start_updating = True
-
-                        if start_updating:
-                            file["timeToSkip"] = time_to_skip
-                            updated = True
-
-                    if updated:
-                        series["auto_added"] = False  # Позначаємо серіал як вручну змінений
-                        break
+        def mutation(metadata, index):
+            series, season = index.get_season(season_path)
+            start_updating = False
+            for file in season.get("files", []) if season else []:
+                if file.get("name") == start_file_name:
+                    start_updating = True
 
-        if not updated:
-            return error_response("File not found in metadata or no updates made", 404)
+                if start_updating:
+                    file["timeToSkip"] = time_to_skip
+
+            if not start_updating:
+                return False, [], []
+
+            series["auto_added"] = False  # Позначаємо серіал як вручну змінений
+            return True, [series], []
 
         # Збереження метаданих
         try:
-            save_metadata(metadata)
+            updated = mutate_metadata(mutation)
         except Exception as e:
             return error_response(f"Failed to save metadata: {str(e)}", 500)
 
+        if not updated:
+            return error_response("File not found in metadata or no updates made", 404)
+
         return jsonify({"status": "success", "message": "Bulk update completed successfully"}), 200
     
     @app.route('/api/analyze/clear_cache', methods=['POST'])
@@ -367,12 +570,10 @@ def register_routes(app):
         if not video_path or not os.path.exists(video_path):
             return error_response("File not found", 404)
 
-        metadata = load_metadata()
-        for series in metadata.get("series", []):
-            for season in series.get("seasons", []):
-                for file in season.get("files", []):
-                    if os.path.normpath(os.path.join(season["path"], file["name"])) == os.path.normpath(video_path):
-                        return jsonify({"status": "success", "recommendToSkip": file.get("recommendToSkip", [])})
+        index = load_metadata_index()
+        _, _, file = index.get_file_by_path(video_path)
+        if file is not None:
+            return jsonify({"status": "success", "recommendToSkip": file.get("recommendToSkip", [])})
 
         return error_response("Analysis not found", 404)
 
@@ -396,18 +597,29 @@ def register_routes(app):
         def process_video(file_info):
             video_path = os.path.join(file_info["season_path"], file_info["name"])
             analysis_result = analyze_video(video_path)
-            file_info["file"]["recommendToSkip"] = analysis_result
+            file_info["recommendToSkip"] = analysis_result
             return {"file": file_info["name"], "recommendToSkip": analysis_result}
 
         files_to_analyze = []
         for season in series.get("seasons", []):
             for file in season.get("files", []):
-                files_to_analyze.append({"season_path": season["path"], "name": file["name"], "file": file})
+                files_to_analyze.append({"season_path": season["path"], "name": file["name"]})
 
+        # Аналіз триває довго, тож виконується поза записувачем; результати
+        # застосовуються однією зміною
         with ThreadPoolExecutor(max_workers=4) as executor:
             results = list(executor.map(process_video, files_to_analyze))
 
-        save_metadata(metadata)
+        def mutation(metadata, index):
+            updated = None
+            for file_info in files_to_analyze:
+                owner, _, file = index.get_file(file_info["season_path"], file_info["name"])
+                if file is not None:
+                    file["recommendToSkip"] = file_info["recommendToSkip"]
+                    updated = owner
+            return None, [updated] if updated else [], []
+
+        mutate_metadata(mutation)
         return jsonify({"status": "success", "results": results})
     
     @app.route('/api/analyze/file', methods=['POST'])
@@ -449,12 +661,21 @@ def register_routes(app):
 
         extension = os.path.splitext(video_path)[-1].lower()
         if extension == ".avi":
-            # Конвертація AVI у MP4
-            converted_path = video_path.replace(".avi", ".mp4")
-            if not os.path.exists(converted_path):
-                success = convert_to_mp4(video_path, converted_path)
-                if not success:
-                    return jsonify({"status": "error", "message": "Failed to convert file"}), 500
+            # Конвертація AVI у MP4 у кеш (а не поруч із відео на диску з медіа)
+            converted_path = cache_manager.artifact_path("transcodes", video_path)
+            if not converted_path:
+                return jsonify({"status": "error", "message": "File not found"}), 404
+            with cache_manager.lock_for(converted_path):
+                if not os.path.exists(converted_path):
+                    os.makedirs(os.path.dirname(converted_path), exist_ok=True)
+                    partial_path = f"{os.path.splitext(converted_path)[0]}.partial.mp4"
+                    if not convert_to_mp4(video_path, partial_path):
+                        if os.path.exists(partial_path):
+                            os.remove(partial_path)
+                        return jsonify({"status": "error", "message": "Failed to convert file"}), 500
+                    os.replace(partial_path, converted_path)
+                    cache_manager.record("transcodes", video_path, [converted_path])
+            cache_manager.touch(converted_path)
             video_path = converted_path
         
         # Визначення MIME-типу
@@ -485,7 +706,11 @@ def register_routes(app):
                     'Content-Type': mime_type
                 }
 
-                return Response(data, status=206, headers=headers)
+                response = Response(data, status=206, headers=headers)
+                # Поки віддається відео, фонове створення мініатюр чекає
+                thumbnail_prewarmer.playback_started()
+                response.call_on_close(thumbnail_prewarmer.playback_finished)
+                return response
 
             # Потокова передача всього файлу без Range-запиту
             def generate():
@@ -498,7 +723,10 @@ def register_routes(app):
                 'Content-Type': mime_type
             }
 
-            return Response(generate(), headers=headers)
+            response = Response(generate(), headers=headers)
+            thumbnail_prewarmer.playback_started()
+            response.call_on_close(thumbnail_prewarmer.playback_finished)
+            return response
         except Exception as e:
             import traceback
             print("Error:", traceback.format_exc())
@@ -506,11 +734,14 @@ def register_routes(app):
 
     @app.route('/api/metadata/item/<string:item_id>', methods=['GET'])
     def get_metadata_by_id(item_id):
-        metadata = load_metadata()
-        item, _ = find_metadata_item(metadata, item_id=item_id)
-        if item:
-            return jsonify({"status": "success", "item": item})
-        return error_response("Item not found")
+        def build():
+            metadata = load_metadata()
+            item, _ = find_metadata_item(metadata, item_id=item_id)
+            if item:
+                return jsonify({"status": "success", "item": item})
+            return error_response("Item not found")
+
+        return conditional_response(build)
 
     @app.route('/api/metadata/item', methods=['GET'])
     def get_metadata_item():
@@ -519,36 +750,52 @@ def register_routes(app):
             return error_response("Path is required")
 
         metadata = load_metadata()
-        for category in ["series", "movies"]:
-            for item in metadata[category]:
-                if os.path.normpath(item["path"]) == os.path.normpath(path):
-                    return jsonify({"status": "success", "item": item})
+        item, _ = find_metadata_item(metadata, path=path)
+        if item:
+            return jsonify({"status": "success", "item": item})
 
         return error_response("Item not found")
 
     @app.route('/api/metadata/search', methods=['GET'])
     def search_metadata():
-        query = request.args.get('query', "").lower()
-        metadata = load_metadata()
-        results = {"series": [], "movies": []}
+        """
+        Ранжований пошук по назвах, тегах, сезонах і назвах епізодів з підтримкою
+        префіксів і однієї помилки у слові.
 
-        for category in ["series", "movies"]:
-            for item in metadata[category]:
-                if query in item.get("title", "").lower() or query in " ".join(item.get("tags", [])).lower():
-                    results[category].append(item)
+        Query Parameters:
+            query (str): Пошуковий запит.
+            limit (int, optional): Максимальна кількість результатів (за замовчуванням 20).
 
-        return jsonify({"status": "success", "results": results})
+        Returns:
+            Response: Компактні результати, згруповані за категоріями у порядку релевантності.
+        """
+        query = request.args.get('query', "")
+        try:
+            limit = max(1, min(int(request.args.get('limit', 20)), 200))
+        except ValueError:
+            return error_response("Field `limit` must be an integer", 400)
+
+        hits = load_search_index().search(query, limit=limit)
+        results = {"series": [], "movies": [], "online_series": []}
+        for hit in hits:
+            results[hit["category"]].append(hit)
+
+        return jsonify({"status": "success", "results": results, "total": len(hits)})
 
     @app.route('/api/metadata/item/<string:item_id>', methods=['PUT'])
     def update_metadata_by_id(item_id):
         data = request.json
-        metadata = load_metadata()
-        item, category = find_metadata_item(metadata, item_id=item_id)
 
-        if item:
+        def mutation(metadata, index):
+            item, category = find_metadata_item(metadata, item_id=item_id)
+            if not item:
+                return None, [], []
             item.update(data)
             item["last_modified"] = datetime.now().isoformat()
-            save_metadata(metadata)
+            return item, [item], []
+
+        item = mutate_metadata(mutation)
+        if item:
             return jsonify({"status": "success", "message": "Metadata updated", "item": item})
 
         return error_response("Item not found")
@@ -575,51 +822,212 @@ def register_routes(app):
         else:
             return error_response(message, 404)
 
+    @app.route('/api/metadata/list', methods=['GET'])
+    def list_catalog():
+        """
+        Посторінковий список каталогу з проєкцією полів і серверним сортуванням.
+
+        Query Parameters:
+            category (str, optional): series, movies, online_series або all (за замовчуванням).
+            sort (str, optional): title або last_modified; префікс "-" - зворотний порядок.
+            fields (str, optional): Поля через кому (за замовчуванням id,title,type,tags,thumbnail).
+            limit (int, optional): Розмір сторінки (за замовчуванням 50, максимум 500).
+            cursor (str, optional): Курсор наступної сторінки з попередньої відповіді.
+
+        Returns:
+            Response: Сторінка записів і курсор наступної сторінки.
+        """
+        category = request.args.get('category', 'all')
+        categories = ["series", "movies", "online_series"] if category == 'all' else [category]
+        if any(c not in ("series", "movies", "online_series") for c in categories):
+            return error_response("Unknown category", 400)
+
+        sort = request.args.get('sort', 'title')
+        descending = sort.startswith('-')
+        sort_field = sort.lstrip('-')
+        if sort_field not in SORT_KEYS:
+            return error_response(f"Unsupported sort key: {sort_field}", 400)
+
+        fields = [f for f in request.args.get('fields', '').split(',') if f] or CATALOG_DEFAULT_FIELDS
+
+        try:
+            limit = max(1, min(int(request.args.get('limit', 50)), 500))
+        except ValueError:
+            return error_response("Field `limit` must be an integer", 400)
+
+        after = None
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                cursor_sort, after = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode('utf-8'))
+            except (ValueError, TypeError):
+                return error_response("Invalid cursor", 400)
+            if cursor_sort != sort:
+                return error_response("Cursor does not match sort order", 400)
+
+        try:
+            index = load_metadata_index()
+        except Exception as e:
+            return error_response(f"Failed to load metadata: {str(e)}", 500)
+
+        entries, next_after, total = index.page(categories, sort_field, descending, after, limit)
+        next_cursor = None
+        if next_after:
+            payload = json.dumps([sort, list(next_after)], ensure_ascii=False)
+            next_cursor = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+        # Проєкції записів кодуються потоково, порціями
+        return Response(iter_json_object({
+            "status": "success",
+            "items": (catalog_entry(item, item_category, fields) for item, item_category in entries),
+            "next_cursor": next_cursor,
+            "total": total
+        }, lock=store.lock), mimetype="application/json")
+
+    @app.before_request
+    def start_background_services():
+        # Сервіси стартують лише в процесі, що обслуговує запити
+        # (а не в процесі-спостерігачі перезавантажувача debug-режиму)
+        scan_service.start()
+        if WATCHER_ENABLED:
+            fs_watcher.start()
+        if REPLICATION_ENABLED:
+            replicator.start()
+        cache_manager.start()
+
     # API endpoint to get metadata
     @app.route('/api/metadata', methods=['GET'])
     def get_metadata():
-        metadata = load_metadata()
-        metadata = auto_add_metadata(metadata)
-        # Сортуємо колекції за алфавітом (title)
-        for category in ["series", "movies", "online_series"]:
-            if category in metadata:
-                metadata[category] = sorted(
-                    metadata[category], key=lambda x: x.get("title", "").lower()
-                )
-        save_metadata(metadata)
-        return jsonify(metadata)
+        """
+        Повертає останній опублікований стан метаданих без сканування дисків
+        (сканування виконує фоновий scan_service). Підтримує умовні запити:
+        якщо бібліотека не змінилась, повертається 304.
+        """
+        def build():
+            index = load_metadata_index()
+            metadata = dict(index.metadata)
+            # Сортуємо колекції за алфавітом (title), використовуючи готовий порядок з індексу
+            for category in ["series", "movies", "online_series"]:
+                if category in metadata:
+                    metadata[category] = [
+                        index.items_by_id[item_id][0]
+                        for _, item_id in index.sort_order([category], "title")
+                        if item_id in index.items_by_id
+                    ]
+            # Документ кодується потоково порціями записів, а не одним рядком у пам'яті
+            return Response(iter_json_object(metadata, lock=store.lock), mimetype="application/json")
+
+        return conditional_response(build)
 
     # API endpoint to force update metadata
     @app.route('/api/metadata/force-update', methods=['POST'])
     def force_update_metadata():
-        metadata = load_metadata()
-        metadata = auto_add_metadata(metadata, force_update=True)
-        save_metadata(metadata)
+        if not scan_service.trigger(force=True, wait=True):
+            return error_response("Metadata update did not finish in time", 504)
+        if scan_service.last_error:
+            return error_response(f"Failed to update metadata: {scan_service.last_error}", 500)
         return jsonify({"status": "success", "message": "Metadata forcibly updated"})
 
+    @app.route('/api/metadata/scan', methods=['POST'])
+    def trigger_scan():
+        """
+        Ставить фонове сканування файлової системи в чергу.
+
+        Body Parameters:
+            force (bool, optional): Примусово оновити всі записи.
+            wait (bool, optional): Дочекатися завершення сканування.
+
+        Returns:
+            Response: Статус сканування.
+        """
+        data = request.get_json(silent=True) or {}
+        scan_service.trigger(force=bool(data.get('force')), wait=bool(data.get('wait')))
+        return jsonify({"status": "success", "scan": scan_service.status()}), 202
+
+    @app.route('/api/metadata/changes', methods=['GET'])
+    def get_metadata_changes():
+        """
+        Повертає записи, додані, змінені або видалені після вказаної версії.
+
+        Query Parameters:
+            since (int): Версія, з якою клієнт уже синхронізований
+                (заголовок X-Metadata-Version або `version` попередньої відповіді).
+
+        Returns:
+            Response: Поточна версія, змінені записи з категоріями та id видалених.
+            Якщо історія для `since` вже недоступна, `resync` дорівнює true і клієнт
+            має перезавантажити /api/metadata.
+        """
+        try:
+            since = int(request.args.get('since'))
+        except (TypeError, ValueError):
+            return error_response("Field `since` must be an integer", 400)
+
+        try:
+            index = load_metadata_index()
+        except Exception as e:
+            return error_response(f"Failed to load metadata: {str(e)}", 500)
+
+        with store.lock:
+            version = store.version
+            changes = store.change_log.since(since) if since <= version else None
+            if changes is None:
+                return jsonify({"status": "success", "resync": True, "version": version})
+
+            changed = []
+            deleted = []
+            for item_id in changes:
+                item, category = index.get_item(item_id)
+                if item is None:
+                    deleted.append(item_id)
+                else:
+                    changed.append({"category": category, "item": item})
+
+            return jsonify({
+                "status": "success",
+                "resync": False,
+                "version": version,
+                "changed": changed,
+                "deleted": deleted
+            })
+
+    @app.route('/api/metadata/scan/status', methods=['GET'])
+    def get_scan_status():
+        return jsonify({
+            "status": "success",
+            "scan": scan_service.status(),
+            "watcher": fs_watcher.status(),
+            "replication": replicator.status(),
+            "thumbnails": thumbnail_service.status(),
+            "thumbnail_index": thumbnail_index.status(),
+            "thumbnail_prewarm": thumbnail_prewarmer.status(),
+            "trickplay": trickplay_service.status()
+        })
+
     # API endpoint to add or update metadata
     @app.route('/api/metadata/add', methods=['POST'])
     def add_metadata():
         data = request.json
-        metadata = load_metadata()
 
-        # Check if the item already exists in metadata
-        for item in metadata["series"] + metadata["movies"]:
-            if os.path.normpath(item["path"]) == os.path.normpath(data["path"]):
+        def mutation(metadata, index):
+            # Check if the item already exists in metadata
+            item, _ = find_metadata_item(metadata, path=data["path"])
+            if item:
                 item.update(data)
                 item["auto_added"] = False
                 item["last_modified"] = datetime.now().isoformat()
-                save_metadata(metadata)
-                return jsonify({"status": "success", "message": "Metadata updated"})
-
-        # Add new metadata
-        data["id"] = str(uuid.uuid4())
-        data["auto_added"] = False
-        data["last_modified"] = datetime.now().isoformat()
-        category = "series" if "series" in data["tags"] else "movies"
-        metadata[category].append(data)
-        save_metadata(metadata)
-        return jsonify({"status": "success", "message": "Metadata added"})
+                return "Metadata updated", [item], []
+
+            # Add new metadata
+            data["id"] = str(uuid.uuid4())
+            data["auto_added"] = False
+            data["last_modified"] = datetime.now().isoformat()
+            category = "series" if "series" in data["tags"] else "movies"
+            metadata[category].append(data)
+            return "Metadata added", [data], []
+
+        message = mutate_metadata(mutation)
+        return jsonify({"status": "success", "message": message})
 
     # API endpoint to delete metadata
     @app.route('/api/metadata/delete', methods=['POST'])
@@ -639,15 +1047,16 @@ def register_routes(app):
         if not record_id:
             return error_response("Field `id` is required", 400)
 
-        metadata = load_metadata()
-
         # Пошук і видалення запису
-        for category in ["series", "movies", "online_series"]:
-            for item in metadata.get(category, []):
-                if item.get("id") == record_id:
-                    metadata[category].remove(item)
-                    save_metadata(metadata)
-                    return jsonify({"status": "success", "message": "Metadata deleted"}), 200
+        def mutation(metadata, index):
+            item, category = index.get_item(record_id)
+            if not item:
+                return False, [], []
+            metadata[category].remove(item)
+            return True, [], [record_id]
+
+        if mutate_metadata(mutation):
+            return jsonify({"status": "success", "message": "Metadata deleted"}), 200
 
         return error_response("Item not found", 404)
 
@@ -657,23 +1066,159 @@ def register_routes(app):
         if not folder_or_file_path:
             return error_response("Invalid folder or file path")
 
-        if os.path.isfile(folder_or_file_path):
-            # Якщо це файл, безпосередньо викликаємо get_or_create_thumbnail
-            video_path = folder_or_file_path
-            thumbnail_path = get_or_create_thumbnail(video_path)
-        else:
-            # Якщо це папка, знаходимо перший відеофайл у папці
-            video_path = find_first_video_in_directory(folder_or_file_path)
-            if not video_path:
-                return error_response("No video files found in directory")
-            thumbnail_path = get_or_create_thumbnail(folder_or_file_path)
+        size, image_format, negotiated = choose_thumbnail_variant()
+        if size is None:
+            return error_response(f"Unknown thumbnail size, expected one of: {', '.join(THUMBNAIL_SIZES)}")
+        if image_format is None:
+            return error_response(f"Unknown thumbnail format, expected one of: {', '.join(THUMBNAIL_FORMATS)}")
 
-        # Виклик функції get_or_create_thumbnail для створення мініатюри, якщо вона не існує
-        
-        if thumbnail_path:
-            return send_file(thumbnail_path, mimetype='image/jpeg')
+        # Відео і ключ кешу для папки беруться з індексу в пам'яті (без os.walk на диску з медіа)
+        video_path, cache_key = thumbnail_index.resolve(folder_or_file_path)
+        if not video_path:
+            return error_response("No video files found in directory")
+        target = variant_target(video_path, cache_key, size, image_format)
+
+        # Повторна перевірка кешу браузера: ETag - ім'я файлу варіанта, тож 304 без звертань до дисків
+        if request.if_none_match.contains(target["name"]):
+            cache_manager.touch(target["path"])
+            return thumbnail_validators(Response(status=304), target, negotiated, immutable=False)
+
+        # Генерація йде в пулі thumbnail_service; запит чекає не довше `wait` секунд
+        try:
+            wait = min(max(float(request.args.get('wait', THUMBNAIL_WAIT_TIMEOUT)), 0), THUMBNAIL_WAIT_TIMEOUT)
+        except ValueError:
+            return error_response("Invalid wait value")
+
+        state, thumbnail_path = thumbnail_service.get(target, timeout=wait)
+        if state == "failed" and image_format == "webp" and negotiated:
+            # ffmpeg без libwebp - віддаємо JPEG
+            target = variant_target(video_path, cache_key, size, "jpeg")
+            state, thumbnail_path = thumbnail_service.get(target, timeout=wait)
+
+        if state == "ready":
+            cache_manager.touch(thumbnail_path)
+            response = send_file(os.path.abspath(thumbnail_path), mimetype=target["mimetype"], conditional=False)
+            return thumbnail_validators(response, target, negotiated, immutable=False)
+        if state == "pending":
+            # Заглушка, поки мініатюра генерується; клієнт повторює запит через Retry-After
+            response = Response(PLACEHOLDER_SVG, status=202, mimetype='image/svg+xml')
+            response.headers["Retry-After"] = str(THUMBNAIL_RETRY_AFTER)
+            response.headers["Cache-Control"] = "no-store"
+            return response
+        return jsonify({"error": "No thumbnail could be created"}), 404
+
+    @app.route('/api/thumbnail/<string:file_name>', methods=['GET'])
+    def get_thumbnail_file(file_name):
+        """
+        Віддає варіант мініатюри за адресою вмісту (ключ у імені файлу змінюється
+        разом з відео), тож відповідь кешується браузером назавжди.
+        """
+        parsed = parse_variant_file_name(file_name)
+        if parsed is None:
+            return error_response("Invalid thumbnail name")
+        target = {"name": file_name, "mimetype": THUMBNAIL_FORMATS[parsed[2]][1]}
+
+        if request.if_none_match.contains(file_name):
+            return thumbnail_validators(Response(status=304), target, False, immutable=True)
+
+        thumbnail_path = variant_path(parsed[0], file_name)
+        if not os.path.exists(thumbnail_path):
+            return error_response("Thumbnail not found", 404)
+        cache_manager.touch(thumbnail_path)
+        response = send_file(os.path.abspath(thumbnail_path), mimetype=target["mimetype"], conditional=False)
+        return thumbnail_validators(response, target, False, immutable=True)
+
+    @app.route('/api/trickplay', methods=['GET'])
+    def get_trickplay():
+        """
+        Повертає WebVTT-індекс прев'ю для шкали перемотування. Кожен інтервал
+        посилається на клітинку аркуша кадрів (trickplay/<ключ>_trickplay.jpg#xywh=...),
+        тож перемотування не потребує жодного байта відео.
+
+        Query Parameters:
+            path (str): Шлях до відеофайлу.
+            wait (float, optional): Скільки секунд чекати на створення (за замовчуванням 0).
+
+        Returns:
+            Response: text/vtt; 202 з Retry-After, поки аркуш створюється у фоні;
+            304, якщо індекс у клієнта актуальний.
+        """
+        path = request.args.get('path')
+        if not path:
+            return error_response("Invalid file path")
+
+        video_path, cache_key = thumbnail_index.resolve(path)
+        if not video_path:
+            return error_response("Video file not found", 404)
+        target = trickplay_target(video_path, cache_key)
+
+        if request.if_none_match.contains(target["name"]):
+            cache_manager.touch(target["path"])
+            response = Response(status=304)
+            response.set_etag(target["name"])
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+
+        try:
+            wait = min(max(float(request.args.get('wait', 0)), 0), THUMBNAIL_WAIT_TIMEOUT)
+        except ValueError:
+            return error_response("Invalid wait value")
+
+        state, vtt_path = trickplay_service.get(target, timeout=wait)
+        if state == "ready":
+            cache_manager.touch(vtt_path)
+            response = send_file(os.path.abspath(vtt_path), mimetype=target["mimetype"], conditional=False)
+            response.set_etag(target["name"])
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+        if state == "pending":
+            response = jsonify({"status": "pending"})
+            response.status_code = 202
+            response.headers["Retry-After"] = str(TRICKPLAY_RETRY_AFTER)
+            response.headers["Cache-Control"] = "no-store"
+            return response
+        return error_response("No trickplay could be created", 404)
+
+    @app.route('/api/trickplay/<string:file_name>', methods=['GET'])
+    def get_trickplay_sprite(file_name):
+        """
+        Віддає аркуш кадрів за адресою вмісту (ключ змінюється разом з відео).
+        """
+        cache_key = parse_sprite_file_name(file_name)
+        if cache_key is None:
+            return error_response("Invalid trickplay name")
+
+        if request.if_none_match.contains(file_name):
+            response = Response(status=304)
         else:
-            return jsonify({"error": "No thumbnail could be created"}), 404
+            sprite_path = variant_path(cache_key, file_name)
+            if not os.path.exists(sprite_path):
+                return error_response("Trickplay not found", 404)
+            cache_manager.touch(sprite_path)
+            response = send_file(os.path.abspath(sprite_path), mimetype="image/jpeg", conditional=False)
+        response.set_etag(file_name)
+        response.headers["Cache-Control"] = f"public, max-age={THUMBNAIL_MAX_AGE}, immutable"
+        return response
+
+    @app.route('/api/cache/stats', methods=['GET'])
+    def get_cache_stats():
+        """
+        Використання кешу похідних файлів: для кожного класу (мініатюри, аркуші
+        прев'ю, аналіз, перекодовані відео) - кількість файлів, розмір, бюджет
+        і витіснення, а також результат останнього прибирання.
+        """
+        return jsonify({"status": "success", **cache_manager.status()})
+
+    @app.route('/api/cache/sweep', methods=['POST'])
+    def sweep_cache():
+        """
+        Запускає прибирання кешу одразу (сироти, недописані файли, бюджети).
+        """
+        try:
+            result = cache_manager.sweep()
+        except Exception as e:
+            return error_response(f"Cache sweep failed: {e}", 500)
+        return jsonify({"status": "success", "result": result})
 
     @app.route('/api/video/audio-tracks', methods=['GET'])
     def get_audio_tracks():
@@ -740,21 +1285,15 @@ def register_routes(app):
         if not all([season_path, file_name, track_index is not None]):
             return error_response("Missing required fields", 400)
 
-        metadata = load_metadata()
-        updated = False
-
-        for series in metadata.get("series", []):
-            for season in series.get("seasons", []):
-                if os.path.normpath(season.get("path")) == os.path.normpath(season_path):
-                    for file in season.get("files", []):
-                        if file.get("name") == file_name:
-                            file["preferredAudioTrack"] = track_index
-                            series["auto_added"] = False
-                            updated = True
-                            break
-
-        if updated:
-            save_metadata(metadata)
+        def mutation(metadata, index):
+            series, _, file = index.get_file(season_path, file_name)
+            if file is None:
+                return False, [], []
+            file["preferredAudioTrack"] = track_index
+            series["auto_added"] = False
+            return True, [series], []
+
+        if mutate_metadata(mutation):
             return jsonify({"status": "success", "message": "Audio track preference saved"}), 200
         
         return error_response("File not found in metadata", 404)
\ No newline at end of file
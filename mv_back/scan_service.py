@@ -0,0 +1,213 @@
+import os
+import copy
+import time
+import threading
+from datetime import datetime
+from metadata import auto_add_metadata, load_scan_state, save_scan_state, mutate_metadata
+from metadata_store import store, CATEGORIES
+from thumbnail_prewarm import thumbnail_prewarmer
+from thumbnail_service import thumbnail_index
+from config import SCAN_INTERVAL
+
+
+def merge_scan_result(live, baseline, scanned):
+    """
+    Тристороннє злиття результату сканування з поточним документом.
+
+    Сканування працює з копією документа, тож поки воно триває, маршрути можуть
+    змінювати живий документ. Для кожного запису:
+        - не змінений скануванням - лишається живий об'єкт;
+        - змінений лише скануванням - береться результат сканування;
+        - змінений користувачем під час сканування - перемагає живий запис;
+        - видалений користувачем під час сканування - не повертається;
+        - доданий під час сканування - зберігається.
+
+    Parameters:
+        live (dict): Поточний документ сховища.
+        baseline (dict): Копія документа на момент початку сканування.
+        scanned (dict): Результат сканування копії.
+
+    Returns:
+        tuple: (нові списки категорій, змінені записи, id видалених записів,
+            відкинуті результати сканування).
+    """
+    merged = {}
+    changed = []
+    deleted = []
+    discarded = []
+    for category in CATEGORIES:
+        if category not in live and category not in scanned:
+            continue
+        live_by_id = {item.get("id"): item for item in live.get(category, [])}
+        baseline_by_id = {item.get("id"): item for item in baseline.get(category, [])}
+        result = []
+        seen = set()
+
+        for item in scanned.get(category, []):
+            item_id = item.get("id")
+            seen.add(item_id)
+            if item_id not in baseline_by_id:
+                result.append(item)
+                changed.append(item)
+                continue
+            if item_id not in live_by_id:
+                discarded.append(item)
+                continue
+            live_item = live_by_id[item_id]
+            if item == baseline_by_id[item_id]:
+                result.append(live_item)
+            elif live_item != baseline_by_id[item_id]:
+                result.append(live_item)
+                discarded.append(item)
+            else:
+                result.append(item)
+                changed.append(item)
+
+        for item_id, live_item in live_by_id.items():
+            if item_id in seen:
+                continue
+            if item_id not in baseline_by_id or live_item != baseline_by_id[item_id]:
+                # Додано або змінено під час сканування
+                result.append(live_item)
+            else:
+                deleted.append(item_id)
+
+        merged[category] = result
+    return merged, changed, deleted, discarded
+
+
+class ScanService:
+    """
+    Фонове сканування файлової системи.
+
+    Сканування запускається за розкладом (кожні `interval` секунд) або на вимогу
+    і публікує результат у сховище метаданих, тож GET /api/metadata одразу
+    віддає останній опублікований стан, не торкаючись дисків.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pending_force = False
+        self._pending = False
+        self._done = threading.Condition()
+        self._completed = 0
+        self.state = "idle"
+        self.last_started = None
+        self.last_finished = None
+        self.last_duration = None
+        self.last_error = None
+        self.last_result = None
+        self.last_timings = []
+
+    def start(self):
+        """
+        Запускає фоновий потік (повторні виклики нічого не роблять).
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._pending = True  # Перше сканування одразу після старту
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def trigger(self, force=False, wait=False, timeout=None):
+        """
+        Ставить сканування в чергу.
+
+        Parameters:
+            force (bool): Примусово оновити всі записи (як /api/metadata/force-update).
+            wait (bool): Дочекатися завершення сканування.
+            timeout (float, optional): Максимальний час очікування в секундах.
+
+        Returns:
+            bool: True, якщо сканування завершилось (або wait=False).
+        """
+        self.start()
+        with self._done:
+            target = self._completed + (2 if self.state == "scanning" else 1)
+            self._pending = True
+            self._pending_force = self._pending_force or force
+            self._wake.set()
+            if not wait:
+                return True
+            return self._done.wait_for(lambda: self._completed >= target, timeout=timeout)
+
+    def status(self):
+        return {
+            "state": self.state,
+            "pending": self._pending,
+            "last_started": self.last_started,
+            "last_finished": self.last_finished,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+            "last_result": self.last_result,
+            "roots": self.last_timings,
+            "scans_completed": self._completed,
+            "interval": self.interval,
+        }
+
+    def _run(self):
+        while True:
+            if not self._pending:
+                self._wake.wait(timeout=self.interval)
+            self._wake.clear()
+            with self._done:
+                force = self._pending_force
+                self._pending = False
+                self._pending_force = False
+                self.state = "scanning"
+            self.run_scan(force)
+
+    def run_scan(self, force=False):
+        """
+        Сканує копію документа і публікує зміни в сховище.
+        """
+        self.state = "scanning"
+        self.last_started = datetime.now().isoformat()
+        started = time.monotonic()
+        try:
+            with store.lock:
+                live = store.get()
+                baseline = copy.deepcopy(live)
+            scan_state = load_scan_state()
+            timings = []
+            scanned = auto_add_metadata(
+                copy.deepcopy(baseline), force_update=force, scan_state=scan_state, timings=timings
+            )
+            self.last_timings = timings
+
+            def publish(live, index):
+                merged, changed, deleted, discarded = merge_scan_result(live, baseline, scanned)
+                live.update(merged)
+                return (changed, deleted, discarded), changed, deleted
+
+            # Публікація йде через записувач разом з іншими змінами
+            changed, deleted, discarded = mutate_metadata(publish)
+
+            # Відкинуті зміни не потрапили в документ, тож ці директорії
+            # мають бути переглянуті наступним скануванням
+            for item in discarded:
+                scan_state.pop(os.path.normpath(item["path"]), None)
+            save_scan_state(scan_state)
+            # Відео в папках змінених записів могли змінитись; мініатюри створюються у фоні
+            changed_paths = [item.get("path") for item in changed]
+            thumbnail_index.invalidate(changed_paths)
+            thumbnail_prewarmer.enqueue(changed_paths)
+            self.last_result = {"changed": len(changed), "deleted": len(deleted)}
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Background scan failed: {e}")
+        finally:
+            self.last_duration = round(time.monotonic() - started, 3)
+            self.last_finished = datetime.now().isoformat()
+            self.state = "idle"
+            with self._done:
+                self._completed += 1
+                self._done.notify_all()
+
+
+scan_service = ScanService(SCAN_INTERVAL)
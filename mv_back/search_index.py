@@ -0,0 +1,248 @@
+import os
+import re
+import bisect
+import threading
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Вага поля в ранжуванні
+FIELD_WEIGHTS = {
+    "title": 10.0,
+    "tag": 6.0,
+    "season": 3.0,
+    "episode": 1.0,
+}
+
+# Множники для типу збігу терміну запиту з токеном
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.7
+FUZZY_MATCH = 0.4
+
+MIN_PREFIX_LENGTH = 2       # Коротші терміни шукаються лише точним збігом
+MIN_FUZZY_LENGTH = 4        # Коротші терміни не шукаються з помилками
+MAX_PREFIX_EXPANSIONS = 200 # Максимум токенів, на які розгортається один префікс
+
+SEARCH_CATEGORIES = ["series", "movies", "online_series"]
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.casefold()) if text else []
+
+
+def _deletions(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def within_one_edit(a, b):
+    """
+    Перевіряє, що відстань Дамерау-Левенштейна між рядками не більша за 1.
+    """
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diffs = [i for i in range(la) if a[i] != b[i]]
+        if len(diffs) == 1:
+            return True
+        return (
+            len(diffs) == 2 and diffs[1] == diffs[0] + 1 and
+            a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]]
+        )
+    if la > lb:
+        a, b = b, a
+    # b довший на один символ: шукаємо вставку
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+def _item_fields(item):
+    """
+    Повертає пари (поле, текст, деталі збігу) для індексації запису.
+    """
+    yield "title", item.get("title"), None
+    for tag in item.get("tags") or []:
+        yield "tag", tag, None
+    for season in item.get("seasons") or []:
+        yield "season", season.get("title"), {"season": season.get("title")}
+        for file in season.get("files") or []:
+            name = os.path.splitext(file.get("name") or "")[0]
+            yield "episode", name, {"season": season.get("title"), "file": file.get("name")}
+        for episode in season.get("episodes") or []:
+            yield "episode", episode.get("title"), {"season": season.get("title"), "episode": episode.get("title")}
+    for part in item.get("parts") or []:
+        name = os.path.splitext(part.get("title") or "")[0]
+        yield "episode", name, {"file": part.get("title")}
+
+
+class SearchIndex:
+    """
+    Інвертований токен-індекс для пошуку по назвах, тегах, сезонах та епізодах.
+
+    Для кожного токена зберігається найкраще поле, в якому він трапляється в записі,
+    тож розмір постингу обмежений кількістю записів, а не епізодів. Підтримуються
+    префіксний пошук (відсортований словник токенів) і пошук з однією помилкою
+    (індекс видалень одного символу). Оновлюється інкрементно для окремих записів.
+    """
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self._lock = threading.RLock()
+        self.postings = {}          # токен -> {id: (вага, поле, деталі)}
+        self.sorted_tokens = []
+        self.deletes = {}           # варіант з видаленим символом -> {токени}
+        self.items = {}             # id -> (item, category)
+        self._tokens_by_id = {}
+        for category in SEARCH_CATEGORIES:
+            for item in metadata.get(category, []):
+                self._add_item(item, category)
+
+    def _add_token(self, token):
+        bisect.insort(self.sorted_tokens, token)
+        if len(token) >= MIN_FUZZY_LENGTH - 1:
+            for variant in _deletions(token):
+                self.deletes.setdefault(variant, set()).add(token)
+
+    def _remove_token(self, token):
+        del self.postings[token]
+        position = bisect.bisect_left(self.sorted_tokens, token)
+        if position < len(self.sorted_tokens) and self.sorted_tokens[position] == token:
+            del self.sorted_tokens[position]
+        if len(token) >= MIN_FUZZY_LENGTH - 1:
+            for variant in _deletions(token):
+                tokens = self.deletes.get(variant)
+                if tokens is not None:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self.deletes[variant]
+
+    def _add_item(self, item, category):
+        item_id = item.get("id")
+        best = {}
+        for field, text, detail in _item_fields(item):
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenize(text):
+                if token not in best or best[token][0] < weight:
+                    best[token] = (weight, field, detail)
+
+        for token, posting in best.items():
+            if token not in self.postings:
+                self.postings[token] = {}
+                self._add_token(token)
+            self.postings[token][item_id] = posting
+        self.items[item_id] = (item, category)
+        self._tokens_by_id[item_id] = list(best)
+
+    def _drop_item(self, item_id):
+        for token in self._tokens_by_id.pop(item_id, []):
+            postings = self.postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(item_id, None)
+            if not postings:
+                self._remove_token(token)
+        self.items.pop(item_id, None)
+
+    def reindex_item(self, item, category):
+        with self._lock:
+            self._drop_item(item.get("id"))
+            self._add_item(item, category)
+
+    def remove_item(self, item_id):
+        with self._lock:
+            self._drop_item(item_id)
+
+    def _expand_term(self, term):
+        """
+        Повертає {токен: множник збігу} для одного терміну запиту.
+        """
+        matches = {}
+        if term in self.postings:
+            matches[term] = EXACT_MATCH
+
+        if len(term) >= MIN_PREFIX_LENGTH:
+            position = bisect.bisect_left(self.sorted_tokens, term)
+            expanded = 0
+            while (
+                position < len(self.sorted_tokens) and
+                expanded < MAX_PREFIX_EXPANSIONS and
+                self.sorted_tokens[position].startswith(term)
+            ):
+                matches.setdefault(self.sorted_tokens[position], PREFIX_MATCH)
+                position += 1
+                expanded += 1
+
+        if len(term) >= MIN_FUZZY_LENGTH:
+            candidates = set(self.deletes.get(term, ()))
+            for variant in _deletions(term):
+                if variant in self.postings:
+                    candidates.add(variant)
+                candidates.update(self.deletes.get(variant, ()))
+            for token in candidates:
+                if token not in matches and within_one_edit(term, token):
+                    matches[token] = FUZZY_MATCH
+        return matches
+
+    def search(self, query, limit=20):
+        """
+        Шукає записи за запитом. Кожен термін запиту має збігтися (точно, за
+        префіксом або з однією помилкою); записи ранжуються за сумою ваг.
+
+        Parameters:
+            query (str): Пошуковий запит.
+            limit (int): Максимальна кількість результатів.
+
+        Returns:
+            list: Компактні результати, відсортовані за релевантністю.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            scores = None
+            details = {}
+            for term in terms:
+                term_scores = {}
+                for token, factor in self._expand_term(term).items():
+                    for item_id, (weight, field, detail) in self.postings[token].items():
+                        score = weight * factor
+                        if score > term_scores.get(item_id, (0,))[0]:
+                            term_scores[item_id] = (score, field, detail)
+                if scores is None:
+                    scores = {item_id: value[0] for item_id, value in term_scores.items()}
+                else:
+                    scores = {
+                        item_id: total + term_scores[item_id][0]
+                        for item_id, total in scores.items() if item_id in term_scores
+                    }
+                for item_id, (score, field, detail) in term_scores.items():
+                    if item_id in scores and score >= details.get(item_id, (0,))[0]:
+                        details[item_id] = (score, field, detail)
+                if not scores:
+                    return []
+
+            ranked = sorted(
+                scores.items(),
+                key=lambda entry: (-entry[1], (self.items[entry[0]][0].get("title") or "").casefold())
+            )[:limit]
+
+            hits = []
+            for item_id, score in ranked:
+                item, category = self.items[item_id]
+                _, field, detail = details[item_id]
+                hit = {
+                    "id": item_id,
+                    "title": item.get("title"),
+                    "type": item.get("type"),
+                    "category": category,
+                    "score": round(score, 3),
+                    "matched": field,
+                }
+                if detail:
+                    hit.update(detail)
+                hits.append(hit)
+            return hits
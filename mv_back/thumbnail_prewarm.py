@@ -0,0 +1,175 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+from thumbnails import variant_target, is_thumbnail_fresh
+from thumbnail_service import thumbnail_service, thumbnail_index
+from config import THUMBNAIL_PREWARM_ENABLED, THUMBNAIL_PREWARM_IDLE_GRACE, THUMBNAIL_DEFAULT_SIZE
+
+# Варіанти, які запитує сітка каталогу (браузери - WebP, інші клієнти - JPEG)
+PREWARM_VARIANTS = ((THUMBNAIL_DEFAULT_SIZE, "webp"), (THUMBNAIL_DEFAULT_SIZE, "jpeg"))
+
+
+class ThumbnailPrewarmer:
+    """
+    Фонове попереднє створення мініатюр для нових і змінених записів.
+
+    Після сканування або події спостерігача шляхи записів ставляться в чергу;
+    фоновий потік створює відсутні чи застарілі мініатюри, починаючи з
+    найстаріших відео. Робота має низький пріоритет: одночасно генерується
+    лише одна мініатюра і лише тоді, коли пул мініатюр вільний і вже
+    `idle_grace` секунд не віддавалось відео.
+    """
+
+    def __init__(self, enabled, idle_grace):
+        self.enabled = enabled
+        self.idle_grace = idle_grace
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._incoming = {}  # шлях -> None (впорядкована множина)
+        self._heap = []
+        self._queued = set()
+        self._sequence = itertools.count()
+        self._active_streams = 0
+        self._last_playback = None
+        self.state = "idle"
+        self.current = None
+        self.run_total = 0
+        self.generated = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def enqueue(self, paths):
+        """
+        Ставить у чергу шляхи записів (папки чи файли), для яких потрібні мініатюри.
+        Якщо попереднє створення вимкнене, нічого не робить.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            for path in paths:
+                if path:
+                    self._incoming[path] = None
+        self.start()
+        self._wake.set()
+
+    # --- Відстеження відтворення відео ---
+
+    def playback_started(self):
+        with self._lock:
+            self._active_streams += 1
+            self._last_playback = time.monotonic()
+
+    def playback_finished(self):
+        with self._lock:
+            self._active_streams = max(self._active_streams - 1, 0)
+            self._last_playback = time.monotonic()
+
+    def is_busy(self):
+        """
+        Система зайнята: віддається відео (або віддавалось менш ніж `idle_grace`
+        секунд тому) чи пул мініатюр обробляє запити клієнтів.
+        """
+        with self._lock:
+            if self._active_streams > 0:
+                return True
+            if self._last_playback is not None and time.monotonic() - self._last_playback < self.idle_grace:
+                return True
+        return thumbnail_service.inflight() > 0
+
+    def status(self):
+        with self._lock:
+            queued = len(self._heap) + len(self._incoming)
+            processed = self.run_total - len(self._heap)
+            return {
+                "enabled": self.enabled,
+                "state": self.state,
+                "current": self.current,
+                "queued": queued,
+                "progress": {"done": max(processed, 0), "total": self.run_total},
+                "generated": self.generated,
+                "skipped": self.skipped,
+                "failed": self.failed,
+            }
+
+    # --- Фоновий потік ---
+
+    def _collect(self):
+        """
+        Переносить нові шляхи в чергу з пріоритетом: визначає відео і мініатюру,
+        пропускає актуальні мініатюри, впорядковує за часом зміни відео.
+        """
+        with self._lock:
+            paths = list(self._incoming)
+            self._incoming.clear()
+        sources = [thumbnail_index.resolve(path) for path in paths]
+        for (video_path, cache_key), (size, image_format) in itertools.product(sources, PREWARM_VARIANTS):
+            if not video_path:
+                continue
+            target = variant_target(video_path, cache_key, size, image_format)
+            if is_thumbnail_fresh(target) or thumbnail_service.recently_failed(target):
+                with self._lock:
+                    self.skipped += 1
+                continue
+            try:
+                mtime = os.path.getmtime(video_path)
+            except OSError:
+                continue
+            with self._lock:
+                if target["path"] in self._queued:
+                    continue
+                if not self._heap:
+                    self.run_total = 0  # Новий прохід
+                self._queued.add(target["path"])
+                heapq.heappush(self._heap, (mtime, next(self._sequence), target))
+                self.run_total += 1
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            while True:
+                self._collect()
+                with self._lock:
+                    if not self._heap:
+                        self.state = "idle"
+                        self.current = None
+                        break
+                if self.is_busy():
+                    self.state = "paused"
+                    self._wake.wait(timeout=1.0)
+                    self._wake.clear()
+                    continue
+
+                with self._lock:
+                    _, _, target = heapq.heappop(self._heap)
+                    self._queued.discard(target["path"])
+                    self.state = "running"
+                    self.current = target["video_path"]
+                try:
+                    # Мініатюру могли створити на запит клієнта, поки задача чекала
+                    if is_thumbnail_fresh(target):
+                        with self._lock:
+                            self.skipped += 1
+                        continue
+                    result = thumbnail_service.submit(target).result()
+                except Exception as e:
+                    print(f"Thumbnail prewarm failed for {target['video_path']}: {e}")
+                    result = None
+                with self._lock:
+                    if result:
+                        self.generated += 1
+                    else:
+                        self.failed += 1
+
+
+thumbnail_prewarmer = ThumbnailPrewarmer(THUMBNAIL_PREWARM_ENABLED, THUMBNAIL_PREWARM_IDLE_GRACE)
@@ -0,0 +1,199 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from thumbnails import create_thumbnail, is_thumbnail_fresh, resolve_thumbnail_source, get_extraction_stats
+from cache_manager import cache_manager
+from config import THUMBNAIL_WORKERS, THUMBNAIL_FAILURE_TTL, THUMBNAIL_INDEX_TTL
+
+# Сіра заглушка 16:9, яку клієнт бачить, поки мініатюра генерується
+PLACEHOLDER_SVG = (
+    b'<svg xmlns="http://www.w3.org/2000/svg" width="320" height="180" viewBox="0 0 320 180">'
+    b'<rect width="320" height="180" fill="#2b2b2b"/></svg>'
+)
+
+
+class ThumbnailService:
+    """
+    Генерація мініатюр в обмеженому пулі потоків.
+
+    Одночасно працює не більше `max_workers` процесів ffmpeg; решта запитів
+    чекає в черзі. Запити на ту саму мініатюру об'єднуються (single-flight):
+    поки генерація триває, нові запити отримують ту саму задачу замість
+    запуску ще одного ffmpeg. Невдачі запам'ятовуються на `failure_ttl` секунд,
+    щоб пошкоджений файл не перезапускав ffmpeg на кожен запит.
+
+    Підкласи (trickplay.TrickplayService) перевизначають `create` і `is_fresh`,
+    щоб так само генерувати інші похідні файли відео. Створені файли
+    (`artifact_fields` опису) реєструються в cache_manager під класом `cache_class`.
+    """
+
+    create = staticmethod(create_thumbnail)
+    is_fresh = staticmethod(is_thumbnail_fresh)
+    cache_class = "thumbnails"
+    artifact_fields = ("path", "master_path")
+
+    def __init__(self, max_workers, failure_ttl, name="thumbnail"):
+        self.max_workers = max_workers
+        self.failure_ttl = failure_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._failures = {}
+        self.generated = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    @staticmethod
+    def _key(thumbnail_path):
+        return os.path.normcase(os.path.normpath(thumbnail_path))
+
+    def submit(self, target):
+        """
+        Ставить генерацію мініатюри в чергу або повертає вже наявну задачу для неї.
+
+        Parameters:
+            target (dict): Опис мініатюри з thumbnails.thumbnail_target.
+
+        Returns:
+            Future: Результат - шлях до мініатюри або None.
+        """
+        key = self._key(target["path"])
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = self._executor.submit(self._generate, key, target)
+            self._inflight[key] = future
+            return future
+
+    def _generate(self, key, target):
+        try:
+            # Поки задача чекала в черзі, мініатюру міг створити інший процес
+            if self.is_fresh(target):
+                return target["path"]
+            result = self.create(target)
+            if result:
+                cache_manager.record(self.cache_class, target["video_path"], [target[field] for field in self.artifact_fields])
+            with self._lock:
+                if result:
+                    self.generated += 1
+                    self._failures.pop(key, None)
+                else:
+                    self.failed += 1
+                    self._failures[key] = time.monotonic()
+            return result
+        except Exception as e:
+            print(f"Generation of {target['path']} failed for {target['video_path']}: {e}")
+            with self._lock:
+                self.failed += 1
+                self._failures[key] = time.monotonic()
+            return None
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def recently_failed(self, target):
+        """
+        Чи завершилась генерація цієї мініатюри невдачею протягом `failure_ttl` секунд.
+        """
+        key = self._key(target["path"])
+        with self._lock:
+            failed_at = self._failures.get(key)
+            if failed_at is None:
+                return False
+            if time.monotonic() - failed_at > self.failure_ttl:
+                del self._failures[key]
+                return False
+            return True
+
+    def get(self, target, timeout):
+        """
+        Повертає мініатюру, за потреби запускаючи генерацію і чекаючи її до `timeout` секунд.
+
+        Returns:
+            tuple: ("ready", шлях), ("pending", None) - генерація ще триває,
+            або ("failed", None).
+        """
+        if self.is_fresh(target):
+            return "ready", target["path"]
+        if self.recently_failed(target):
+            return "failed", None
+
+        future = self.submit(target)
+        try:
+            result = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            return "pending", None
+        return ("ready", result) if result else ("failed", None)
+
+    def inflight(self):
+        with self._lock:
+            return len(self._inflight)
+
+    def status(self):
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "inflight": len(self._inflight),
+                "generated": self.generated,
+                "coalesced": self.coalesced,
+                "failed": self.failed,
+                "extractors": get_extraction_stats(),
+            }
+
+
+class ThumbnailIndex:
+    """
+    Індекс у пам'яті: запитаний шлях (папка чи файл) -> (відео, ключ кешу).
+
+    Дозволяє відповідати на повторні запити мініатюр (зокрема 304) без os.walk
+    і stat на дисках з медіа. Записи скидаються, коли сканування чи спостерігач
+    бачать зміну запису (`invalidate`), і в будь-якому разі через `ttl` секунд.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.normpath(path))
+
+    def resolve(self, path):
+        """
+        Returns:
+            tuple: (шлях до відео, ключ кешу) або (None, None), якщо відео немає.
+        """
+        key = self._key(path)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[2] < self.ttl:
+                self.hits += 1
+                return entry[0], entry[1]
+            self.misses += 1
+
+        video_path, cache_key = resolve_thumbnail_source(path)
+        if video_path:
+            with self._lock:
+                self._entries[key] = (video_path, cache_key, now)
+        return video_path, cache_key
+
+    def invalidate(self, paths):
+        with self._lock:
+            for path in paths:
+                if path:
+                    self._entries.pop(self._key(path), None)
+
+    def status(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+thumbnail_service = ThumbnailService(THUMBNAIL_WORKERS, THUMBNAIL_FAILURE_TTL)
+thumbnail_index = ThumbnailIndex(THUMBNAIL_INDEX_TTL)
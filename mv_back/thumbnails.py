@@ -1,10 +1,34 @@
 import os
+import re
+import json
+import time
+import hashlib
+import threading
 import subprocess
 from datetime import datetime
-import win32com.client
+from config import (
+    THUMBNAIL_SIZES, THUMBNAIL_DEFAULT_SIZE, THUMBNAIL_WEBP_QUALITY, THUMBNAIL_EXTRACTORS,
+    THUMBNAIL_SEEK_FRACTION, THUMBNAIL_EXTRACT_TIMEOUT, THUMBNAIL_SCENE_MAX_SECONDS
+)
+
+try:
+    import win32com.client
+except ImportError:
+    win32com = None  # pywin32 є лише на Windows; етап "shell" тоді пропускається
 
 THUMBNAILS_DIR = "thumbnails"
 
+# Формат -> (розширення, MIME-тип, параметри кодування ffmpeg)
+THUMBNAIL_FORMATS = {
+    "jpeg": ("jpg", "image/jpeg", ["-q:v", "5"]),
+    "webp": ("webp", "image/webp", ["-c:v", "libwebp", "-quality", str(THUMBNAIL_WEBP_QUALITY)]),
+}
+
+# Кадр найбільшого розміру, з якого масштабуються всі варіанти
+MASTER_WIDTH = max(THUMBNAIL_SIZES.values())
+
+VARIANT_NAME_PATTERN = re.compile(r"^([0-9a-f]{40})_(\w+)\.(jpg|webp)$")
+
 if not os.path.exists(THUMBNAILS_DIR):
     os.makedirs(THUMBNAILS_DIR)
 
@@ -18,22 +42,182 @@ def find_first_video_in_directory(directory):
                 return os.path.join(root, file)
     return None
 
-def extract_keyframe(video_path, thumbnail_path):
+def _run_ffmpeg(command, video_path, timeout=THUMBNAIL_EXTRACT_TIMEOUT):
+    """
+    Запускає ffmpeg з обмеженням часу.
+
+    Returns:
+        bool: Чи завершився процес успішно.
+    """
+    # Без банера і прогресу: у stderr лишаються тільки помилки
+    command = command[:1] + ["-hide_banner", "-loglevel", "error"] + command[1:]
+    try:
+        subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, timeout=timeout)
+        return True
+    except subprocess.TimeoutExpired:
+        print(f"FFmpeg timed out after {timeout}s for {video_path}")
+    except subprocess.CalledProcessError as e:
+        print(f"FFmpeg error for {video_path}: {e.stderr.decode('utf-8', errors='replace')}")
+    except OSError as e:
+        print(f"FFmpeg could not be started for {video_path}: {e}")
+    return False
+
+def _has_output(path):
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+def probe_video(video_path):
+    """
+    Читає потоки і тривалість відео через ffprobe.
+
+    Returns:
+        dict: {"streams": [...], "format": {...}} або порожній словник, якщо не вдалося.
     """
-    Генерація ключового кадру з відео.
+    command = [
+        "ffprobe",
+        "-v", "quiet",
+        "-print_format", "json",
+        "-show_streams",
+        "-show_format",
+        video_path
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=THUMBNAIL_EXTRACT_TIMEOUT)
+        return json.loads(result.stdout or "{}")
+    except (subprocess.TimeoutExpired, OSError, json.JSONDecodeError) as e:
+        print(f"FFprobe failed for {video_path}: {e}")
+        return {}
+
+def extract_attached_picture(video_path, thumbnail_path, width, media_info):
     """
+    Етап 1: вбудована обкладинка - потік з disposition attached_pic (mp4/m4v)
+    копіюється без перекодування, або вкладення-зображення MKV (cover.jpg)
+    зберігається як є. Відео не декодується взагалі.
+    """
+    for stream in media_info.get("streams", []):
+        if stream.get("codec_type") == "video" and stream.get("disposition", {}).get("attached_pic"):
+            command = [
+                "ffmpeg", "-y",
+                "-i", video_path,
+                "-map", f"0:{stream['index']}",
+                "-c", "copy",
+                "-frames:v", "1",
+                "-f", "image2",
+                thumbnail_path
+            ]
+            if _run_ffmpeg(command, video_path) and _has_output(thumbnail_path):
+                return True
+
+    for stream in media_info.get("streams", []):
+        tags = stream.get("tags", {})
+        if stream.get("codec_type") == "attachment" and tags.get("mimetype", "").startswith("image/"):
+            # ffmpeg завершується помилкою "no output file", але вкладення вже збережене
+            command = ["ffmpeg", "-y", f"-dump_attachment:{stream['index']}", thumbnail_path, "-i", video_path]
+            _run_ffmpeg(command, video_path)
+            if _has_output(thumbnail_path):
+                return True
+    return False
+
+def extract_seek_frame(video_path, thumbnail_path, width, media_info):
+    """
+    Етап 2: швидкий пошук на вході (-ss перед -i) до частки тривалості і
+    декодування одного кадру від найближчого ключового кадру.
+    """
+    try:
+        duration = float(media_info.get("format", {}).get("duration", 0))
+    except (TypeError, ValueError):
+        duration = 0
+    if duration <= 0:
+        return False
+
     command = [
-        "ffmpeg",
+        "ffmpeg", "-y",
+        "-ss", f"{duration * THUMBNAIL_SEEK_FRACTION:.3f}",
         "-i", video_path,
-        "-vf", "select='gt(scene,0.3)',scale=320:-1",
+        "-vf", f"scale='min({width},iw)':-2",
         "-frames:v", "1",
         "-q:v", "5",
         thumbnail_path
     ]
-    try:
-        subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"FFmpeg error for {video_path}: {e.stderr.decode('utf-8')}")
+    return _run_ffmpeg(command, video_path) and _has_output(thumbnail_path)
+
+def extract_keyframe(video_path, thumbnail_path, width=320, media_info=None):
+    """
+    Етап 3: перший кадр зі зміною сцени. Читається не більше
+    THUMBNAIL_SCENE_MAX_SECONDS секунд відео і не довше THUMBNAIL_EXTRACT_TIMEOUT.
+    """
+    command = [
+        "ffmpeg", "-y",
+        "-t", str(THUMBNAIL_SCENE_MAX_SECONDS),
+        "-i", video_path,
+        "-vf", f"select='gt(scene,0.3)',scale='min({width},iw)':-2",
+        "-frames:v", "1",
+        "-q:v", "5",
+        thumbnail_path
+    ]
+    return _run_ffmpeg(command, video_path) and _has_output(thumbnail_path)
+
+def extract_shell_thumbnail(video_path, thumbnail_path, width, media_info):
+    """
+    Необов'язковий етап "shell": мініатюра провідника Windows через pywin32.
+    """
+    if win32com is None:
+        return False
+    return extract_thumbnail_with_pywin32(video_path, thumbnail_path)
+
+# Етапи витягування кадру: назва -> функція(відео, вихідний файл, ширина, дані ffprobe) -> bool.
+# Порядок задає THUMBNAIL_EXTRACTORS.
+EXTRACTORS = {
+    "attached_pic": extract_attached_picture,
+    "seek": extract_seek_frame,
+    "scene": extract_keyframe,
+    "shell": extract_shell_thumbnail,
+}
+
+_extraction_stats = {name: {"attempts": 0, "hits": 0, "seconds": 0.0} for name in EXTRACTORS}
+_extraction_stats_lock = threading.Lock()
+
+def run_extraction_chain(video_path, thumbnail_path, width, extractors=THUMBNAIL_EXTRACTORS):
+    """
+    Пробує етапи витягування кадру по черзі до першого успішного.
+
+    Returns:
+        str: Назва успішного етапу або None.
+    """
+    media_info = probe_video(video_path)
+    for name in extractors:
+        started = time.perf_counter()
+        try:
+            hit = EXTRACTORS[name](video_path, thumbnail_path, width, media_info)
+        except Exception as e:
+            print(f"Thumbnail extractor {name} failed for {video_path}: {e}")
+            hit = False
+        hit = bool(hit) and _has_output(thumbnail_path)
+        with _extraction_stats_lock:
+            stats = _extraction_stats[name]
+            stats["attempts"] += 1
+            stats["hits"] += int(hit)
+            stats["seconds"] += time.perf_counter() - started
+        if hit:
+            return name
+        if os.path.exists(thumbnail_path):
+            os.remove(thumbnail_path)  # Порожній чи частковий результат невдалого етапу
+    return None
+
+def get_extraction_stats():
+    """
+    Returns:
+        dict: Назва етапу -> {"attempts", "hits", "hit_rate", "avg_ms"}.
+    """
+    with _extraction_stats_lock:
+        return {
+            name: {
+                "attempts": stats["attempts"],
+                "hits": stats["hits"],
+                "hit_rate": round(stats["hits"] / stats["attempts"], 3) if stats["attempts"] else None,
+                "avg_ms": round(stats["seconds"] * 1000 / stats["attempts"], 1) if stats["attempts"] else None,
+            }
+            for name, stats in _extraction_stats.items()
+        }
 
 def extract_thumbnail_with_pywin32(video_path, thumbnail_path):
     """
@@ -56,34 +240,179 @@ def extract_thumbnail_with_pywin32(video_path, thumbnail_path):
         print(f"Error extracting thumbnail with pywin32: {e}")
         return False
 
-def get_or_create_thumbnail(video_path):
+def thumbnail_key(video_path):
     """
-    Отримання або створення мініатюри для відео.
+    Ключ кешу мініатюри: хеш нормалізованого шляху відео і часу його зміни.
+    Однойменні папки на різних дисках отримують різні ключі, а зміна відео -
+    новий ключ (старі файли прибирає менеджер кешу).
     """
-    if os.path.isdir(video_path):
-        folder_name = os.path.basename(video_path.rstrip('/\\'))
-        video_path = find_first_video_in_directory(video_path)
+    mtime_ns = os.stat(video_path).st_mtime_ns
+    source = f"{os.path.normcase(os.path.normpath(os.path.abspath(video_path)))}|{mtime_ns}"
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+def resolve_thumbnail_source(path):
+    """
+    Визначає відео-джерело мініатюри для файлу або папки (для папки - перший відеофайл у ній).
+
+    Returns:
+        tuple: (шлях до відео, ключ кешу) або (None, None), якщо відео немає.
+    """
+    if os.path.isdir(path):
+        video_path = find_first_video_in_directory(path)
         if not video_path:
-            print(f"No video files found in directory: {video_path}")
-            return None
-        thumbnail_name = folder_name
+            print(f"No video files found in directory: {path}")
+            return None, None
+    elif os.path.isfile(path):
+        video_path = path
     else:
-        file_name = os.path.basename(video_path)
-        thumbnail_name = os.path.splitext(file_name)[0]
+        return None, None
+
+    try:
+        return video_path, thumbnail_key(video_path)
+    except OSError:
+        return None, None
+
+def variant_file_name(key, size, image_format):
+    return f"{key}_{size}.{THUMBNAIL_FORMATS[image_format][0]}"
+
+def parse_variant_file_name(file_name):
+    """
+    Розбирає ім'я файлу варіанта ("<ключ>_<розмір>.<розширення>").
+
+    Returns:
+        tuple: (ключ, розмір, формат) або None, якщо ім'я некоректне.
+    """
+    match = VARIANT_NAME_PATTERN.match(file_name)
+    if not match or match.group(2) not in THUMBNAIL_SIZES:
+        return None
+    formats = {extension: name for name, (extension, _, _) in THUMBNAIL_FORMATS.items()}
+    return match.group(1), match.group(2), formats[match.group(3)]
+
+def variant_path(key, file_name):
+    # Підпапки за першими символами ключа, щоб не тримати тисячі файлів в одній директорії
+    return os.path.join(THUMBNAILS_DIR, key[:2], file_name)
+
+def variant_target(video_path, key, size=THUMBNAIL_DEFAULT_SIZE, image_format="jpeg"):
+    """
+    Описує варіант мініатюри для вже визначеного джерела (без звертань до диска).
+
+    Returns:
+        dict: {"video_path", "key", "name", "path", "master_path", "width", "format", "mimetype"}.
+    """
+    name = variant_file_name(key, size, image_format)
+    return {
+        "video_path": video_path,
+        "key": key,
+        "name": name,
+        "path": variant_path(key, name),
+        "master_path": variant_path(key, f"{key}_master.jpg"),
+        "width": THUMBNAIL_SIZES[size],
+        "format": image_format,
+        "mimetype": THUMBNAIL_FORMATS[image_format][1],
+    }
+
+def thumbnail_target(path, size=THUMBNAIL_DEFAULT_SIZE, image_format="jpeg"):
+    """
+    Визначає відео-джерело і файли мініатюри для файлу або папки.
+
+    Parameters:
+        path (str): Шлях до відеофайлу або папки.
+        size (str): Назва розміру з THUMBNAIL_SIZES.
+        image_format (str): "jpeg" або "webp".
+
+    Returns:
+        dict: Опис варіанта (див. variant_target) або None, якщо відео немає.
+    """
+    video_path, key = resolve_thumbnail_source(path)
+    if not video_path:
+        return None
+    return variant_target(video_path, key, size, image_format)
+
+def is_thumbnail_fresh(target):
+    """
+    Перевірка існування мініатюри (актуальність гарантує ключ з часом зміни відео).
+    """
+    return os.path.exists(target["path"])
+
+_master_locks = {}
+_master_locks_guard = threading.Lock()
 
-    thumbnail_path = os.path.join(THUMBNAILS_DIR, f"{thumbnail_name}.jpg")
+def _master_lock(master_path):
+    with _master_locks_guard:
+        return _master_locks.setdefault(master_path, threading.Lock())
 
-    # Перевірка існування та актуальності мініатюри
-    if os.path.exists(thumbnail_path):
-        video_mtime = os.path.getmtime(video_path)
-        thumbnail_mtime = os.path.getmtime(thumbnail_path)
-        if thumbnail_mtime > video_mtime:
-            return thumbnail_path
+def _partial_path(path):
+    base, extension = os.path.splitext(path)
+    return f"{base}.partial{extension}"
 
-    # Спроба витягнути мініатюру за допомогою pywin32
-    if extract_thumbnail_with_pywin32(video_path, thumbnail_path):
-        return thumbnail_path
+def create_master_frame(video_path, master_path):
+    """
+    Витягує кадр найбільшого розміру, з якого масштабуються всі варіанти,
+    ланцюжком етапів THUMBNAIL_EXTRACTORS (див. run_extraction_chain).
+
+    Returns:
+        bool: Чи створено кадр.
+    """
+    os.makedirs(os.path.dirname(master_path), exist_ok=True)
+    partial_path = _partial_path(master_path)
+    if not run_extraction_chain(video_path, partial_path, MASTER_WIDTH):
+        return False
+    os.replace(partial_path, master_path)
+    return True
+
+def render_variant(master_path, thumbnail_path, width, image_format):
+    """
+    Масштабує кадр до потрібної ширини і кодує у вказаний формат.
+
+    Returns:
+        bool: Чи створено файл.
+    """
+    partial_path = _partial_path(thumbnail_path)
+    command = [
+        "ffmpeg", "-y",
+        "-i", master_path,
+        "-vf", f"scale='min({width},iw)':-2",
+        "-frames:v", "1",
+        *THUMBNAIL_FORMATS[image_format][2],
+        partial_path
+    ]
+    try:
+        subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"FFmpeg error for {master_path}: {e.stderr.decode('utf-8')}")
+        return False
+    if not os.path.exists(partial_path):
+        return False
+    os.replace(partial_path, thumbnail_path)
+    return True
+
+def create_thumbnail(target):
+    """
+    Створює мініатюру за описом з thumbnail_target. Кадр з відео витягується
+    один раз на ключ (під блокуванням), а розміри і формати масштабуються з нього.
+    Файли пишуться під тимчасовим ім'ям і підміняються атомарно, тож читачі
+    ніколи не бачать недописаного зображення.
+
+    Returns:
+        str: Шлях до мініатюри або None, якщо створити не вдалося.
+    """
+    master_path = target["master_path"]
+    with _master_lock(master_path):
+        if not os.path.exists(master_path) and not create_master_frame(target["video_path"], master_path):
+            return None
+
+    if not render_variant(master_path, target["path"], target["width"], target["format"]):
+        return None
+    return target["path"]
+
+def get_or_create_thumbnail(video_path, size=THUMBNAIL_DEFAULT_SIZE, image_format="jpeg"):
+    """
+    Отримання або створення мініатюри для відео (синхронно, у потоці виклику).
+    """
+    target = thumbnail_target(video_path, size, image_format)
+    if target is None:
+        return None
 
-    # Генерація ключового кадру
-    extract_keyframe(video_path, thumbnail_path)
-    return thumbnail_path
+    if is_thumbnail_fresh(target):
+        return target["path"]
+    return create_thumbnail(target)
@@ -1,104 +1,434 @@
-import json
-import pyodbc
-from tqdm import tqdm
+import sys
+import time
+import sqlite3
 from datetime import datetime
 
-from metadata import load_metadata
 from config import *
+from metadata_sqlite import SCHEMA, MEDIA_COLUMNS, UNIT_CHILDREN, EPISODE_NAME_KEY, _split_extra, _unit_type
 
-conn = pyodbc.connect(DB_CONNECTION_STRING)
-cursor = conn.cursor()
-
-metadata = load_metadata()
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None  # Прогрес потрібен лише при ручному запуску; реплікація в застосунку без нього
 
 # Вставка у Media → MediaUnit → Episode → TimeToSkip → Tag → MediaTag
 # Series → Season → Episode → TimeToSkip
-#   
+#
 #  Tag
 # Movies → Part
-inserted_series = 0
-inserted_parts = 0
-tags_dict = {}
-
-all_items = metadata.get("series", []) + metadata.get("movies", [])
-
-for item in tqdm(all_items, desc="Transfer to DB"):  # Додаємо tqdm
-    media_id = item["id"]
-    title = item["title"]
-    path = item["path"]
-    auto_added = int(item.get("auto_added", False))
-    # last_modified = item.get("last_modified")
-    media_type = item["type"]
-
-    raw_ts = item.get("last_modified")
-    if raw_ts:
+#
+# Завантаження ідемпотентне: Media оновлюється за id (upsert), а дочірні рядки
+# завантажуваних записів (сезони, епізоди, пропуски, теги) видаляються і
+# вставляються заново. Усі рядки вставляються пакетами через executemany, а
+# згенеровані id сезонів, епізодів і тегів визначаються одним запитом на таблицю.
+
+TRANSFER_CATEGORIES = ("series", "movies")
+
+
+class SqlServerDialect:
+    """
+    SQL Server через pyodbc: схема MediaVault без службових колонок, fast_executemany.
+    """
+
+    name = "mssql"
+    stage_table = "#media_stage"
+    columns = {
+        "Media": MEDIA_COLUMNS,
+        "MediaUnit": ("media_id", "title", "path", "has_episodes", "unit_type"),
+        "Episode": ("media_unit_id", "name"),
+        "TimeToSkip": ("episode_id", "start_time", "end_time"),
+        "MediaTag": ("media_id", "tag_id"),
+    }
+
+    def connect(self, target):
+        import pyodbc
+        return pyodbc.connect(target)
+
+    def cursor(self, conn):
+        cursor = conn.cursor()
+        cursor.fast_executemany = True  # Параметри пакета передаються одним масивом
+        return cursor
+
+    def create_stage(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {self.stage_table}")
+        # Порожня копія структури Media (ті самі типи колонок)
+        cursor.execute(f"SELECT TOP 0 {', '.join(self.columns['Media'])} INTO {self.stage_table} FROM Media")
+
+    def upsert_media_sql(self):
+        columns = self.columns["Media"]
+        updates = ", ".join(f"t.{column} = s.{column}" for column in columns if column != "id")
+        return f"""
+            MERGE Media AS t USING {self.stage_table} AS s ON t.id = s.id
+            WHEN MATCHED THEN UPDATE SET {updates}
+            WHEN NOT MATCHED THEN INSERT ({', '.join(columns)}) VALUES ({', '.join('s.' + c for c in columns)});
+        """
+
+    def timestamp(self, raw_ts):
+        if raw_ts:
+            try:
+                return datetime.fromisoformat(raw_ts)
+            except ValueError:
+                return None
+        return None
+
+
+class SqliteDialect:
+    """
+    Локальна SQLite-база зі схемою metadata_sqlite (разом зі службовими колонками),
+    тож результат можна відкрити як сховище у режимі "sqlite".
+    """
+
+    name = "sqlite"
+    stage_table = "temp.media_stage"
+    columns = {
+        "Media": MEDIA_COLUMNS + ("category", "position", "extra"),
+        "MediaUnit": ("media_id", "title", "path", "has_episodes", "unit_type", "position", "extra"),
+        "Episode": ("media_unit_id", "name", "position", "extra"),
+        "TimeToSkip": ("episode_id", "start_time", "end_time", "position"),
+        "MediaTag": ("media_id", "tag_id", "position"),
+    }
+
+    def connect(self, target):
+        conn = sqlite3.connect(target)
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def cursor(self, conn):
+        return conn.cursor()
+
+    def create_stage(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {self.stage_table}")
+        cursor.execute(f"CREATE TEMP TABLE media_stage AS SELECT {', '.join(self.columns['Media'])} FROM Media WHERE 0")
+
+    def upsert_media_sql(self):
+        columns = self.columns["Media"]
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column != "id")
+        # "WHERE true" потрібен парсеру SQLite для INSERT ... SELECT ... ON CONFLICT
+        return f"""
+            INSERT INTO Media ({', '.join(columns)}) SELECT {', '.join(columns)} FROM {self.stage_table} WHERE true
+            ON CONFLICT(id) DO UPDATE SET {updates}
+        """
+
+    def timestamp(self, raw_ts):
+        return raw_ts  # Зберігається рядком, як у metadata_sqlite
+
+
+def resolve_target(target):
+    """
+    Визначає діалект за ціллю: "sqlite:<шлях>" або файл *.db / *.sqlite - SQLite,
+    інше - рядок підключення ODBC до SQL Server.
+
+    Returns:
+        tuple: (діалект, рядок підключення або шлях).
+    """
+    if target.startswith("sqlite:"):
+        return SqliteDialect(), target[len("sqlite:"):]
+    if target.endswith((".db", ".sqlite")):
+        return SqliteDialect(), target
+    return SqlServerDialect(), target
+
+
+class BulkLoader:
+    """
+    Пакетне ідемпотентне завантаження записів метаданих у реляційну базу.
+
+    Записи спершу розкладаються в рядки по таблицях (`stage`), потім кожна таблиця
+    вставляється пакетами по `batch_size` рядків однією транзакцією (`flush`).
+    Для кожної таблиці збирається статистика: кількість рядків, час і швидкість.
+    """
+
+    def __init__(self, conn, dialect, batch_size=BULK_BATCH_SIZE):
+        self.conn = conn
+        self.dialect = dialect
+        self.batch_size = batch_size
+        self.cursor = dialect.cursor(conn)
+        self.stats = {}
+        self.reset()
+
+    def reset(self):
+        self.media = []
+        self.units = []
+        self.episodes = []
+        self.tags = []
+        self.deleted = []
+
+    # --- Розкладання записів у рядки ---
+
+    def stage(self, category, item, position):
+        """
+        Додає запис до поточного пакета.
+
+        Parameters:
+            category (str): Розділ документа (series / movies).
+            item (dict): Запис метаданих.
+            position (int): Позиція запису в розділі.
+        """
+        media_id = item["id"]
+        self.media.append({
+            "id": media_id,
+            "title": item.get("title"),
+            "path": item.get("path"),
+            "auto_added": int(bool(item.get("auto_added", False))),
+            "last_modified": self.dialect.timestamp(item.get("last_modified")),
+            "type": item.get("type"),
+            "category": category,
+            "position": position,
+            "extra": _split_extra(item, MEDIA_COLUMNS + ("tags", "seasons", "parts")),
+        })
+
+        for index, tag in enumerate(dict.fromkeys(item.get("tags") or [])):
+            self.tags.append({"media_id": media_id, "tag": tag, "position": index})
+
+        unit_type = _unit_type(item)
+        child_key = UNIT_CHILDREN[unit_type]
+        units = (item.get("seasons") if "seasons" in item else item.get("parts")) or []
+        for index, unit in enumerate(units):
+            staged_unit = {
+                "media_id": media_id,
+                "title": unit.get("title"),
+                "path": unit.get("path"),
+                "has_episodes": int(child_key is not None),
+                "unit_type": unit_type,
+                "position": index,
+                "extra": _split_extra(unit, ("title", "path", child_key)),
+            }
+            self.units.append(staged_unit)
+            if not child_key:
+                continue
+            name_key = EPISODE_NAME_KEY[unit_type]
+            for episode_index, episode in enumerate(unit.get(child_key) or []):
+                self.episodes.append({
+                    "unit": staged_unit,
+                    "name": episode.get(name_key),
+                    "position": episode_index,
+                    "extra": _split_extra(episode, (name_key, "timeToSkip")),
+                    "skips": episode.get("timeToSkip") or [],
+                })
+
+    def stage_delete(self, media_id):
+        """
+        Додає до поточного пакета видалення запису.
+        """
+        self.deleted.append(media_id)
+
+    # --- Запис у базу ---
+
+    def _timed(self, table, rows, started):
+        elapsed = time.perf_counter() - started
+        entry = self.stats.setdefault(table, {"rows": 0, "seconds": 0.0})
+        entry["rows"] += rows
+        entry["seconds"] += elapsed
+
+    def _insert_many(self, table, rows, into=None):
+        """
+        Вставляє рядки пакетами через executemany у колонки діалекту для `table`.
+
+        Parameters:
+            table (str): Таблиця, колонки якої вставляються.
+            rows (list): Словники рядків.
+            into (str, optional): Інша таблиця з тими ж колонками (проміжна).
+        """
+        if not rows:
+            return
+        started = time.perf_counter()
+        columns = self.dialect.columns[table]
+        sql = f"INSERT INTO {into or table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            self.cursor.executemany(sql, [tuple(row.get(column) for column in columns) for row in batch])
+        self._timed(f"{table} (stage)" if into else table, len(rows), started)
+
+    def _delete_children(self):
+        """
+        Видаляє дочірні рядки всіх записів пакета (множинно, через проміжну таблицю).
+        """
+        started = time.perf_counter()
+        scope = f"SELECT id FROM {self.dialect.stage_table}"
+        units = f"SELECT id FROM MediaUnit WHERE media_id IN ({scope})"
+        self.cursor.execute(f"""
+            DELETE FROM TimeToSkip WHERE episode_id IN (SELECT id FROM Episode WHERE media_unit_id IN ({units}))
+        """)
+        self.cursor.execute(f"DELETE FROM Episode WHERE media_unit_id IN ({units})")
+        self.cursor.execute(f"DELETE FROM MediaUnit WHERE media_id IN ({scope})")
+        self.cursor.execute(f"DELETE FROM MediaTag WHERE media_id IN ({scope})")
+        self._timed("(delete children)", 0, started)
+
+    def _resolve_generated_ids(self, rows, sql, key):
+        """
+        Присвоює рядкам згенеровані базою id одним запитом.
+
+        Рядки з однаковим ключем зіставляються в порядку вставки (за зростанням id).
+        """
+        pending = {}
+        for row in rows:
+            pending.setdefault(key(row), []).append(row)
+        for row_id, *values in self.cursor.execute(sql).fetchall():
+            queue = pending.get(tuple(values))
+            if queue:
+                queue.pop(0)["id"] = row_id
+        missing = sum(len(queue) for queue in pending.values())
+        if missing:
+            raise RuntimeError(f"Could not resolve {missing} generated ids")
+
+    def _resolve_tags(self):
+        names = list(dict.fromkeys(row["tag"] for row in self.tags))
+        if not names:
+            return
+        started = time.perf_counter()
+        tag_ids = {name: tag_id for tag_id, name in self.cursor.execute("SELECT id, name FROM Tag").fetchall()}
+        missing = [{"name": name} for name in names if name not in tag_ids]
+        if missing:
+            self.cursor.executemany("INSERT INTO Tag (name) VALUES (?)", [(row["name"],) for row in missing])
+            tag_ids = {name: tag_id for tag_id, name in self.cursor.execute("SELECT id, name FROM Tag").fetchall()}
+        for row in self.tags:
+            row["tag_id"] = tag_ids[row["tag"]]
+        self._timed("Tag", len(missing), started)
+
+    def _load_media(self):
+        scope = f"SELECT id FROM {self.dialect.stage_table}"
+        self.dialect.create_stage(self.cursor)
+        self._insert_many("Media", self.media, into=self.dialect.stage_table)
+
+        started = time.perf_counter()
+        self.cursor.execute(self.dialect.upsert_media_sql())
+        self._timed("Media (upsert)", len(self.media), started)
+
+        self._delete_children()
+
+        self._insert_many("MediaUnit", self.units)
+        self._resolve_generated_ids(
+            self.units,
+            f"SELECT id, media_id, path FROM MediaUnit WHERE media_id IN ({scope}) ORDER BY id",
+            lambda row: (row["media_id"], row["path"]))
+
+        for episode in self.episodes:
+            episode["media_unit_id"] = episode["unit"]["id"]
+        self._insert_many("Episode", self.episodes)
+        self._resolve_generated_ids(
+            self.episodes,
+            f"""SELECT id, media_unit_id, name FROM Episode
+                WHERE media_unit_id IN (SELECT id FROM MediaUnit WHERE media_id IN ({scope})) ORDER BY id""",
+            lambda row: (row["media_unit_id"], row["name"]))
+
+        self._insert_many("TimeToSkip", [
+            {"episode_id": episode["id"], "start_time": skip.get("start"), "end_time": skip.get("end"),
+             "position": index}
+            for episode in self.episodes
+            for index, skip in enumerate(episode["skips"])
+        ])
+
+        self._resolve_tags()
+        self._insert_many("MediaTag", self.tags)
+
+    def _delete_media(self):
+        """
+        Видаляє записи пакета разом з дочірніми рядками.
+        """
+        started = time.perf_counter()
+        rows = [(media_id,) for media_id in self.deleted]
+        units = "SELECT id FROM MediaUnit WHERE media_id = ?"
+        for sql in (
+            f"DELETE FROM TimeToSkip WHERE episode_id IN (SELECT id FROM Episode WHERE media_unit_id IN ({units}))",
+            f"DELETE FROM Episode WHERE media_unit_id IN ({units})",
+            "DELETE FROM MediaUnit WHERE media_id = ?",
+            "DELETE FROM MediaTag WHERE media_id = ?",
+            "DELETE FROM Media WHERE id = ?",
+        ):
+            for start in range(0, len(rows), self.batch_size):
+                self.cursor.executemany(sql, rows[start:start + self.batch_size])
+        self._timed("Media (delete)", len(rows), started)
+
+    def stale_ids(self, keep_ids):
+        """
+        Returns:
+            list: Id записів Media у базі, яких немає серед `keep_ids`.
+        """
+        return [row[0] for row in self.cursor.execute("SELECT id FROM Media").fetchall() if row[0] not in keep_ids]
+
+    def flush(self):
+        """
+        Записує поточний пакет (видалення і завантаження) однією транзакцією і очищує його.
+
+        Returns:
+            int: Кількість завантажених і видалених записів Media.
+        """
+        if not self.media and not self.deleted:
+            return 0
         try:
-            last_modified = datetime.fromisoformat(raw_ts)
-        except ValueError:
-            last_modified = None
-    else:
-        last_modified = None
-
-    
-    # Insert into Media
-    cursor.execute("""
-        INSERT INTO Media (id, title, path, auto_added, last_modified, type)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, media_id, title, path, auto_added, last_modified, media_type)
-
-    # Tags
-    for tag in item.get("tags", []):
-        if tag not in tags_dict:
-            cursor.execute("SELECT id FROM Tag WHERE name = ?", tag)
-            row = cursor.fetchone()
-            if row:
-                tag_id = row[0]
-            else:
-                cursor.execute("INSERT INTO Tag (name) OUTPUT INSERTED.id VALUES (?)", tag)
-                tag_id = cursor.fetchone()[0]
-            tags_dict[tag] = tag_id
-        else:
-            tag_id = tags_dict[tag]
-
-        cursor.execute("INSERT INTO MediaTag (media_id, tag_id) VALUES (?, ?)", media_id, tag_id)
-
-    if media_type == "series":
-        for season in item.get("seasons", []):
-            unit_title = season["title"]
-            unit_path = season["path"]
-
-            cursor.execute("""
-                INSERT INTO MediaUnit (media_id, title, path, has_episodes, unit_type)
-                OUTPUT INSERTED.id
-                VALUES (?, ?, ?, 1, 'season')
-            """, media_id, unit_title, unit_path)
-            media_unit_id = cursor.fetchone()[0]
-
-            for file in season.get("files", []):
-                episode_name = file["name"]
-                cursor.execute("""
-                    INSERT INTO Episode (media_unit_id, name)
-                    OUTPUT INSERTED.id
-                    VALUES (?, ?)
-                """, media_unit_id, episode_name)
-                episode_id = cursor.fetchone()[0]
-
-                for skip in file.get("timeToSkip", []):
-                    cursor.execute("""
-                        INSERT INTO TimeToSkip (episode_id, start_time, end_time)
-                        VALUES (?, ?, ?)
-                    """, episode_id, skip["start"], skip["end"])
-            inserted_series += 1
-    elif media_type == "collection":
-        for part in item.get("parts", []):
-            cursor.execute("""
-                INSERT INTO MediaUnit (media_id, title, path, has_episodes, unit_type)
-                VALUES (?, ?, ?, 0, 'part')
-            """, media_id, part["title"], part["path"])
-        inserted_parts += 1
-
-conn.commit()
-cursor.close()
-conn.close()
-
-(inserted_series, inserted_parts, len(tags_dict))
+            if self.deleted:
+                self._delete_media()
+            if self.media:
+                self._load_media()
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        processed = len(self.media) + len(self.deleted)
+        self.reset()
+        return processed
+
+    def report(self):
+        """
+        Повертає рядки звіту про швидкість завантаження по таблицях.
+        """
+        lines = []
+        for table, entry in self.stats.items():
+            rate = entry["rows"] / entry["seconds"] if entry["seconds"] > 0 else 0
+            lines.append(f"{table:<20} {entry['rows']:>8} rows  {entry['seconds']:>8.3f}s  {rate:>10.0f} rows/s")
+        return lines
+
+
+def transfer(metadata, target=DB_CONNECTION_STRING, batch_size=BULK_BATCH_SIZE, categories=TRANSFER_CATEGORIES):
+    """
+    Переносить записи метаданих у базу. Повторний запуск оновлює вже перенесені
+    записи замість дублювання.
+
+    Parameters:
+        metadata (dict): Документ метаданих.
+        target (str): Рядок підключення ODBC або "sqlite:<шлях>" (див. resolve_target).
+        batch_size (int): Кількість записів Media в одній транзакції.
+        categories (tuple): Розділи документа, які переносяться.
+
+    Returns:
+        dict: {"items", "seconds", "items_per_second", "tables", "report"}.
+    """
+    dialect, connection_target = resolve_target(target)
+    conn = dialect.connect(connection_target)
+    loader = BulkLoader(conn, dialect, batch_size)
+    started = time.perf_counter()
+    loaded = 0
+    try:
+        all_items = [
+            (category, position, item)
+            for category in categories
+            for position, item in enumerate(metadata.get(category, []))
+        ]
+        for category, position, item in tqdm(all_items, desc="Transfer to DB") if tqdm else all_items:
+            loader.stage(category, item, position)
+            if len(loader.media) >= batch_size:
+                loaded += loader.flush()
+        loaded += loader.flush()
+    finally:
+        loader.cursor.close()
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "items": loaded,
+        "seconds": round(elapsed, 3),
+        "items_per_second": round(loaded / elapsed) if elapsed > 0 else 0,
+        "tables": loader.stats,
+        "report": loader.report(),
+    }
+
+
+if __name__ == '__main__':
+    # python transfer_db.py [<ODBC connection string> | sqlite:<metadata.db>]
+    from metadata import load_metadata
+
+    result = transfer(load_metadata(), sys.argv[1] if len(sys.argv) > 1 else DB_CONNECTION_STRING)
+    for line in result["report"]:
+        print(line)
+    print(f"Transferred {result['items']} items in {result['seconds']}s ({result['items_per_second']} items/s)")
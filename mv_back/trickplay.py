@@ -0,0 +1,190 @@
+import os
+import re
+import math
+from thumbnails import probe_video, variant_path, _run_ffmpeg, _has_output, _partial_path
+from thumbnail_service import ThumbnailService
+from config import (
+    TRICKPLAY_INTERVAL, TRICKPLAY_WIDTH, TRICKPLAY_COLUMNS, TRICKPLAY_MAX_FRAMES,
+    TRICKPLAY_WORKERS, TRICKPLAY_TIMEOUT, THUMBNAIL_FAILURE_TTL
+)
+
+SPRITE_NAME_PATTERN = re.compile(r"^([0-9a-f]{40})_trickplay\.jpg$")
+
+
+def trickplay_target(video_path, key):
+    """
+    Описує аркуш кадрів і WebVTT-індекс для відео (без звертань до диска).
+    Файли лежать поруч із мініатюрами і адресуються тим самим ключем кешу:
+    thumbnails/<ключ[:2]>/<ключ>_trickplay.jpg і <ключ>_trickplay.vtt.
+
+    Returns:
+        dict: {"video_path", "key", "name", "path", "sprite_name", "sprite_path", "mimetype"};
+        "path" - WebVTT-індекс, який з'являється останнім і означає готовність.
+    """
+    name = f"{key}_trickplay.vtt"
+    sprite_name = f"{key}_trickplay.jpg"
+    return {
+        "video_path": video_path,
+        "key": key,
+        "name": name,
+        "path": variant_path(key, name),
+        "sprite_name": sprite_name,
+        "sprite_path": variant_path(key, sprite_name),
+        "mimetype": "text/vtt",
+    }
+
+
+def parse_sprite_file_name(file_name):
+    """
+    Returns:
+        str: Ключ кешу з імені аркуша ("<ключ>_trickplay.jpg") або None, якщо ім'я некоректне.
+    """
+    match = SPRITE_NAME_PATTERN.match(file_name)
+    return match.group(1) if match else None
+
+
+def is_trickplay_fresh(target):
+    return os.path.exists(target["path"]) and os.path.exists(target["sprite_path"])
+
+
+def _frame_height(media_info, width):
+    """
+    Висота кадру аркуша за пропорціями відеопотоку (з урахуванням повороту), кратна 2.
+    Якщо розміри невідомі - 16:9.
+    """
+    for stream in media_info.get("streams", []):
+        if stream.get("codec_type") != "video" or stream.get("disposition", {}).get("attached_pic"):
+            continue
+        stream_width, stream_height = stream.get("width"), stream.get("height")
+        if not stream_width or not stream_height:
+            continue
+        rotation = stream.get("tags", {}).get("rotate", 0)
+        for side_data in stream.get("side_data_list", []):
+            rotation = side_data.get("rotation", rotation)
+        try:
+            if abs(int(float(rotation))) % 180 == 90:
+                stream_width, stream_height = stream_height, stream_width
+        except (TypeError, ValueError):
+            pass
+        return max(round(width * stream_height / stream_width / 2) * 2, 2)
+    return round(width * 9 / 16 / 2) * 2
+
+
+def _vtt_timestamp(seconds):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+
+def build_trickplay_vtt(sprite_url, duration, interval, count, columns, width, height):
+    """
+    Будує WebVTT-індекс: для кожного інтервалу - посилання на його клітинку аркуша (#xywh=).
+
+    Parameters:
+        sprite_url (str): Адреса аркуша; відносна адреса розв'язується від адреси самого індексу.
+        duration (float): Тривалість відео, секунди.
+        interval (int): Крок між кадрами, секунди.
+        count (int): Кількість кадрів на аркуші.
+        columns (int): Кадрів у рядку аркуша.
+        width, height (int): Розмір одного кадру, пікселі.
+
+    Returns:
+        str: Вміст файлу .vtt.
+    """
+    lines = ["WEBVTT", ""]
+    for position in range(count):
+        start = position * interval
+        end = min(start + interval, duration)
+        x = (position % columns) * width
+        y = (position // columns) * height
+        lines.append(f"{_vtt_timestamp(start)} --> {_vtt_timestamp(end)}")
+        lines.append(f"{sprite_url}#xywh={x},{y},{width},{height}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def create_trickplay(target):
+    """
+    Створює аркуш кадрів і WebVTT-індекс за описом з trickplay_target.
+
+    Один прохід ffmpeg: декодуються лише ключові кадри (-skip_frame nokey),
+    з них фільтр fps бере кадр кожні `interval` секунд (round=up - останній
+    ключовий кадр не пізніше початку інтервалу, без зсуву на пів інтервалу),
+    зменшує до TRICKPLAY_WIDTH і складає в один аркуш (tile). Для довгих відео інтервал
+    збільшується так, щоб кадрів було не більше TRICKPLAY_MAX_FRAMES.
+    Аркуш і індекс пишуться під тимчасовими іменами; індекс з'являється
+    останнім, тож наявний індекс завжди посилається на готовий аркуш.
+
+    Returns:
+        str: Шлях до WebVTT-індексу або None, якщо створити не вдалося.
+    """
+    video_path = target["video_path"]
+    media_info = probe_video(video_path)
+    try:
+        duration = float(media_info.get("format", {}).get("duration", 0))
+    except (TypeError, ValueError):
+        duration = 0
+    if duration <= 0:
+        print(f"Trickplay skipped, unknown duration: {video_path}")
+        return None
+
+    interval = max(TRICKPLAY_INTERVAL, math.ceil(duration / TRICKPLAY_MAX_FRAMES))
+    count = math.ceil(duration / interval)
+    columns = min(TRICKPLAY_COLUMNS, count)
+    rows = math.ceil(count / columns)
+    width = TRICKPLAY_WIDTH
+    height = _frame_height(media_info, width)
+
+    os.makedirs(os.path.dirname(target["sprite_path"]), exist_ok=True)
+    sprite_partial = _partial_path(target["sprite_path"])
+    command = [
+        "ffmpeg", "-y",
+        "-skip_frame", "nokey",
+        "-i", video_path,
+        "-an", "-sn", "-dn",
+        "-vf", (
+            f"fps=1/{interval}:round=up,"
+            f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:-1:-1,setsar=1,"
+            f"tile={columns}x{rows}"
+        ),
+        "-frames:v", "1",
+        "-q:v", "5",
+        sprite_partial
+    ]
+    if not _run_ffmpeg(command, video_path, timeout=TRICKPLAY_TIMEOUT) or not _has_output(sprite_partial):
+        if os.path.exists(sprite_partial):
+            os.remove(sprite_partial)
+        return None
+    os.replace(sprite_partial, target["sprite_path"])
+
+    # Відносно /api/trickplay?path=... адреса "trickplay/<ім'я>" - це /api/trickplay/<ім'я>
+    vtt = build_trickplay_vtt(f"trickplay/{target['sprite_name']}", duration, interval, count, columns, width, height)
+    vtt_partial = _partial_path(target["path"])
+    with open(vtt_partial, "w", encoding="utf-8") as file:
+        file.write(vtt)
+    os.replace(vtt_partial, target["path"])
+    return target["path"]
+
+
+class TrickplayService(ThumbnailService):
+    """
+    Фонове створення аркушів кадрів: той самий пул з об'єднанням запитів і
+    пам'яттю невдач, що й для мініатюр, але окремий і меншого розміру,
+    бо кожен аркуш читає весь файл.
+    """
+
+    create = staticmethod(create_trickplay)
+    is_fresh = staticmethod(is_trickplay_fresh)
+    cache_class = "trickplay"
+    artifact_fields = ("path", "sprite_path")
+
+    def status(self):
+        status = super().status()
+        status.pop("extractors", None)
+        return status
+
+
+trickplay_service = TrickplayService(TRICKPLAY_WORKERS, THUMBNAIL_FAILURE_TTL, name="trickplay")
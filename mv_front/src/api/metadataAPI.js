@@ -146,3 +146,38 @@ export const fetchMetadata = async () => {
     }
 };
 
+
+export const applyMetadataBatch = async (operations) => {
+    try {
+        // Операції: { type: 'add_tag' | 'remove_tag' | 'set_time_to_skip' | 'bulk_time_to_skip' | 'set_audio_track', ... }
+        const response = await axios.post(`${API_BASE_URL}/batch`, { operations });
+        return response.data.results;
+    } catch (error) {
+        console.error(`Failed to apply metadata batch: ${error.message}`);
+        throw error;
+    }
+};
+
+export const fetchMetadataChanges = async (since) => {
+    try {
+        // Якщо історія для since вже недоступна, сервер повертає resync: true
+        const response = await axios.get(`${API_BASE_URL}/changes`, { params: { since } });
+        return response.data;
+    } catch (error) {
+        console.error(`Failed to fetch metadata changes: ${error.message}`);
+        throw error;
+    }
+};
+
+export const fetchCatalogPage = async ({ category = 'all', sort = 'title', fields, limit = 50, cursor } = {}) => {
+    try {
+        const params = { category, sort, limit };
+        if (fields) params.fields = fields.join(',');
+        if (cursor) params.cursor = cursor;
+        const response = await axios.get(`${API_BASE_URL}/list`, { params });
+        return response.data;
+    } catch (error) {
+        console.error(`Failed to fetch catalog page: ${error.message}`);
+        throw error;
+    }
+};
@@ -2,6 +2,12 @@ import axios from 'axios';
 import config from '../config.json';
 const API_BASE_URL = config.API_BASE_URL + '/api/thumbnail';
 
+// Скільки разів повторювати запит, поки сервер генерує мініатюру (відповідь 202)
+const MAX_PENDING_RETRIES = 15;
+const DEFAULT_RETRY_AFTER = 2;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
 export const fetchThumbnail = async (folder_name) => {
     const cacheKey = `thumbnail_${folder_name}`;
     const cachedThumbnail = sessionStorage.getItem(cacheKey);
@@ -11,13 +17,28 @@ export const fetchThumbnail = async (folder_name) => {
     }
 
     try {
-        const response = await axios.get(`${API_BASE_URL}`, {
-            params: { folder_name: folder_name },
-        });
+        for (let attempt = 0; attempt <= MAX_PENDING_RETRIES; attempt++) {
+            // Accept як у <img>, щоб сервер підготував той самий варіант (WebP), який потім завантажить браузер
+            const response = await axios.get(`${API_BASE_URL}`, {
+                params: { folder_name: folder_name },
+                headers: { Accept: 'image/webp,image/*;q=0.8' },
+            });
 
-        const thumbnailUrl = `${response.config.url}?folder_name=${folder_name}`;
-        sessionStorage.setItem(cacheKey, thumbnailUrl);
-        return thumbnailUrl;
+            if (response.status !== 202) {
+                // Адреса за вмістом кешується браузером назавжди; інакше - адреса за папкою
+                const addressedUrl = response.headers['x-thumbnail-url'];
+                const thumbnailUrl = addressedUrl
+                    ? config.API_BASE_URL + addressedUrl
+                    : `${response.config.url}?folder_name=${folder_name}`;
+                sessionStorage.setItem(cacheKey, thumbnailUrl);
+                return thumbnailUrl;
+            }
+
+            // Мініатюра ще генерується - чекаємо стільки, скільки просить сервер
+            const retryAfter = Number(response.headers['retry-after']) || DEFAULT_RETRY_AFTER;
+            await sleep(retryAfter * 1000);
+        }
+        return null;
     } catch (err) {
         console.error(`Failed to fetch thumbnail for ${folder_name}:`, err);
         return null;
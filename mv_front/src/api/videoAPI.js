@@ -14,4 +14,54 @@ export const getAudioTracks = async (path) => {
         console.error(`Failed to fetch audio tracks: ${error.message}`);
         throw error;
     }
-};
\ No newline at end of file
+};
+
+const TRICKPLAY_URL = `${config.API_BASE_URL}/api/trickplay`;
+// Скільки разів повторювати запит, поки сервер створює аркуш прев'ю (відповідь 202)
+const TRICKPLAY_MAX_RETRIES = 60;
+
+const parseVttTime = (value) => {
+    const [hours, minutes, seconds] = value.trim().split(':');
+    return Number(hours) * 3600 + Number(minutes) * 60 + Number(seconds);
+};
+
+// Розбирає WebVTT-індекс прев'ю: [{ start, end, url, x, y, w, h }]
+const parseTrickplayVtt = (text) => {
+    const cues = [];
+    text.split(/\r?\n\r?\n/).forEach((block) => {
+        const lines = block.trim().split(/\r?\n/);
+        const timing = lines.findIndex((line) => line.includes('-->'));
+        if (timing === -1 || !lines[timing + 1]) return;
+
+        const [start, end] = lines[timing].split('-->').map(parseVttTime);
+        const [url, fragment] = lines[timing + 1].split('#xywh=');
+        const [x, y, w, h] = (fragment || '').split(',').map(Number);
+        // Адреса аркуша відносна до адреси індексу
+        cues.push({ start, end, url: new URL(url, TRICKPLAY_URL).href, x, y, w, h });
+    });
+    return cues;
+};
+
+export const fetchTrickplay = async (path, isCancelled = () => false) => {
+    try {
+        for (let attempt = 0; attempt <= TRICKPLAY_MAX_RETRIES; attempt++) {
+            const response = await axios.get(TRICKPLAY_URL, {
+                params: { path },
+                responseType: 'text',
+            });
+            if (isCancelled()) return [];
+            if (response.status !== 202) {
+                return parseTrickplayVtt(response.data);
+            }
+
+            // Аркуш створюється у фоні - чекаємо стільки, скільки просить сервер
+            const retryAfter = Number(response.headers['retry-after']) || 5;
+            await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+            if (isCancelled()) return [];
+        }
+        return [];
+    } catch (error) {
+        console.error(`Failed to fetch trickplay: ${error.message}`);
+        return [];
+    }
+};
@@ -7,7 +7,7 @@ import 'videojs-hotkeys';
 import SettingsMenu from './SettingsMenu';
 import TimeToSkipSettingsMenu from './TimeToSkipSettingsMenu';
 import { fetchTimeToSkip } from '../../api/metadataAPI';
-import { getAudioTracks } from '../../api/videoAPI';
+import { getAudioTracks, fetchTrickplay } from '../../api/videoAPI';
 import AudioTracksSubmenu from './AudioTracksSubmenu';
 
 const PlayerControls = ({
@@ -26,6 +26,7 @@ const PlayerControls = ({
     const currentTimeToSkip = useRef([]);
     const currentPathRef = useRef(null);
     const currentNameRef = useRef(null);
+    const trickplayCues = useRef([]);
     const [showTimeToSkipMenu, setShowTimeToSkipMenu] = useState(false);
     const [showAudioSubmenu, setShowAudioSubmenu] = useState(false);
     const [audioTracks, setAudioTracks] = useState([]);
@@ -266,6 +267,75 @@ const PlayerControls = ({
         }
     }, [currentPath, currentName]);
 
+    useEffect(() => {
+        // Прев'ю для шкали перемотування: аркуш кадрів і WebVTT-індекс з сервера
+        trickplayCues.current = [];
+        if (!currentPath || !currentName) return;
+
+        let cancelled = false;
+        fetchTrickplay(`${currentPath}\\${currentName}`, () => cancelled)
+            .then(cues => {
+                if (!cancelled) trickplayCues.current = cues;
+            });
+        return () => {
+            cancelled = true;
+        };
+    }, [currentPath, currentName]);
+
+    useEffect(() => {
+        if (!playerInstance.current) return;
+
+        const progressControl = playerInstance.current.controlBar.getChild('progressControl');
+        if (!progressControl) return;
+        const progressEl = progressControl.el();
+
+        const preview = document.createElement('div');
+        preview.className = 'vjs-trickplay-preview';
+        preview.style.position = 'absolute';
+        preview.style.bottom = '100%';
+        preview.style.marginBottom = '24px';
+        preview.style.display = 'none';
+        preview.style.pointerEvents = 'none';
+        preview.style.border = '1px solid rgba(255, 255, 255, 0.8)';
+        preview.style.backgroundRepeat = 'no-repeat';
+        progressEl.appendChild(preview);
+
+        const handleMouseMove = (event) => {
+            const duration = playerInstance.current && playerInstance.current.duration();
+            const holder = progressEl.querySelector('.vjs-progress-holder');
+            if (!duration || !holder || trickplayCues.current.length === 0) return;
+
+            const rect = holder.getBoundingClientRect();
+            const fraction = Math.min(Math.max((event.clientX - rect.left) / rect.width, 0), 1);
+            const time = fraction * duration;
+            const cue = trickplayCues.current.find(item => time >= item.start && time < item.end)
+                || trickplayCues.current[trickplayCues.current.length - 1];
+
+            // Кадр - клітинка аркуша; скролінг шкали не завантажує жодного байта відео
+            preview.style.width = `${cue.w}px`;
+            preview.style.height = `${cue.h}px`;
+            preview.style.backgroundImage = `url("${cue.url}")`;
+            preview.style.backgroundPosition = `-${cue.x}px -${cue.y}px`;
+            const holderOffset = rect.left - progressEl.getBoundingClientRect().left;
+            const left = Math.min(Math.max(holderOffset + fraction * rect.width - cue.w / 2, 0), progressEl.clientWidth - cue.w);
+            preview.style.left = `${left}px`;
+            preview.style.display = 'block';
+        };
+
+        const handleMouseLeave = () => {
+            preview.style.display = 'none';
+        };
+
+        progressEl.addEventListener('mousemove', handleMouseMove);
+        progressEl.addEventListener('mouseleave', handleMouseLeave);
+
+        return () => {
+            progressEl.removeEventListener('mousemove', handleMouseMove);
+            progressEl.removeEventListener('mouseleave', handleMouseLeave);
+            preview.remove();
+        };
+    }, []);
+
     useEffect(() => {
         if (playerInstance.current) {
             const handleTimeUpdate = () => {